@@ -7,6 +7,15 @@ from app.models.trade import Trade
 from app.models.pending_order import PendingOrder
 from app.models.portfolio_snapshot import PortfolioSnapshot
 from app.models.watchlist_item import WatchlistItem
+from app.models.idempotency_key import IdempotencyKey
+from app.models.job import Job
+from app.models.tax_lot import TaxLot
+from app.models.realized_pnl import RealizedPnl
+from app.models.portfolio_value_rollup import PortfolioValueRollup
+from app.models.portfolio_analytics_state import PortfolioAnalyticsState
+from app.models.leaderboard_entry import LeaderboardEntry
+from app.models.risk_result import RiskResult
+from app.models.ewma_covariance_state import EwmaCovarianceState
 
 import os
 from dotenv import load_dotenv
@@ -0,0 +1,39 @@
+"""Rank leaderboard on read
+
+Revision ID: 1a2c4f21b958
+Revises: c6ad45432809
+Create Date: 2026-10-19 19:12:36.514207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1a2c4f21b958'
+down_revision: Union[str, None] = 'c6ad45432809'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Ranks are counted on read from the value/return indexes instead of being stored
+    op.create_index('ix_leaderboard_entries_portfolio_value', 'leaderboard_entries', ['portfolio_value'], unique=False)
+    op.create_index('ix_leaderboard_entries_total_return', 'leaderboard_entries', ['total_return'], unique=False)
+    op.drop_index('ix_leaderboard_entries_return_rank', table_name='leaderboard_entries')
+    op.drop_index('ix_leaderboard_entries_value_rank', table_name='leaderboard_entries')
+    op.drop_column('leaderboard_entries', 'return_rank')
+    op.drop_column('leaderboard_entries', 'value_rank')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('leaderboard_entries', sa.Column('value_rank', sa.Integer(), nullable=True))
+    op.add_column('leaderboard_entries', sa.Column('return_rank', sa.Integer(), nullable=True))
+    op.create_index('ix_leaderboard_entries_value_rank', 'leaderboard_entries', ['value_rank'], unique=False)
+    op.create_index('ix_leaderboard_entries_return_rank', 'leaderboard_entries', ['return_rank'], unique=False)
+    op.drop_index('ix_leaderboard_entries_total_return', table_name='leaderboard_entries')
+    op.drop_index('ix_leaderboard_entries_portfolio_value', table_name='leaderboard_entries')
@@ -0,0 +1,57 @@
+"""Add portfolio analytics state table
+
+Revision ID: 4c8b29eb7bf9
+Revises: 7e0a3d598cc1
+Create Date: 2026-10-19 15:06:41.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c8b29eb7bf9'
+down_revision: Union[str, None] = '7e0a3d598cc1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rows are built lazily from existing snapshots (by the next snapshot job or first analytics request)
+    op.create_table('portfolio_analytics_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('point_count', sa.Integer(), nullable=False),
+    sa.Column('first_date', sa.Date(), nullable=False),
+    sa.Column('prev_value', sa.Float(), nullable=True),
+    sa.Column('prev_benchmark_price', sa.Float(), nullable=True),
+    sa.Column('last_date', sa.Date(), nullable=False),
+    sa.Column('last_value', sa.Float(), nullable=False),
+    sa.Column('last_benchmark_price', sa.Float(), nullable=True),
+    sa.Column('return_count', sa.Integer(), nullable=False),
+    sa.Column('sum_return', sa.Float(), nullable=False),
+    sa.Column('sum_sq_return', sa.Float(), nullable=False),
+    sa.Column('sum_log_return', sa.Float(), nullable=False),
+    sa.Column('paired_count', sa.Integer(), nullable=False),
+    sa.Column('sum_paired_return', sa.Float(), nullable=False),
+    sa.Column('sum_benchmark_return', sa.Float(), nullable=False),
+    sa.Column('sum_sq_benchmark_return', sa.Float(), nullable=False),
+    sa.Column('sum_cross_return', sa.Float(), nullable=False),
+    sa.Column('peak_value', sa.Float(), nullable=False),
+    sa.Column('max_drawdown', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_portfolio_analytics_state_id'), 'portfolio_analytics_state', ['id'], unique=False)
+    op.create_index(op.f('ix_portfolio_analytics_state_user_id'), 'portfolio_analytics_state', ['user_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_portfolio_analytics_state_user_id'), table_name='portfolio_analytics_state')
+    op.drop_index(op.f('ix_portfolio_analytics_state_id'), table_name='portfolio_analytics_state')
+    op.drop_table('portfolio_analytics_state')
@@ -0,0 +1,53 @@
+"""Add leaderboard entries table
+
+Revision ID: 5a1206015e81
+Revises: 4c8b29eb7bf9
+Create Date: 2026-10-19 15:41:07.392518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a1206015e81'
+down_revision: Union[str, None] = '4c8b29eb7bf9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('leaderboard_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('portfolio_value', sa.Numeric(precision=15, scale=4), nullable=True),
+    sa.Column('total_return', sa.Float(), nullable=True),
+    sa.Column('value_rank', sa.Integer(), nullable=True),
+    sa.Column('return_rank', sa.Integer(), nullable=True),
+    sa.Column('is_dirty', sa.Boolean(), nullable=False),
+    sa.Column('valued_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_leaderboard_entries_id'), 'leaderboard_entries', ['id'], unique=False)
+    op.create_index(op.f('ix_leaderboard_entries_user_id'), 'leaderboard_entries', ['user_id'], unique=True)
+    op.create_index('ix_leaderboard_entries_value_rank', 'leaderboard_entries', ['value_rank'], unique=False)
+    op.create_index('ix_leaderboard_entries_return_rank', 'leaderboard_entries', ['return_rank'], unique=False)
+    op.create_index('ix_leaderboard_entries_dirty', 'leaderboard_entries', ['user_id'], unique=False,
+                    postgresql_where=sa.text('is_dirty'))
+
+    # Every existing account starts dirty, so the first leaderboard refresh values and ranks it
+    op.execute("INSERT INTO leaderboard_entries (user_id, is_dirty) SELECT user_id, true FROM accounts")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_leaderboard_entries_dirty', table_name='leaderboard_entries')
+    op.drop_index('ix_leaderboard_entries_return_rank', table_name='leaderboard_entries')
+    op.drop_index('ix_leaderboard_entries_value_rank', table_name='leaderboard_entries')
+    op.drop_index(op.f('ix_leaderboard_entries_user_id'), table_name='leaderboard_entries')
+    op.drop_index(op.f('ix_leaderboard_entries_id'), table_name='leaderboard_entries')
+    op.drop_table('leaderboard_entries')
@@ -0,0 +1,69 @@
+"""Add tax lots and realized P&L ledger
+
+Revision ID: 5b4d09d9b34d
+Revises: 9715b0772449
+Create Date: 2026-10-19 12:47:08.915372
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b4d09d9b34d'
+down_revision: Union[str, None] = '9715b0772449'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('tax_lots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('symbol', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('open_quantity', sa.Integer(), nullable=False),
+    sa.Column('cost_basis', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('opened_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tax_lots_id'), 'tax_lots', ['id'], unique=False)
+    op.create_index('ix_tax_lots_user_id', 'tax_lots', ['user_id'], unique=False)
+    op.create_index('ix_tax_lots_open', 'tax_lots', ['user_id', 'symbol', 'id'], unique=False,
+                    postgresql_where=sa.text('open_quantity > 0'))
+    op.create_table('realized_pnl',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('symbol', sa.String(), nullable=False),
+    sa.Column('realized_pnl', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('quantity_closed', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'symbol', name='_user_symbol_realized_pnl_uc')
+    )
+    op.create_index(op.f('ix_realized_pnl_id'), 'realized_pnl', ['id'], unique=False)
+    op.create_index(op.f('ix_realized_pnl_user_id'), 'realized_pnl', ['user_id'], unique=False)
+    op.add_column('accounts', sa.Column('realized_pnl', sa.Numeric(precision=18, scale=4), server_default='0', nullable=False))
+
+    # Existing holdings only know their average cost; open one lot per holding at that cost
+    op.execute(
+        "INSERT INTO tax_lots (user_id, symbol, quantity, open_quantity, cost_basis) "
+        "SELECT user_id, symbol, quantity, quantity, average_cost_basis FROM holdings WHERE quantity > 0"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('accounts', 'realized_pnl')
+    op.drop_index(op.f('ix_realized_pnl_user_id'), table_name='realized_pnl')
+    op.drop_index(op.f('ix_realized_pnl_id'), table_name='realized_pnl')
+    op.drop_table('realized_pnl')
+    op.drop_index('ix_tax_lots_open', table_name='tax_lots')
+    op.drop_index('ix_tax_lots_user_id', table_name='tax_lots')
+    op.drop_index(op.f('ix_tax_lots_id'), table_name='tax_lots')
+    op.drop_table('tax_lots')
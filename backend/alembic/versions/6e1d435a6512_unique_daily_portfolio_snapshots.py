@@ -0,0 +1,37 @@
+"""Make portfolio snapshots unique per user and day
+
+Revision ID: 6e1d435a6512
+Revises: 5b4d09d9b34d
+Create Date: 2026-10-19 13:26:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e1d435a6512'
+down_revision: Union[str, None] = '5b4d09d9b34d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('portfolio_snapshots', sa.Column('snapshot_date', sa.Date(), nullable=True))
+    op.execute("""UPDATE portfolio_snapshots SET snapshot_date = ("timestamp" AT TIME ZONE 'UTC')::date""")
+    # Same-day reruns used to insert duplicates; keep the latest row of each day
+    op.execute(
+        "DELETE FROM portfolio_snapshots WHERE id NOT IN ("
+        "SELECT MAX(id) FROM portfolio_snapshots GROUP BY user_id, snapshot_date)"
+    )
+    op.alter_column('portfolio_snapshots', 'snapshot_date', nullable=False)
+    op.create_unique_constraint('_user_snapshot_date_uc', 'portfolio_snapshots', ['user_id', 'snapshot_date'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('_user_snapshot_date_uc', 'portfolio_snapshots', type_='unique')
+    op.drop_column('portfolio_snapshots', 'snapshot_date')
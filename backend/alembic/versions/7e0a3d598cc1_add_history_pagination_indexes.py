@@ -0,0 +1,32 @@
+"""Add composite indexes for trade and snapshot history pagination
+
+Revision ID: 7e0a3d598cc1
+Revises: 87c340162c7b
+Create Date: 2026-10-19 14:38:52.664013
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e0a3d598cc1'
+down_revision: Union[str, None] = '87c340162c7b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_trades_user_id_timestamp_id', 'trades',
+                    ['user_id', sa.text('timestamp DESC'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_portfolio_snapshots_user_id_timestamp', 'portfolio_snapshots',
+                    ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_portfolio_snapshots_user_id_timestamp', table_name='portfolio_snapshots')
+    op.drop_index('ix_trades_user_id_timestamp_id', table_name='trades')
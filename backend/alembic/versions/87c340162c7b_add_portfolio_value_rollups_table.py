@@ -0,0 +1,55 @@
+"""Add portfolio value rollups table
+
+Revision ID: 87c340162c7b
+Revises: 6e1d435a6512
+Create Date: 2026-10-19 14:02:13.557490
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '87c340162c7b'
+down_revision: Union[str, None] = '6e1d435a6512'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('portfolio_value_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.Enum('DAY', 'WEEK', 'MONTH', name='valuehistorybucket'), nullable=False),
+    sa.Column('bucket_start', sa.Date(), nullable=False),
+    sa.Column('close_value', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('close_timestamp', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('snapshot_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'bucket', 'bucket_start', name='_user_bucket_start_uc')
+    )
+    op.create_index(op.f('ix_portfolio_value_rollups_id'), 'portfolio_value_rollups', ['id'], unique=False)
+
+    # Backfill from existing daily snapshots: the last snapshot of each ISO week / month closes it
+    for bucket, trunc in (('WEEK', 'week'), ('MONTH', 'month')):
+        op.execute(f"""
+            INSERT INTO portfolio_value_rollups (user_id, bucket, bucket_start, close_value, close_timestamp, snapshot_count)
+            SELECT user_id, '{bucket}', bucket_start, total_value, "timestamp", snapshot_count FROM (
+                SELECT user_id, total_value, "timestamp",
+                       date_trunc('{trunc}', snapshot_date)::date AS bucket_start,
+                       COUNT(*) OVER (PARTITION BY user_id, date_trunc('{trunc}', snapshot_date)) AS snapshot_count,
+                       ROW_NUMBER() OVER (PARTITION BY user_id, date_trunc('{trunc}', snapshot_date) ORDER BY snapshot_date DESC) AS rn
+                FROM portfolio_snapshots
+            ) ranked WHERE rn = 1
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_portfolio_value_rollups_id'), table_name='portfolio_value_rollups')
+    op.drop_table('portfolio_value_rollups')
+    sa.Enum(name='valuehistorybucket').drop(op.get_bind(), checkfirst=True)
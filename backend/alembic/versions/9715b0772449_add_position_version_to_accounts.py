@@ -0,0 +1,28 @@
+"""Add position_version to accounts
+
+Revision ID: 9715b0772449
+Revises: fe8cff468f75
+Create Date: 2026-10-19 12:14:51.203318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9715b0772449'
+down_revision: Union[str, None] = 'fe8cff468f75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('accounts', sa.Column('position_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('accounts', 'position_version')
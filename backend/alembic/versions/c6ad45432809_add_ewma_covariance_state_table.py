@@ -0,0 +1,40 @@
+"""Add EWMA covariance state table
+
+Revision ID: c6ad45432809
+Revises: d356b018609f
+Create Date: 2026-10-19 18:04:51.327641
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6ad45432809'
+down_revision: Union[str, None] = 'd356b018609f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ewma_covariance_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('decay', sa.Float(), nullable=False),
+    sa.Column('symbols', sa.Text(), nullable=False),
+    sa.Column('covariance', sa.LargeBinary(), nullable=False),
+    sa.Column('last_bar_date', sa.Date(), nullable=True),
+    sa.Column('observations', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('decay')
+    )
+    op.create_index(op.f('ix_ewma_covariance_state_id'), 'ewma_covariance_state', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ewma_covariance_state_id'), table_name='ewma_covariance_state')
+    op.drop_table('ewma_covariance_state')
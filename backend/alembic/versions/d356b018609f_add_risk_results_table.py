@@ -0,0 +1,44 @@
+"""Add risk results table
+
+Revision ID: d356b018609f
+Revises: 5a1206015e81
+Create Date: 2026-10-19 16:22:35.814206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd356b018609f'
+down_revision: Union[str, None] = '5a1206015e81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('risk_results',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('method', sa.String(length=20), nullable=False),
+    sa.Column('confidence_level', sa.Numeric(precision=5, scale=4), nullable=False),
+    sa.Column('lookback_days', sa.Integer(), nullable=False),
+    sa.Column('var_amount', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('expected_shortfall', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('portfolio_value', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('position_version', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'method', 'confidence_level', 'lookback_days', name='_user_risk_params_uc')
+    )
+    op.create_index(op.f('ix_risk_results_id'), 'risk_results', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_risk_results_id'), table_name='risk_results')
+    op.drop_table('risk_results')
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.schemas.backtest import BacktestRequest, BacktestResponse
+from app.services import backtest_service
+from app.core.security import get_current_active_user
+from app.models.user import User as UserModel
+
+router = APIRouter()
+
+@router.post(
+    "",
+    response_model=BacktestResponse,
+    summary="Replay a stream of orders over historical daily bars"
+)
+def run_backtest(
+    request: BacktestRequest,
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Simulates the given orders against daily closes for `symbols` over `lookback_days`,
+    using the same fill rules as live trading. Nothing is written to the database.
+    Requires authentication.
+    """
+    result = backtest_service.backtest_symbols(
+        symbols=request.symbols,
+        lookback_days=request.lookback_days,
+        orders=request.orders,
+        initial_cash=float(request.initial_cash)
+    )
+    if not result.symbols:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No historical data available for the requested symbols."
+        )
+
+    initial_cash = float(request.initial_cash)
+    final_value = float(result.equity[-1])
+    return BacktestResponse(
+        symbols=result.symbols,
+        timestamps=[ts.to_pydatetime() for ts in result.timestamps],
+        cash=result.cash.tolist(),
+        holdings={symbol: result.positions[:, i].tolist() for i, symbol in enumerate(result.symbols)},
+        equity=result.equity.tolist(),
+        final_value=final_value,
+        total_return=final_value / initial_cash - 1.0,
+        trades=result.trades,
+        rejected_orders=result.rejected_orders,
+        open_limit_orders=result.open_limit_orders
+    )
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.core.security import get_current_active_user
+from app.models.user import User as UserModel
+from app.models.job import Job
+from app.models.enums import AnalyticsJobType, JobStatus
+from app.schemas.job import AnalyticsJobCreate, AnalyticsJobResponse, VarJobParams
+from app.services import job_queue_service
+
+router = APIRouter()
+
+POLL_AFTER_SECONDS = "1" # Retry-After hint while a job is still queued or running
+
+def _job_response(db_job: Job, response: Response) -> AnalyticsJobResponse:
+    if db_job.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+        response.headers["Retry-After"] = POLL_AFTER_SECONDS
+    return AnalyticsJobResponse(
+        id=db_job.id,
+        type=db_job.job_type,
+        status=db_job.status,
+        created_at=db_job.created_at,
+        finished_at=db_job.finished_at,
+        result=db_job.result if db_job.status == JobStatus.SUCCEEDED else None,
+        error=db_job.last_error if db_job.status == JobStatus.FAILED else None
+    )
+
+@router.post("", response_model=AnalyticsJobResponse, status_code=status.HTTP_202_ACCEPTED) # Route is /api/v1/jobs
+def create_job(
+    job_in: AnalyticsJobCreate,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Start an expensive analytics request (`risk_var`, `stress_test`) in the background and poll
+    GET /jobs/{id} for the result. Identical requests that are in flight or finished recently
+    return the existing job.
+    """
+    params = {}
+    if job_in.type == AnalyticsJobType.RISK_VAR:
+        try:
+            params = VarJobParams(**job_in.params).model_dump(mode="json")
+        except ValidationError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors(include_url=False))
+    db_job = job_queue_service.submit_analytics_job(db=db, user=current_user, job_type=job_in.type.value, params=params)
+    return _job_response(db_job, response)
+
+@router.get("/{job_id}", response_model=AnalyticsJobResponse) # Route is /api/v1/jobs/{job_id}
+def get_job(
+    job_id: int,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Status of one of the user's analytics jobs, with its result once it has succeeded."""
+    db_job = job_queue_service.get_analytics_job(db=db, user=current_user, job_id=job_id)
+    if db_job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return _job_response(db_job, response)
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.core.security import get_current_active_user
+from app.models.user import User as UserModel
+from app.models.enums import LeaderboardMetric
+from app.schemas.leaderboard import LeaderboardResponse
+from app.services import leaderboard_service
+
+router = APIRouter()
+
+@router.get("", response_model=LeaderboardResponse) # Route is /api/v1/leaderboard
+def get_leaderboard(
+    by: LeaderboardMetric = Query(LeaderboardMetric.VALUE, description="Rank by total portfolio value or total return"),
+    limit: int = Query(10, gt=0, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Get the top users by portfolio value or return, and the caller's own rank.
+    Ranks are counted on read from stored valuations, which the snapshot job and the
+    leaderboard refresh keep current after trades.
+    Requires authentication.
+    """
+    return leaderboard_service.get_leaderboard(db=db, user=current_user, metric=by, limit=limit, offset=offset)
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -6,11 +7,23 @@ from app.db.session import get_db
 from app.schemas.portfolio import Portfolio as PortfolioSchema
 from app.schemas.trade import Trade as TradeSchema
 from app.schemas.portfolio_snapshot import PortfolioSnapshotResponse
-from app.services import portfolio_service, risk_service
+from app.schemas.pnl import PnlSummary
+from app.schemas.analytics import PortfolioAnalytics
+from app.schemas.stress_test import StressTestResponse, StressTestBatchResponse
+from app.schemas.correlation import CorrelationMatrixResponse
+from app.schemas.job import VarJobParams
+from app.schemas.what_if import WhatIfRequest, WhatIfResponse
+from app.services import portfolio_service, risk_service, analytics_service, stress_test_service, covariance_service, what_if_service
 from app.services import daily_snapshot_service
-from app.crud import crud_trade, crud_portfolio_snapshot
+from app.crud import crud_trade
 from app.core.security import get_current_active_user
-from app.core.config import SNAPSHOT_TRIGGER_KEY
+from app.core.config import SNAPSHOT_TRIGGER_KEY, JOB_EXECUTION_MODE, MONTE_CARLO_DEFAULT_PATHS, MONTE_CARLO_MAX_PATHS, ASYNC_VAR_THRESHOLD_SECONDS
+from app.services import job_queue_service, value_history_service, export_service
+from app.services.export_service import ExportFormat
+from app.models.enums import ValueHistoryBucket, VarMethod, AnalyticsJobType
+from app.core.monte_carlo import MonteCarloDistribution
+from app.core.columnar import ResponseFormat, columns_from_rows, columnar_response
+from app.core.pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
 from app.models.user import User as UserModel
 import decimal
 import logging
@@ -30,39 +43,154 @@ def get_user_portfolio(
     """
     return portfolio_service.get_portfolio(db=db, user=current_user)
 
+@router.get("/pnl", response_model=PnlSummary) # Route is /api/v1/portfolio/pnl
+def get_user_pnl(
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Get realized (per tax-lot method) and unrealized P&L, in total and per symbol.
+    Requires authentication.
+    """
+    return portfolio_service.get_pnl_summary(db=db, user=current_user)
+
+@router.get("/analytics", response_model=PortfolioAnalytics) # Route is /api/v1/portfolio/analytics
+def get_portfolio_analytics(
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Get time-weighted return, annualized volatility, Sharpe ratio, max drawdown and beta
+    over the user's daily snapshot history. Requires authentication.
+    """
+    return analytics_service.get_analytics(db=db, user=current_user)
+
 @router.get("/trades", response_model=List[TradeSchema]) # Route is /api/v1/portfolio/trades
 def get_user_trades(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    skip: int = Query(0, ge=0, description="Offset paging (kept for compatibility); prefer `after`"),
+    limit: int = Query(100, gt=0, le=1000),
+    after: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
+    symbol: Optional[str] = Query(None, description="Only trades in this symbol"),
+    start_date: Optional[datetime] = Query(None, description="Only trades at or after this time (ISO format)"),
+    end_date: Optional[datetime] = Query(None, description="Only trades at or before this time (ISO format)"),
+    format: ResponseFormat = Query(ResponseFormat.ROWS, description="'columnar' returns one array per field: id, t (epoch ms), symbol, side, quantity, price"),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """
-    Get the current user's trade history. Requires authentication.
+    Get the current user's trade history, newest first. Requires authentication.
+    When more trades exist, the X-Next-Cursor response header holds the `after` value for the next page.
+    `skip` and `after` cannot be combined.
     """
-    trades = crud_trade.get_trades_for_user(db=db, user_id=current_user.id, skip=skip, limit=limit)
+    if skip and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either `skip` or `after`, not both.")
+    try:
+        after_key = decode_cursor(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if after_key is not None and after_key[1] is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+    filters = dict(after=after_key, symbol=symbol, start_date=start_date, end_date=end_date)
+
+    if format == ResponseFormat.COLUMNAR:
+        rows = crud_trade.get_trade_rows_for_user(db=db, user_id=current_user.id, skip=skip, limit=limit, **filters)
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id) if len(rows) == limit else None
+        return columnar_response(columns_from_rows(
+            rows, {"id": 0, "t": 1, "symbol": 2, "side": 3, "quantity": 4, "price": 5},
+            timestamp_fields=("t",), float_fields=("price",)
+        ), headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
+
+    trades = crud_trade.get_trades_for_user(db=db, user_id=current_user.id, skip=skip, limit=limit, **filters)
+    if len(trades) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(trades[-1].timestamp, trades[-1].id)
     return trades
 
+@router.get("/trades/export", summary="Stream the user's full trade history as CSV or NDJSON")
+def export_user_trades(
+    format: ExportFormat = Query(ExportFormat.CSV),
+    symbol: Optional[str] = Query(None, description="Only trades in this symbol"),
+    start_date: Optional[datetime] = Query(None, description="Only trades at or after this time (ISO format)"),
+    end_date: Optional[datetime] = Query(None, description="Only trades at or before this time (ISO format)"),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Streams every matching trade, oldest first, without buffering the history in memory.
+    Requires authentication.
+    """
+    return StreamingResponse(
+        export_service.stream_trades(current_user.id, format, symbol=symbol, start_date=start_date, end_date=end_date),
+        media_type=export_service.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="trades.{format.value}"'}
+    )
+
 @router.get("/risk/var", response_model=Dict[str, Any]) # Route is /api/v1/portfolio/risk/var
 def get_portfolio_var(
+    response: Response,
     confidence_level: float = Query(0.95, gt=0, lt=1),
     lookback_days: int = Query(126, gt=10),
+    method: VarMethod = Query(VarMethod.HISTORICAL, description="historical, parametric (variance-covariance) or monte_carlo"),
+    simulations: int = Query(MONTE_CARLO_DEFAULT_PATHS, ge=1000, le=MONTE_CARLO_MAX_PATHS, description="Monte Carlo paths"),
+    distribution: MonteCarloDistribution = Query(MonteCarloDistribution.NORMAL, description="Monte Carlo return distribution"),
+    contributions: bool = Query(False, description="Include per-symbol marginal and component VaR / expected shortfall"),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """
-    Calculate the Value at Risk (VaR) for the user's current portfolio
-    using the Historical Simulation method.
+    Calculate the one-day Value at Risk (VaR) and expected shortfall for the user's current portfolio.
+    Standard historical parameters are served from the nightly risk batch (`source: precomputed`)
+    until the user trades; repeated requests for unchanged holdings and prices are served from
+    memory (`source: cached`). `as_of` says when figures were computed.
 
     - confidence_level: Confidence level for VaR (e.g., 0.95 for 95%).
     - lookback_days: Number of trading days of historical data to use.
+    - method: Historical Simulation, parametric (variance-covariance) or Monte Carlo. The latter two
+      use the EWMA covariance (`covariance: ewma`) when every symbol has an estimate.
+    - simulations / distribution: Monte Carlo paths and normal or Student-t draws.
+    - contributions: Adds each symbol's marginal VaR/ES (per $1 of position) and component VaR/ES,
+      which sum to the portfolio figures. Always calculated on demand.
+
+    Requests estimated to take longer than ASYNC_VAR_THRESHOLD_SECONDS (uncached history, large
+    Monte Carlo runs) answer 202 with a `risk_var` job to poll at `status_url` instead.
     """
-    var_result = risk_service.calculate_historical_var(
+    var_result = risk_service.get_stored_var(
         db=db,
         user=current_user,
         confidence_level=confidence_level,
-        lookback_days=lookback_days
+        lookback_days=lookback_days,
+        method=method,
+        contributions=contributions
     )
+    if var_result is None:
+        estimated_seconds = risk_service.estimate_var_seconds(
+            db=db, user=current_user, lookback_days=lookback_days, method=method, simulations=simulations
+        )
+        if estimated_seconds > ASYNC_VAR_THRESHOLD_SECONDS:
+            params = VarJobParams(
+                confidence_level=confidence_level, lookback_days=lookback_days, method=method,
+                simulations=simulations, distribution=distribution, contributions=contributions
+            ).model_dump(mode="json")
+            db_job = job_queue_service.submit_analytics_job(db=db, user=current_user, job_type=AnalyticsJobType.RISK_VAR.value, params=params)
+            response.status_code = status.HTTP_202_ACCEPTED
+            response.headers["Retry-After"] = "1"
+            return {
+                "job_id": db_job.id,
+                "status": db_job.status.value,
+                "status_url": f"/api/v1/jobs/{db_job.id}",
+                "message": f"VaR calculation estimated at {estimated_seconds:.1f}s is running in the background."
+            }
+
+        var_result = risk_service.get_var(
+            db=db,
+            user=current_user,
+            confidence_level=confidence_level,
+            lookback_days=lookback_days,
+            method=method,
+            simulations=simulations,
+            distribution=distribution,
+            contributions=contributions,
+            check_stored=False # Looked up above
+        )
 
     if var_result is None:
         raise HTTPException(
@@ -72,36 +200,138 @@ def get_portfolio_var(
 
     if isinstance(var_result.get("var_amount"), decimal.Decimal):
          var_result["var_amount"] = float(var_result["var_amount"])
+    if isinstance(var_result.get("expected_shortfall"), decimal.Decimal):
+         var_result["expected_shortfall"] = float(var_result["expected_shortfall"])
     if isinstance(var_result.get("portfolio_value"), decimal.Decimal):
          var_result["portfolio_value"] = float(var_result["portfolio_value"])
 
     return var_result
 
+@router.post("/what-if", response_model=WhatIfResponse) # Route is /api/v1/portfolio/what-if
+def simulate_what_if(
+    request: WhatIfRequest,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Value, allocation and one-day historical VaR / expected shortfall of the portfolio before and
+    after a basket of hypothetical orders (same fields as POST /trading/orders). Orders apply in
+    sequence; market orders fill at the current price and limit orders at their limit price.
+    Nothing is placed or saved.
+    """
+    try:
+        return what_if_service.simulate(db=db, user=current_user, request=request)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/risk/correlation", response_model=CorrelationMatrixResponse) # Route is /api/v1/portfolio/risk/correlation
+def get_portfolio_correlation(
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    EWMA daily volatilities and correlation matrix of the user's held symbols (decay `EWMA_DECAY`),
+    served from the incrementally maintained covariance state.
+    """
+    return covariance_service.get_correlation(db=db, user=current_user)
+
+@router.get("/risk/stress", response_model=StressTestResponse) # Route is /api/v1/portfolio/risk/stress
+def get_portfolio_stress_test(
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    P&L of the user's current holdings under each stress scenario: historical windows (2008,
+    Q4 2018, March 2020, 2022) and hypothetical shocks (market, sector ETFs, rates) applied
+    through each symbol's beta. Scenario returns are precomputed once a day for all held symbols.
+    """
+    return stress_test_service.run_stress_test(db=db, user=current_user)
+
+@router.get(
+    "/risk/stress/all",
+    response_model=StressTestBatchResponse,
+    summary="Stress test every user's portfolio in one batch (for scheduled reporting)",
+    tags=["Portfolio", "Admin"]
+)
+def get_all_stress_tests(
+    x_trigger_key: str = Header(None, description="A secret key to authorize this endpoint call"),
+    db: Session = Depends(get_db)
+):
+    """
+    Scenario P&L for every user with holdings, one row per user. Requires the same trigger key as
+    the snapshot endpoint since it covers all users.
+    """
+    if not SNAPSHOT_TRIGGER_KEY or x_trigger_key != SNAPSHOT_TRIGGER_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing trigger key."
+        )
+    return stress_test_service.run_stress_tests_for_all_users(db=db)
+
 @router.get(
     "/value-history",
     response_model=List[PortfolioSnapshotResponse],
     summary="Get user's historical portfolio values"
 )
 def get_portfolio_value_history(
+    response: Response,
     start_date: Optional[datetime] = Query(None, description="Filter from this date (ISO format, e.g., YYYY-MM-DDTHH:MM:SSZ or YYYY-MM-DD)"),
     end_date: Optional[datetime] = Query(None, description="Filter up to this date (ISO format)"),
     limit: Optional[int] = Query(1000, description="Maximum number of data points to return", gt=0), # Default limit, must be > 0
+    bucket: Optional[ValueHistoryBucket] = Query(None, description="Aggregate to one closing value per day, week or month"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample to at most this many points (LTTB), preserving the chart's shape"),
+    format: ResponseFormat = Query(ResponseFormat.ROWS, description="'columnar' returns {\"t\": [epoch ms], \"v\": [values]}"),
+    after: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """
     Retrieves a list of historical total portfolio values for the logged-in user,
     ordered by time. Useful for plotting portfolio performance.
+    Weekly and monthly buckets are served from rollups kept up to date by the snapshot job.
+    When `limit` cuts the history short, the X-Next-Cursor response header continues it.
     """
-    snapshots = crud_portfolio_snapshot.get_portfolio_snapshots_for_user(
+    try:
+        after_timestamp = decode_cursor(after)[0] if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    rows, next_after = value_history_service.get_value_history_rows(
         db=db,
         user_id=current_user.id,
+        bucket=bucket,
         start_date=start_date,
         end_date=end_date,
-        limit=limit
+        limit=limit,
+        max_points=max_points,
+        after=after_timestamp
+    )
+    next_cursor = encode_cursor(next_after) if next_after else None
+    if format == ResponseFormat.COLUMNAR:
+        return columnar_response(
+            columns_from_rows(rows, {"t": 0, "v": 1}, timestamp_fields=("t",), float_fields=("v",)),
+            headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [{"timestamp": timestamp, "total_value": total_value} for timestamp, total_value in rows]
+
+@router.get("/value-history/export", summary="Stream the user's daily portfolio values as CSV or NDJSON")
+def export_portfolio_value_history(
+    format: ExportFormat = Query(ExportFormat.CSV),
+    start_date: Optional[datetime] = Query(None, description="Filter from this date (ISO format)"),
+    end_date: Optional[datetime] = Query(None, description="Filter up to this date (ISO format)"),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Streams every daily snapshot in range, oldest first, without buffering them in memory.
+    Requires authentication.
+    """
+    return StreamingResponse(
+        export_service.stream_value_history(current_user.id, format, start_date=start_date, end_date=end_date),
+        media_type=export_service.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="value_history.{format.value}"'}
     )
-    # Pydantic will automatically convert the list of ORM objects to list of PortfolioSnapshotResponse
-    return snapshots
 
 @router.post(
     "/snapshots/trigger-daily",
@@ -128,6 +358,12 @@ def trigger_daily_snapshots_endpoint(
         )
 
     try:
+        if JOB_EXECUTION_MODE == "queue":
+            db_job = job_queue_service.enqueue(
+                db, job_queue_service.DAILY_SNAPSHOTS_JOB,
+                dedupe_key=job_queue_service.DAILY_SNAPSHOTS_JOB
+            )
+            return {"message": "Daily snapshot generation queued.", "details": {"job_id": db_job.id}}
         result = daily_snapshot_service.generate_daily_snapshots_for_relevant_users(db=db)
         return {"message": "Daily snapshot generation triggered successfully.", "details": result}
     except Exception as e:
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Header
 from sqlalchemy.orm import Session
-from typing import List, Union
+from typing import List, Union, Optional
 from app.db.session import get_db
 from app.schemas.order import OrderCreate
 from app.schemas.trade import Trade as TradeSchema
@@ -10,6 +10,8 @@ from app.core.security import get_current_active_user
 from app.models.user import User as UserModel
 from app.crud import crud_pending_order
 from app.services.trading_service import _check_and_execute_logic
+from app.services import job_queue_service
+from app.core.config import JOB_EXECUTION_MODE
 
 router = APIRouter()
 
@@ -21,6 +23,12 @@ router = APIRouter()
 )
 def place_new_order(
     order: OrderCreate,
+    idempotency_key: Optional[str] = Header(
+        None,
+        min_length=1,
+        max_length=255,
+        description="Client-generated key. Retrying with the same key returns the original result instead of placing the order again."
+    ),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
@@ -28,10 +36,11 @@ def place_new_order(
     Place a new order.
     - For **Market Orders**, set `order_type` to `MARKET_BUY` or `MARKET_SELL` and omit `limit_price`. Executes immediately.
     - For **Limit Orders**, set `order_type` to `LIMIT_BUY` or `LIMIT_SELL` and provide a `limit_price`. Creates a pending order.
+    - Send an `Idempotency-Key` header to make retries safe: a replayed key returns the stored result.
     Requires authentication.
     """
     try:
-        result = trading_service.place_order(db=db, user=current_user, order=order)
+        result = trading_service.place_order(db=db, user=current_user, order=order, idempotency_key=idempotency_key)
         return result # Returns either the executed Trade or the placed PendingOrder
     except HTTPException as e:
         raise e
@@ -92,8 +101,15 @@ def trigger_pending_order_check(
     """
     Manually runs the process to check all pending limit orders against
     current market prices and executes them if conditions are met.
+    In queue mode the check is handed to the worker and the job ID is returned.
     """
     try:
+        if JOB_EXECUTION_MODE == "queue":
+            db_job = job_queue_service.enqueue(
+                db, job_queue_service.CHECK_PENDING_ORDERS_JOB,
+                dedupe_key=job_queue_service.CHECK_PENDING_ORDERS_JOB
+            )
+            return {"queued": True, "job_id": db_job.id}
         result = _check_and_execute_logic(db=db)
         return result
     except Exception as e:
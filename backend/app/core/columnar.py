@@ -0,0 +1,46 @@
+"""
+Columnar ("struct of arrays") responses for time series endpoints.
+
+Instead of a list of objects that repeats every key per row, a columnar payload has one
+array per field, e.g. {"t": [...], "v": [...]}. Timestamps are epoch milliseconds (UTC) and
+numeric values are floats, serialized with orjson straight from query tuples.
+"""
+import enum
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi.responses import ORJSONResponse
+
+
+class ResponseFormat(str, enum.Enum):
+    ROWS = "rows" # List of objects (default)
+    COLUMNAR = "columnar"
+
+
+def epoch_ms(value: datetime) -> int:
+    """Milliseconds since the epoch. Naive datetimes (e.g. from SQLite) are taken as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def columns_from_rows(rows: Iterable[Any], fields: Dict[str, int], timestamp_fields: Iterable[str] = (), float_fields: Iterable[str] = ()) -> Dict[str, List[Any]]:
+    """
+    Transposes row tuples into {name: [values]} using `fields` (output name -> tuple position).
+    Timestamp fields become epoch ms and float fields become floats; None stays None.
+    """
+    rows = list(rows)
+    timestamp_fields, float_fields = set(timestamp_fields), set(float_fields)
+    columns: Dict[str, List[Any]] = {}
+    for name, position in fields.items():
+        values = [row[position] for row in rows]
+        if name in timestamp_fields:
+            values = [epoch_ms(v) if v is not None else None for v in values]
+        elif name in float_fields:
+            values = [float(v) if v is not None else None for v in values]
+        columns[name] = values
+    return columns
+
+
+def columnar_response(columns: Dict[str, List[Any]], headers: Optional[Dict[str, str]] = None) -> ORJSONResponse:
+    return ORJSONResponse(content=columns, headers=headers)
@@ -13,13 +13,87 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30 # JWT token validity period
 ALPACA_API_KEY_ID = os.getenv("ALPACA_API_KEY_ID")
 ALPACA_API_SECRET_KEY = os.getenv("ALPACA_API_SECRET_KEY")
 ALPACA_PAPER_TRADING = os.getenv("ALPACA_PAPER_TRADING", "true").lower() == "true"
+# Concurrent Alpaca history requests for multi-symbol fetches (all share the global request throttle)
+MARKET_DATA_FETCH_WORKERS = int(os.getenv("MARKET_DATA_FETCH_WORKERS", "8"))
 SNAPSHOT_TRIGGER_KEY = os.getenv("SNAPSHOT_TRIGGER_KEY")
 
+# Idempotency-Key support for order placement
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24")) # How long a key can be replayed
+IDEMPOTENCY_LRU_SIZE = int(os.getenv("IDEMPOTENCY_LRU_SIZE", "10000")) # In-process fast path entries
+
+# Background jobs: "inline" runs order matching/snapshots in the API process,
+# "queue" enqueues them for the standalone worker (python -m app.worker)
+JOB_EXECUTION_MODE = os.getenv("JOB_EXECUTION_MODE", "inline").lower()
+JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300")) # Claimed jobs reappear after this
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "10")) # Backoff is base * 2^(attempt-1)
+WORKER_POLL_INTERVAL_SECONDS = float(os.getenv("WORKER_POLL_INTERVAL_SECONDS", "1.0"))
+
+# Group commit: market orders arriving within the window share one transaction (one savepoint each)
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() == "true"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_BATCH_SIZE = int(os.getenv("GROUP_COMMIT_MAX_BATCH_SIZE", "100"))
+
+# Per-user portfolio valuations kept in process, invalidated by Account.position_version
+PORTFOLIO_CACHE_SIZE = int(os.getenv("PORTFOLIO_CACHE_SIZE", "10000"))
+
+# Which tax lots a sell closes for realized P&L: FIFO, LIFO or AVG (average cost)
+TAX_LOT_METHOD = os.getenv("TAX_LOT_METHOD", "FIFO").upper()
+
+# Performance analytics: beta is measured against this symbol; Sharpe uses this annual risk-free rate
+ANALYTICS_BENCHMARK_SYMBOL = os.getenv("ANALYTICS_BENCHMARK_SYMBOL", "SPY").upper()
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.0"))
+
+# Trading days of returns kept in the shared VaR returns panel; longer lookbacks are fetched on demand
+RETURNS_PANEL_LOOKBACK_DAYS = int(os.getenv("RETURNS_PANEL_LOOKBACK_DAYS", "504"))
+
+# Nightly risk batch: VaR/ES for every user at these standard parameters, served by /portfolio/risk/var
+RISK_PRECOMPUTE_CONFIDENCE_LEVELS = [float(c) for c in os.getenv("RISK_PRECOMPUTE_CONFIDENCE_LEVELS", "0.95,0.99").split(",")]
+RISK_PRECOMPUTE_LOOKBACK_DAYS = [int(d) for d in os.getenv("RISK_PRECOMPUTE_LOOKBACK_DAYS", "126,252").split(",")]
+RISK_PRECOMPUTE_HOUR_UTC = int(os.getenv("RISK_PRECOMPUTE_HOUR_UTC", "22")) # After the 21:00 UTC end-of-day snapshot
+
+# Monte Carlo VaR: paths are simulated in chunks (bounded memory), optionally across a process pool
+MONTE_CARLO_DEFAULT_PATHS = int(os.getenv("MONTE_CARLO_DEFAULT_PATHS", "100000"))
+MONTE_CARLO_MAX_PATHS = int(os.getenv("MONTE_CARLO_MAX_PATHS", "1000000"))
+MONTE_CARLO_CHUNK_PATHS = int(os.getenv("MONTE_CARLO_CHUNK_PATHS", "20000"))
+MONTE_CARLO_WORKERS = int(os.getenv("MONTE_CARLO_WORKERS", "0")) # 0 = simulate in the request thread
+MONTE_CARLO_SEED = int(os.getenv("MONTE_CARLO_SEED", "42")) # Fixed seed: repeated requests agree
+MONTE_CARLO_T_DEGREES_OF_FREEDOM = int(os.getenv("MONTE_CARLO_T_DEGREES_OF_FREEDOM", "5"))
+
+# Memoized VaR: results keyed by holdings, prices, parameters and the returns data's last bar date;
+# aligned returns (and their covariance) kept per symbol set so quantity changes only reweight
+VAR_RESULT_CACHE_SIZE = int(os.getenv("VAR_RESULT_CACHE_SIZE", "2000"))
+VAR_RETURNS_CACHE_SIZE = int(os.getenv("VAR_RETURNS_CACHE_SIZE", "64"))
+
+# Stress tests: betas for hypothetical shocks (and for symbols without history in a historical window) use this many days
+STRESS_BETA_LOOKBACK_DAYS = int(os.getenv("STRESS_BETA_LOOKBACK_DAYS", "252"))
+
+# EWMA covariance (RiskMetrics-style) used by parametric and Monte Carlo VaR and /portfolio/risk/correlation
+EWMA_DECAY = float(os.getenv("EWMA_DECAY", "0.94"))
+
+# Async analytics jobs (POST /jobs): identical in-flight jobs, or ones that finished within the TTL, are reused.
+# Inline mode runs them on this many API-process threads; queue mode hands them to the worker.
+ANALYTICS_JOB_RESULT_TTL_SECONDS = int(os.getenv("ANALYTICS_JOB_RESULT_TTL_SECONDS", "600"))
+ANALYTICS_JOB_WORKERS = int(os.getenv("ANALYTICS_JOB_WORKERS", "2"))
+# /portfolio/risk/var answers 202 with a job when its estimated cost exceeds this
+ASYNC_VAR_THRESHOLD_SECONDS = float(os.getenv("ASYNC_VAR_THRESHOLD_SECONDS", "2.0"))
+
+# POST /portfolio/what-if: most hypothetical orders accepted in one request
+WHAT_IF_MAX_ORDERS = int(os.getenv("WHAT_IF_MAX_ORDERS", "500"))
+
+# Users who traded are revalued and the leaderboard re-ranked at most this often
+LEADERBOARD_REFRESH_MINUTES = int(os.getenv("LEADERBOARD_REFRESH_MINUTES", "5"))
+
 if not ALPACA_API_KEY_ID:
     print("WARNING: ALPACA_API_KEY_ID environment variable not set.")
 if not ALPACA_API_SECRET_KEY:
     print("WARNING: ALPACA_API_SECRET_KEY environment variable not set.")
 
+if JOB_EXECUTION_MODE not in ("inline", "queue"):
+    raise ValueError("JOB_EXECUTION_MODE must be 'inline' or 'queue'")
+if TAX_LOT_METHOD not in ("FIFO", "LIFO", "AVG"):
+    raise ValueError("TAX_LOT_METHOD must be 'FIFO', 'LIFO' or 'AVG'")
+
 # Basic input validation
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set")
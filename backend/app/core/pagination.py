@@ -0,0 +1,28 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor encodes the sort key of the last row of a page (its timestamp and, where timestamps
+can tie, its id). The next page starts strictly after that key, so fetching page N costs the
+same as fetching page 1, unlike OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp: datetime, row_id: Optional[int] = None) -> str:
+    payload = json.dumps([timestamp.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Optional[int]]:
+    """Inverse of encode_cursor. Raises ValueError for anything that isn't a cursor we issued."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(timestamp), (int(row_id) if row_id is not None else None)
+    except Exception as e:
+        raise ValueError("Invalid pagination cursor") from e
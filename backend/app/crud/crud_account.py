@@ -19,11 +19,19 @@ def update_cash_balance(db: Session, user_id: int, amount: decimal.Decimal) -> A
     db_account = get_account(db=db, user_id=user_id)
     if db_account:
         db_account.cash_balance += amount
+        bump_position_version(db_account)
         db.commit()
         db.refresh(db_account)
         return db_account
     return None
 
+def bump_position_version(db_account: Account):
+    """
+    Marks the account's cash/positions as changed so cached valuations are rebuilt. The increment
+    runs in SQL at flush, so concurrent trades never both write the same version. Does NOT commit.
+    """
+    db_account.position_version = Account.position_version + 1
+
 def get_or_create_account(db: Session, user: User) -> Account:
     """ Gets account or creates one if it doesn't exist """
     db_account = get_account(db=db, user_id=user.id)
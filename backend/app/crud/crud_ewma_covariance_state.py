@@ -0,0 +1,19 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from app.models.ewma_covariance_state import EwmaCovarianceState
+from app.db.upsert import dialect_insert
+from typing import Optional, Dict, Any
+
+def get_state(db: Session, decay: float) -> Optional[EwmaCovarianceState]:
+    return db.query(EwmaCovarianceState).filter(EwmaCovarianceState.decay == decay).first()
+
+def upsert_state(db: Session, state: Dict[str, Any]):
+    """ Writes the state dict (decay, symbols, covariance, last_bar_date, observations), replacing the row for its decay. Does NOT commit. """
+    insert_stmt = dialect_insert(db, EwmaCovarianceState).values(**state)
+    db.execute(insert_stmt.on_conflict_do_update(
+        index_elements=[EwmaCovarianceState.decay],
+        set_={
+            **{name: insert_stmt.excluded[name] for name in state if name != "decay"},
+            "updated_at": func.now(),
+        }
+    ))
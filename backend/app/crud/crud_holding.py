@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from app.models.holding import Holding
 import decimal
 from typing import List
@@ -9,6 +10,10 @@ def get_holding(db: Session, user_id: int, symbol: str) -> Holding | None:
 def get_all_holdings(db: Session, user_id: int) -> List[Holding]:
     return db.query(Holding).filter(Holding.user_id == user_id).all()
 
+def count_held_symbols(db: Session) -> int:
+    """ Distinct symbols held by any user. """
+    return db.query(func.count(func.distinct(Holding.symbol))).scalar() or 0
+
 def create_holding(db: Session, user_id: int, symbol: str, quantity: int, purchase_price: decimal.Decimal) -> Holding:
     db_holding = Holding(
         user_id=user_id,
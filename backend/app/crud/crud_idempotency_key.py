@@ -0,0 +1,50 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import delete
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from app.models.idempotency_key import IdempotencyKey
+
+def get_idempotency_key(db: Session, user_id: int, key: str) -> Optional[IdempotencyKey]:
+    """Gets a non-expired idempotency key record for the user."""
+    now_utc = datetime.now(timezone.utc)
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key,
+        IdempotencyKey.expires_at > now_utc
+    ).first()
+
+def create_idempotency_key(
+    db: Session,
+    user_id: int,
+    key: str,
+    request_hash: str,
+    ttl_hours: int,
+    trade_id: Optional[int] = None,
+    pending_order_id: Optional[int] = None
+) -> IdempotencyKey:
+    """
+    Records the result of a request under its key. An expired row the purge job has not removed
+    yet is deleted first, so the key can be reused once its replay window has passed. Does NOT commit.
+    """
+    db.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key,
+        IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+    ))
+    db_key = IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_hash=request_hash,
+        trade_id=trade_id,
+        pending_order_id=pending_order_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(hours=ttl_hours)
+    )
+    db.add(db_key)
+    db.flush() # Surface unique-constraint conflicts inside the caller's transaction
+    return db_key
+
+def delete_expired_idempotency_keys(db: Session) -> int:
+    """Deletes keys whose replay window has passed. Does NOT commit."""
+    now_utc = datetime.now(timezone.utc)
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now_utc))
+    return result.rowcount or 0
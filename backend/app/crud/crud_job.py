@@ -0,0 +1,135 @@
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List
+from app.models.job import Job
+from app.models.enums import JobStatus
+
+def _in_flight(now_utc: datetime):
+    """Queued, or running under a live lease. A running job whose lease expired has lost its worker."""
+    return (Job.status == JobStatus.QUEUED) | ((Job.status == JobStatus.RUNNING) & (Job.available_at > now_utc))
+
+def enqueue_job(
+    db: Session,
+    job_type: str,
+    payload: Optional[Dict[str, Any]] = None,
+    dedupe_key: Optional[str] = None,
+    max_attempts: int = 3
+) -> Job:
+    """
+    Adds a job to the queue. If dedupe_key is given and an identical job is still
+    queued or running under a live lease, that job is returned instead, so at most one
+    copy is ever in flight. Does NOT commit.
+    """
+    if dedupe_key:
+        existing = db.query(Job).filter(
+            Job.dedupe_key == dedupe_key,
+            _in_flight(datetime.now(timezone.utc))
+        ).first()
+        if existing:
+            return existing
+
+    db_job = Job(
+        job_type=job_type,
+        payload=payload,
+        dedupe_key=dedupe_key,
+        status=JobStatus.QUEUED,
+        attempts=0,
+        max_attempts=max_attempts,
+        available_at=datetime.now(timezone.utc)
+    )
+    db.add(db_job)
+    db.flush()
+    return db_job
+
+def get_job(db: Session, job_id: int) -> Optional[Job]:
+    return db.query(Job).filter(Job.id == job_id).first()
+
+def get_reusable_job(db: Session, dedupe_key: str, succeeded_since: datetime) -> Optional[Job]:
+    """
+    The newest job with this key that is still queued, running under a live lease, or that
+    succeeded at or after succeeded_since. Lets identical requests share one computation and
+    its result; a running job whose worker let the lease expire is not worth waiting on.
+    """
+    return db.query(Job).filter(
+        Job.dedupe_key == dedupe_key,
+        _in_flight(datetime.now(timezone.utc))
+        | ((Job.status == JobStatus.SUCCEEDED) & (Job.finished_at >= succeeded_since))
+    ).order_by(Job.id.desc()).first()
+
+def claim_next_job(
+    db: Session,
+    worker_id: str,
+    visibility_timeout_seconds: int,
+    job_types: Optional[List[str]] = None
+) -> Optional[Job]:
+    """
+    Claims the oldest runnable job: a QUEUED job whose backoff has passed, or a RUNNING
+    job whose visibility timeout expired (its worker died). Uses SKIP LOCKED on Postgres so
+    concurrent workers never claim the same row. Does NOT commit.
+    """
+    now_utc = datetime.now(timezone.utc)
+    while True:
+        query = db.query(Job).filter(
+            Job.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]),
+            Job.available_at <= now_utc
+        )
+        if job_types:
+            query = query.filter(Job.job_type.in_(job_types))
+        db_job = query.order_by(Job.available_at.asc(), Job.id.asc())\
+            .with_for_update(skip_locked=True)\
+            .first()
+        if db_job is None:
+            return None
+
+        if db_job.status == JobStatus.RUNNING and db_job.attempts >= db_job.max_attempts:
+            # Timed out on its last attempt; give up instead of running it again
+            db_job.status = JobStatus.FAILED
+            db_job.last_error = f"Visibility timeout expired (worker {db_job.locked_by}) on final attempt."
+            db_job.locked_by = None
+            db_job.finished_at = now_utc
+            db.flush()
+            continue
+
+        db_job.status = JobStatus.RUNNING
+        db_job.attempts += 1
+        db_job.locked_by = worker_id
+        db_job.available_at = now_utc + timedelta(seconds=visibility_timeout_seconds)
+        db.flush()
+        return db_job
+
+def extend_lease(db: Session, job_id: int, worker_id: str, visibility_timeout_seconds: int) -> bool:
+    """
+    Pushes a running job's visibility timeout out again while its worker is alive. Returns False if
+    the worker no longer owns the job. Does NOT commit.
+    """
+    updated = db.query(Job).filter(
+        Job.id == job_id,
+        Job.status == JobStatus.RUNNING,
+        Job.locked_by == worker_id
+    ).update(
+        {Job.available_at: datetime.now(timezone.utc) + timedelta(seconds=visibility_timeout_seconds)},
+        synchronize_session=False
+    )
+    return updated > 0
+
+def complete_job(db: Session, db_job: Job, result: Optional[Dict[str, Any]] = None) -> Job:
+    """Marks a job SUCCEEDED. Does NOT commit."""
+    db_job.status = JobStatus.SUCCEEDED
+    db_job.result = result
+    db_job.locked_by = None
+    db_job.finished_at = datetime.now(timezone.utc)
+    db.flush()
+    return db_job
+
+def fail_job(db: Session, db_job: Job, error: str, retry_delay_seconds: int) -> Job:
+    """Requeues a failed job after retry_delay_seconds, or marks it FAILED when out of attempts. Does NOT commit."""
+    db_job.last_error = error
+    db_job.locked_by = None
+    if db_job.attempts >= db_job.max_attempts:
+        db_job.status = JobStatus.FAILED
+        db_job.finished_at = datetime.now(timezone.utc)
+    else:
+        db_job.status = JobStatus.QUEUED
+        db_job.available_at = datetime.now(timezone.utc) + timedelta(seconds=retry_delay_seconds)
+    db.flush()
+    return db_job
@@ -0,0 +1,69 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, update
+from app.models.leaderboard_entry import LeaderboardEntry
+from app.models.user import User
+from app.models.enums import LeaderboardMetric
+from app.db.upsert import dialect_insert
+from typing import List, Optional, Dict, Any
+
+def _metric_column(metric: LeaderboardMetric):
+    return LeaderboardEntry.total_return if metric == LeaderboardMetric.RETURN else LeaderboardEntry.portfolio_value
+
+def mark_dirty(db: Session, user_id: int):
+    """ Flags the user's entry for revaluation, creating it if needed. One statement. Does NOT commit. """
+    insert_stmt = dialect_insert(db, LeaderboardEntry).values(user_id=user_id, is_dirty=True)
+    db.execute(insert_stmt.on_conflict_do_update(
+        index_elements=[LeaderboardEntry.user_id],
+        set_={"is_dirty": True}
+    ))
+
+def claim_dirty_user_ids(db: Session) -> List[int]:
+    """
+    Clears every dirty flag and returns those users in one UPDATE ... RETURNING, so a fill that
+    marks a user dirty after this point survives until the next refresh. Does NOT commit.
+    """
+    result = db.execute(
+        update(LeaderboardEntry)
+        .where(LeaderboardEntry.is_dirty.is_(True))
+        .values(is_dirty=False)
+        .returning(LeaderboardEntry.user_id)
+    )
+    return [row[0] for row in result.all()]
+
+def upsert_values(db: Session, entries: List[Dict[str, Any]]) -> int:
+    """
+    Writes valuations (dicts with user_id, portfolio_value, total_return, valued_at). Existing
+    dirty flags are left alone: only claim_dirty_user_ids clears them. Does NOT commit.
+    """
+    if not entries:
+        return 0
+    insert_stmt = dialect_insert(db, LeaderboardEntry)
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[LeaderboardEntry.user_id],
+        set_={
+            "portfolio_value": insert_stmt.excluded.portfolio_value,
+            "total_return": insert_stmt.excluded.total_return,
+            "valued_at": insert_stmt.excluded.valued_at,
+        }
+    )
+    db.execute(upsert_stmt, [{**entry, "is_dirty": False} for entry in entries])
+    return len(entries)
+
+def count_ahead(db: Session, metric: LeaderboardMetric, value: Any) -> int:
+    """ Entries with a strictly better metric than `value`: an index range count. Rank = this + 1, so ties share a rank. """
+    metric_column = _metric_column(metric)
+    return db.query(func.count(LeaderboardEntry.id)).filter(metric_column > value).scalar() or 0
+
+def get_top_entries(db: Session, metric: LeaderboardMetric, limit: int = 10, offset: int = 0) -> List[Any]:
+    """ (LeaderboardEntry, username) rows, best metric first, read off the metric index. """
+    metric_column = _metric_column(metric)
+    return db.query(LeaderboardEntry, User.username)\
+        .join(User, User.id == LeaderboardEntry.user_id)\
+        .filter(metric_column.isnot(None))\
+        .order_by(metric_column.desc(), LeaderboardEntry.user_id.asc())\
+        .offset(offset)\
+        .limit(limit)\
+        .all()
+
+def get_entry(db: Session, user_id: int) -> Optional[LeaderboardEntry]:
+    return db.query(LeaderboardEntry).filter(LeaderboardEntry.user_id == user_id).first()
@@ -47,6 +47,17 @@ def update_pending_order_status(db: Session, db_order: PendingOrder, status: Ord
     db.flush()
     return db_order
 
+def claim_pending_order(db: Session, order_id: int) -> bool:
+    """
+    Marks a PENDING order EXECUTED with a conditional update, so only one caller can take it.
+    Returns False if the order was already executed or cancelled. Does NOT commit.
+    """
+    updated = db.query(PendingOrder).filter(
+        PendingOrder.id == order_id,
+        PendingOrder.status == OrderStatus.PENDING
+    ).update({PendingOrder.status: OrderStatus.EXECUTED}, synchronize_session="fetch")
+    return updated == 1
+
 # Function to get ALL pending orders (for the execution engine later)
 def get_all_pending_orders(db: Session) -> List[PendingOrder]:
      """ Gets all orders across all users with status PENDING. """
@@ -0,0 +1,35 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from app.models.portfolio_analytics_state import PortfolioAnalyticsState
+from app.db.upsert import dialect_insert
+from typing import List, Optional, Dict, Any
+
+STATE_COLUMNS = [c.name for c in PortfolioAnalyticsState.__table__.columns if c.name not in ("id", "updated_at")]
+
+def get_state(db: Session, user_id: int) -> Optional[Dict[str, Any]]:
+    """ The user's analytics state as a plain dict of STATE_COLUMNS, or None. """
+    row = db.execute(
+        select(*[PortfolioAnalyticsState.__table__.c[name] for name in STATE_COLUMNS])
+        .where(PortfolioAnalyticsState.user_id == user_id)
+    ).mappings().first()
+    return dict(row) if row else None
+
+def get_all_states(db: Session) -> Dict[int, Dict[str, Any]]:
+    """ user_id -> state dict for every user, in one query. """
+    rows = db.execute(select(*[PortfolioAnalyticsState.__table__.c[name] for name in STATE_COLUMNS])).mappings()
+    return {row["user_id"]: dict(row) for row in rows}
+
+def upsert_states(db: Session, states: List[Dict[str, Any]]) -> int:
+    """ Writes state dicts, replacing the existing row per user. Does NOT commit. """
+    if not states:
+        return 0
+    insert_stmt = dialect_insert(db, PortfolioAnalyticsState)
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[PortfolioAnalyticsState.user_id],
+        set_={
+            **{name: insert_stmt.excluded[name] for name in STATE_COLUMNS if name != "user_id"},
+            "updated_at": func.now(),
+        }
+    )
+    db.execute(upsert_stmt, states)
+    return len(states)
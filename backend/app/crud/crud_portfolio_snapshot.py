@@ -1,8 +1,9 @@
 from sqlalchemy.orm import Session
+from app.db.upsert import dialect_insert
 from app.models.portfolio_snapshot import PortfolioSnapshot
 import decimal
-from datetime import datetime, timezone
-from typing import List, Optional
+from datetime import datetime, date, timezone
+from typing import List, Optional, Dict, Any
 
 def create_portfolio_snapshot(
     db: Session,
@@ -19,6 +20,7 @@ def create_portfolio_snapshot(
     db_snapshot = PortfolioSnapshot(
         user_id=user_id,
         total_value=total_value,
+        snapshot_date=(snapshot_timestamp or datetime.now(timezone.utc)).astimezone(timezone.utc).date(),
         # Only set timestamp if provided, otherwise let server_default work
         **(dict(timestamp=snapshot_timestamp) if snapshot_timestamp else {})
     )
@@ -28,6 +30,27 @@ def create_portfolio_snapshot(
     return db_snapshot
 
 
+def upsert_portfolio_snapshots(db: Session, snapshots: List[Dict[str, Any]]) -> int:
+    """
+    Writes many snapshots (dicts with user_id, snapshot_date, total_value, timestamp) in one
+    executemany. A row that already exists for (user_id, snapshot_date) is overwritten, so
+    running the snapshot job twice on one day never duplicates rows.
+    Does NOT commit. Returns the number of rows written.
+    """
+    if not snapshots:
+        return 0
+    insert_stmt = dialect_insert(db, PortfolioSnapshot)
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[PortfolioSnapshot.user_id, PortfolioSnapshot.snapshot_date],
+        set_={
+            "total_value": insert_stmt.excluded.total_value,
+            "timestamp": insert_stmt.excluded.timestamp,
+        }
+    )
+    db.execute(upsert_stmt, snapshots)
+    return len(snapshots)
+
+
 def get_portfolio_snapshots_for_user(
     db: Session,
     user_id: int,
@@ -51,4 +74,60 @@ def get_portfolio_snapshots_for_user(
     if limit:
         query = query.limit(limit)
 
-    return query.all()
\ No newline at end of file
+    return query.all()
+
+
+def get_snapshot_values_for_user(
+    db: Session,
+    user_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: Optional[int] = 1000,
+    after: Optional[datetime] = None
+) -> List[Any]:
+    """
+    Same filtering and ordering as get_portfolio_snapshots_for_user, but returns plain
+    (timestamp, total_value) rows instead of hydrating ORM objects. `after` continues from the
+    last timestamp of a previous page (keyset pagination on (user_id, timestamp)).
+    """
+    query = db.query(PortfolioSnapshot.timestamp, PortfolioSnapshot.total_value)\
+        .filter(PortfolioSnapshot.user_id == user_id)
+
+    if start_date:
+        query = query.filter(PortfolioSnapshot.timestamp >= start_date)
+    if end_date:
+        query = query.filter(PortfolioSnapshot.timestamp <= end_date)
+    if after:
+        query = query.filter(PortfolioSnapshot.timestamp > after)
+
+    query = query.order_by(PortfolioSnapshot.timestamp.asc())
+
+    if limit:
+        query = query.limit(limit)
+
+    return query.all()
+
+
+def get_snapshot_values_since(db: Session, since_date: Optional[date] = None) -> List[Any]:
+    """ (user_id, snapshot_date, timestamp, total_value) rows for all users from since_date on (all rows if None). """
+    query = db.query(
+        PortfolioSnapshot.user_id, PortfolioSnapshot.snapshot_date,
+        PortfolioSnapshot.timestamp, PortfolioSnapshot.total_value
+    )
+    if since_date:
+        query = query.filter(PortfolioSnapshot.snapshot_date >= since_date)
+    return query.all()
+
+
+def get_snapshot_series_for_users(db: Session, user_ids: List[int]) -> List[Any]:
+    """ (user_id, snapshot_date, total_value) rows for the given users, ordered by user then day. """
+    rows: List[Any] = []
+    for start in range(0, len(user_ids), 500): # Keep IN lists well under bind-parameter limits
+        chunk = user_ids[start:start + 500]
+        rows.extend(
+            db.query(PortfolioSnapshot.user_id, PortfolioSnapshot.snapshot_date, PortfolioSnapshot.total_value)
+            .filter(PortfolioSnapshot.user_id.in_(chunk))
+            .order_by(PortfolioSnapshot.user_id.asc(), PortfolioSnapshot.snapshot_date.asc())
+            .all()
+        )
+    return rows
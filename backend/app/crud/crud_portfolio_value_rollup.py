@@ -0,0 +1,57 @@
+from sqlalchemy.orm import Session
+from app.models.portfolio_value_rollup import PortfolioValueRollup
+from app.models.enums import ValueHistoryBucket
+from app.db.upsert import dialect_insert
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+
+def upsert_rollups(db: Session, rollups: List[Dict[str, Any]]) -> int:
+    """
+    Writes rollup rows (user_id, bucket, bucket_start, close_value, close_timestamp, snapshot_count),
+    replacing any existing row for the same bucket. Does NOT commit.
+    """
+    if not rollups:
+        return 0
+    insert_stmt = dialect_insert(db, PortfolioValueRollup)
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[PortfolioValueRollup.user_id, PortfolioValueRollup.bucket, PortfolioValueRollup.bucket_start],
+        set_={
+            "close_value": insert_stmt.excluded.close_value,
+            "close_timestamp": insert_stmt.excluded.close_timestamp,
+            "snapshot_count": insert_stmt.excluded.snapshot_count,
+        }
+    )
+    db.execute(upsert_stmt, rollups)
+    return len(rollups)
+
+def get_rollup_values_for_user(
+    db: Session,
+    user_id: int,
+    bucket: ValueHistoryBucket,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: Optional[int] = 1000,
+    after: Optional[datetime] = None
+) -> List[Any]:
+    """
+    Returns (timestamp, total_value) rows, one per bucket, ordered by time ascending.
+    Each row is the bucket's closing snapshot. `after` continues from a previous page's last timestamp.
+    """
+    query = db.query(
+        PortfolioValueRollup.close_timestamp.label("timestamp"),
+        PortfolioValueRollup.close_value.label("total_value")
+    ).filter(PortfolioValueRollup.user_id == user_id, PortfolioValueRollup.bucket == bucket)
+
+    if start_date:
+        query = query.filter(PortfolioValueRollup.close_timestamp >= start_date)
+    if end_date:
+        query = query.filter(PortfolioValueRollup.close_timestamp <= end_date)
+    if after:
+        query = query.filter(PortfolioValueRollup.close_timestamp > after)
+
+    query = query.order_by(PortfolioValueRollup.bucket_start.asc())
+
+    if limit:
+        query = query.limit(limit)
+
+    return query.all()
@@ -0,0 +1,35 @@
+from sqlalchemy.orm import Session
+from app.models.risk_result import RiskResult
+from app.db.upsert import dialect_insert
+import decimal
+from typing import List, Optional, Dict, Any
+
+def get_result(db: Session, user_id: int, method: str, confidence_level: float, lookback_days: int) -> Optional[RiskResult]:
+    return db.query(RiskResult).filter(
+        RiskResult.user_id == user_id,
+        RiskResult.method == method,
+        RiskResult.confidence_level == decimal.Decimal(str(confidence_level)),
+        RiskResult.lookback_days == lookback_days
+    ).first()
+
+def upsert_results(db: Session, results: List[Dict[str, Any]]) -> int:
+    """
+    Writes result dicts (user_id, method, confidence_level, lookback_days, var_amount, expected_shortfall,
+    portfolio_value, position_version, as_of), replacing the row for the same parameters. Does NOT commit.
+    """
+    if not results:
+        return 0
+    insert_stmt = dialect_insert(db, RiskResult)
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[RiskResult.user_id, RiskResult.method, RiskResult.confidence_level, RiskResult.lookback_days],
+        set_={
+            "var_amount": insert_stmt.excluded.var_amount,
+            "expected_shortfall": insert_stmt.excluded.expected_shortfall,
+            "portfolio_value": insert_stmt.excluded.portfolio_value,
+            "position_version": insert_stmt.excluded.position_version,
+            "as_of": insert_stmt.excluded.as_of,
+        }
+    )
+    for start in range(0, len(results), 5000):
+        db.execute(upsert_stmt, results[start:start + 5000])
+    return len(results)
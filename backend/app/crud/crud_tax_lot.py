@@ -0,0 +1,47 @@
+from sqlalchemy.orm import Session
+from app.models.tax_lot import TaxLot
+from app.models.realized_pnl import RealizedPnl
+import decimal
+from typing import List, Optional
+
+def create_tax_lot(db: Session, user_id: int, symbol: str, quantity: int, cost_basis: decimal.Decimal) -> TaxLot:
+    """ Opens a new lot for a buy fill. Does NOT commit. """
+    db_lot = TaxLot(
+        user_id=user_id,
+        symbol=symbol,
+        quantity=quantity,
+        open_quantity=quantity,
+        cost_basis=cost_basis
+    )
+    db.add(db_lot)
+    return db_lot
+
+def get_open_lots(db: Session, user_id: int, symbol: str, newest_first: bool = False, limit: int = 50) -> List[TaxLot]:
+    """ Returns the next open lots to close, oldest first (FIFO) or newest first (LIFO). """
+    order = TaxLot.id.desc() if newest_first else TaxLot.id.asc()
+    return db.query(TaxLot)\
+        .filter(TaxLot.user_id == user_id, TaxLot.symbol == symbol, TaxLot.open_quantity > 0)\
+        .order_by(order)\
+        .limit(limit)\
+        .all()
+
+def get_realized_pnl(db: Session, user_id: int, symbol: str) -> Optional[RealizedPnl]:
+    return db.query(RealizedPnl).filter(RealizedPnl.user_id == user_id, RealizedPnl.symbol == symbol).first()
+
+def get_realized_pnl_for_user(db: Session, user_id: int) -> List[RealizedPnl]:
+    return db.query(RealizedPnl).filter(RealizedPnl.user_id == user_id).order_by(RealizedPnl.symbol.asc()).all()
+
+def add_realized_pnl(db: Session, user_id: int, symbol: str, amount: decimal.Decimal, quantity_closed: int) -> RealizedPnl:
+    """ Adds a sell's realized P&L to the user's running total for the symbol. Does NOT commit. """
+    db_row = get_realized_pnl(db=db, user_id=user_id, symbol=symbol)
+    if db_row is None:
+        db_row = RealizedPnl(
+            user_id=user_id,
+            symbol=symbol,
+            realized_pnl=decimal.Decimal("0.0000"),
+            quantity_closed=0
+        )
+        db.add(db_row)
+    db_row.realized_pnl += amount
+    db_row.quantity_closed += quantity_closed
+    return db_row
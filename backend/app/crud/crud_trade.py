@@ -1,7 +1,9 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import tuple_
 from app.models.trade import Trade, TradeType
+from datetime import datetime
 import decimal
-from typing import List
+from typing import List, Any, Optional, Tuple
 
 def create_trade(db: Session, user_id: int, symbol: str, quantity: int, price: decimal.Decimal, trade_type: TradeType) -> Trade:
     db_trade = Trade(
@@ -14,10 +16,39 @@ def create_trade(db: Session, user_id: int, symbol: str, quantity: int, price: d
     db.add(db_trade)
     return db_trade
 
-def get_trades_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Trade]:
-    return db.query(Trade)\
-        .filter(Trade.user_id == user_id)\
-        .order_by(Trade.timestamp.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
\ No newline at end of file
+def _trades_page_query(
+    query,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[Tuple[datetime, int]] = None,
+    symbol: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Newest-first page of a user's trades. `after` is the (timestamp, id) of the last row of the
+    previous page; the row-value comparison walks the (user_id, timestamp DESC, id DESC) index,
+    so deep pages cost the same as the first one.
+    """
+    query = query.filter(Trade.user_id == user_id)
+    if symbol:
+        query = query.filter(Trade.symbol == symbol.upper())
+    if start_date:
+        query = query.filter(Trade.timestamp >= start_date)
+    if end_date:
+        query = query.filter(Trade.timestamp <= end_date)
+    if after:
+        query = query.filter(tuple_(Trade.timestamp, Trade.id) < tuple_(*after))
+    query = query.order_by(Trade.timestamp.desc(), Trade.id.desc())
+    if skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+def get_trades_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, **filters) -> List[Trade]:
+    return _trades_page_query(db.query(Trade), user_id, skip=skip, limit=limit, **filters).all()
+
+def get_trade_rows_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, **filters) -> List[Any]:
+    """ Same page as get_trades_for_user as plain (id, timestamp, symbol, trade_type, quantity, price) rows. """
+    query = db.query(Trade.id, Trade.timestamp, Trade.symbol, Trade.trade_type, Trade.quantity, Trade.price)
+    return _trades_page_query(query, user_id, skip=skip, limit=limit, **filters).all()
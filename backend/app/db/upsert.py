@@ -0,0 +1,15 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def dialect_insert(db: Session, model):
+    """
+    INSERT construct for the session's database that supports on_conflict_do_update/
+    on_conflict_do_nothing. Postgres in production, SQLite for local runs and benchmarks.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
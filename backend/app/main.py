@@ -1,11 +1,21 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from app.services.trading_service import check_pending_orders_job
 from app.services.daily_snapshot_service import daily_snapshot_job
-from app.api.endpoints import auth, users, market, trading, portfolio, watchlist
+from app.services.idempotency_service import purge_expired_keys_job
+from app.services.job_queue_service import enqueue_pending_order_check_job, enqueue_daily_snapshot_job, enqueue_leaderboard_refresh_job, enqueue_risk_precompute_job
+from app.services.leaderboard_service import leaderboard_refresh_job
+from app.services.risk_service import risk_precompute_job
+from app.services.group_commit_service import shutdown_executor
+from app.core.monte_carlo import shutdown_pool
+from app.services.market_data_service import shutdown_fetch_pool
+from app.services.job_queue_service import shutdown_local_pool
+from app.core.config import JOB_EXECUTION_MODE, LEADERBOARD_REFRESH_MINUTES, RISK_PRECOMPUTE_HOUR_UTC
+from app.api.endpoints import auth, users, market, trading, portfolio, watchlist, backtest, leaderboard, jobs
 
 scheduler = AsyncIOScheduler(timezone="UTC")
 
@@ -15,18 +25,57 @@ async def lifespan(app: FastAPI):
     print("INFO:     Starting application and scheduler...")
     # Add the job to check pending orders every minute
     # 'interval' trigger runs the job at fixed intervals
+    # In queue mode the API only enqueues the cycle; a worker process (python -m app.worker) runs it
     scheduler.add_job(
-        check_pending_orders_job,
+        enqueue_pending_order_check_job if JOB_EXECUTION_MODE == "queue" else check_pending_orders_job,
         trigger='interval',
         minutes=5,
         id='pending_order_check_job',
         name='Check and Execute Pending Limit Orders',
         replace_existing=True
     )
+    # Drop idempotency keys whose replay window has passed
+    scheduler.add_job(
+        purge_expired_keys_job,
+        trigger='interval',
+        hours=1,
+        id='idempotency_key_purge_job',
+        name='Purge Expired Idempotency Keys',
+        replace_existing=True
+    )
+    # End-of-day portfolio snapshots (plus rollups, analytics states and leaderboard values)
+    scheduler.add_job(
+        enqueue_daily_snapshot_job if JOB_EXECUTION_MODE == "queue" else daily_snapshot_job,
+        trigger='cron',
+        hour=21,
+        minute=0,
+        id='daily_snapshot_job',
+        name='Generate Daily Portfolio Snapshots',
+        replace_existing=True
+    )
+    # Revalue users who traded since the last refresh and re-rank the leaderboard
+    scheduler.add_job(
+        enqueue_leaderboard_refresh_job if JOB_EXECUTION_MODE == "queue" else leaderboard_refresh_job,
+        trigger='interval',
+        minutes=LEADERBOARD_REFRESH_MINUTES,
+        id='leaderboard_refresh_job',
+        name='Refresh Leaderboard',
+        replace_existing=True
+    )
+    # Nightly VaR/ES for every user at the standard parameters, after the end-of-day snapshot
+    scheduler.add_job(
+        enqueue_risk_precompute_job if JOB_EXECUTION_MODE == "queue" else risk_precompute_job,
+        trigger='cron',
+        hour=RISK_PRECOMPUTE_HOUR_UTC,
+        minute=0,
+        id='risk_precompute_job',
+        name='Precompute Risk Results',
+        replace_existing=True
+    )
 
     
     scheduler.start()
-    print("INFO:     Scheduler started with pending order check job.")
+    print(f"INFO:     Scheduler started with pending order check job (job execution mode: {JOB_EXECUTION_MODE}).")
 
     yield # Application runs here
 
@@ -34,6 +83,10 @@ async def lifespan(app: FastAPI):
     print("INFO:     Shutting down scheduler...")
     scheduler.shutdown()
     print("INFO:     Scheduler shut down.")
+    shutdown_executor() # Flush any market orders still waiting for a group commit
+    shutdown_pool() # Monte Carlo worker processes, if any were started
+    shutdown_fetch_pool()
+    shutdown_local_pool() # Inline-mode analytics jobs still running are picked up again after their visibility timeout
 
 # Pass the lifespan manager to the FastAPI app
 app = FastAPI(
@@ -57,9 +110,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Pagination cursor for trade/value history
 )
 # --- End CORS Configuration ---
 
+# Compress larger responses (e.g. long histories) for clients that send Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 
 api_prefix = "/api/v1"
 app.include_router(auth.router, prefix=f"{api_prefix}/auth", tags=["Authentication"])
@@ -68,6 +125,9 @@ app.include_router(market.router, prefix=f"{api_prefix}/market", tags=["Market D
 app.include_router(trading.router, prefix=f"{api_prefix}/trading", tags=["Trading"])
 app.include_router(portfolio.router, prefix=f"{api_prefix}/portfolio", tags=["Portfolio"])
 app.include_router(watchlist.router, prefix=f"{api_prefix}/watchlist", tags=["Watchlist"])
+app.include_router(backtest.router, prefix=f"{api_prefix}/backtest", tags=["Backtesting"])
+app.include_router(leaderboard.router, prefix=f"{api_prefix}/leaderboard", tags=["Leaderboard"])
+app.include_router(jobs.router, prefix=f"{api_prefix}/jobs", tags=["Jobs"])
 
 
 # --- Root endpoint ---
@@ -3,11 +3,15 @@ from sqlalchemy.orm import relationship
 from app.db.base import Base
 import decimal
 
+STARTING_CASH_BALANCE = decimal.Decimal("100000.0000") # Virtual cash every new account receives
+
 class Account(Base):
     __tablename__ = "accounts"
 
     id = Column(Integer, primary_key=True, index=True)
-    cash_balance = Column(Numeric(15, 4), nullable=False, default=decimal.Decimal("100000.0000")) # Start users with virtual cash
+    cash_balance = Column(Numeric(15, 4), nullable=False, default=STARTING_CASH_BALANCE) # Start users with virtual cash
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False, index=True) # One account per user
+    realized_pnl = Column(Numeric(18, 4), nullable=False, default=decimal.Decimal("0.0000"), server_default="0") # Sum over all symbols
+    position_version = Column(Integer, nullable=False, default=0, server_default="0") # Bumped on every cash/position change
 
     owner = relationship("User") # Define relationship back to User
\ No newline at end of file
@@ -10,4 +10,37 @@ class OrderStatus(str, enum.Enum):
     PENDING = "PENDING"
     EXECUTED = "EXECUTED"
     CANCELLED = "CANCELLED"
-    EXPIRED = "EXPIRED"
\ No newline at end of file
+    EXPIRED = "EXPIRED"
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+class TaxLotMethod(str, enum.Enum):
+    FIFO = "FIFO"
+    LIFO = "LIFO"
+    AVG = "AVG"
+
+class ValueHistoryBucket(str, enum.Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+class LeaderboardMetric(str, enum.Enum):
+    VALUE = "value" # Total portfolio value
+    RETURN = "return" # Total return on starting cash
+
+class VarMethod(str, enum.Enum):
+    HISTORICAL = "historical"
+    PARAMETRIC = "parametric" # Variance-covariance
+    MONTE_CARLO = "monte_carlo"
+
+class StressScenarioKind(str, enum.Enum):
+    HISTORICAL = "historical" # Each symbol's actual return over a past window
+    HYPOTHETICAL = "hypothetical" # Factor shocks applied through each symbol's beta
+
+class AnalyticsJobType(str, enum.Enum):
+    RISK_VAR = "risk_var"
+    STRESS_TEST = "stress_test"
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, Float, Date, DateTime, Text, LargeBinary
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class EwmaCovarianceState(Base):
+    """
+    Exponentially weighted covariance of daily returns across the held-symbol universe, one row
+    per decay factor. The matrix is updated in place with each new daily bar and stored whole, so
+    restarts resume from it instead of recomputing over the history.
+    """
+    __tablename__ = "ewma_covariance_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    decay = Column(Float, unique=True, nullable=False) # lambda: weight kept by the previous estimate each day
+    symbols = Column(Text, nullable=False) # JSON list; row/column order of the matrix
+    covariance = Column(LargeBinary, nullable=False) # float64, row-major, len(symbols) x len(symbols)
+    last_bar_date = Column(Date, nullable=True) # Latest daily return folded in
+    observations = Column(Integer, nullable=False, default=0) # Daily returns folded in since seeding
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
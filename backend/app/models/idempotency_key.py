@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(255), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # Fingerprint of the original request body, so a key can't be reused for a different order
+    request_hash = Column(String(64), nullable=False)
+
+    # Exactly one of these is set: the executed trade (market) or the placed pending order (limit)
+    trade_id = Column(Integer, ForeignKey("trades.id", ondelete="CASCADE"), nullable=True)
+    pending_order_id = Column(Integer, ForeignKey("pending_orders.id", ondelete="CASCADE"), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True) # Purged by the scheduler after this
+
+    owner = relationship("User")
+
+    # A key is scoped to the user who sent it
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='_user_idempotency_key_uc'),
+    )
+
+    def __repr__(self):
+        return f"<IdempotencyKey(id={self.id}, user_id={self.user_id}, key='{self.key}', trade_id={self.trade_id}, pending_order_id={self.pending_order_id})>"
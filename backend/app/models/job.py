@@ -0,0 +1,44 @@
+from sqlalchemy import (
+    Column, Integer, String, Text, DateTime, JSON, Enum as SQLAlchemyEnum, Index
+)
+from sqlalchemy.sql import func
+from app.db.base import Base
+from .enums import JobStatus
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False, index=True)
+    payload = Column(JSON, nullable=True)
+
+    status = Column(
+        SQLAlchemyEnum(JobStatus, name="jobstatus"),
+        nullable=False,
+        default=JobStatus.QUEUED
+    )
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+
+    # QUEUED: earliest time the job may run (retry backoff).
+    # RUNNING: visibility deadline; if the worker hasn't finished by then, another worker may reclaim it.
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_by = Column(String(100), nullable=True) # Worker ID holding the job
+
+    # Jobs with the same key coalesce while one is still queued
+    dedupe_key = Column(String(255), nullable=True, index=True)
+
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Workers poll by (status, available_at)
+    __table_args__ = (
+        Index('ix_jobs_status_available_at', 'status', 'available_at'),
+    )
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, type='{self.job_type}', status='{self.status}', attempts={self.attempts})>"
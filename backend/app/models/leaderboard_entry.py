@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, Numeric, Float, Boolean, DateTime, ForeignKey, Index, text
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+class LeaderboardEntry(Base):
+    """
+    One row per user holding their last valuation. Values are refreshed by the snapshot job and,
+    for users flagged dirty by a trade, by the periodic leaderboard refresh. Ranks are not stored:
+    a rank is one indexed count of the entries ahead, so a revaluation only writes its own row.
+    """
+    __tablename__ = "leaderboard_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False, index=True)
+    portfolio_value = Column(Numeric(15, 4), nullable=True) # NULL until first valued; unranked
+    total_return = Column(Float, nullable=True) # portfolio_value / starting cash - 1
+    is_dirty = Column(Boolean, nullable=False, default=False) # Traded since last valued
+    valued_at = Column(DateTime(timezone=True), nullable=True)
+
+    owner = relationship("User")
+
+    # Top-K reads and rank counts walk the metric indexes; the refresh finds dirty rows through a partial index
+    __table_args__ = (
+        Index('ix_leaderboard_entries_portfolio_value', 'portfolio_value'),
+        Index('ix_leaderboard_entries_total_return', 'total_return'),
+        Index(
+            'ix_leaderboard_entries_dirty', 'user_id',
+            postgresql_where=text('is_dirty'),
+            sqlite_where=text('is_dirty')
+        ),
+    )
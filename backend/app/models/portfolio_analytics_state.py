@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, Float, Date, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class PortfolioAnalyticsState(Base):
+    """
+    Running statistics over a user's daily snapshot series, maintained by the snapshot job so
+    performance analytics never rescan the history. The accumulators cover every snapshot up to
+    and including the previous one; the latest snapshot is kept apart so a same-day rerun of the
+    job just replaces it.
+    """
+    __tablename__ = "portfolio_analytics_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False, index=True)
+
+    point_count = Column(Integer, nullable=False, default=0) # Snapshots folded into the accumulators
+    first_date = Column(Date, nullable=False)
+    prev_value = Column(Float, nullable=True) # Last folded snapshot
+    prev_benchmark_price = Column(Float, nullable=True)
+    last_date = Column(Date, nullable=False) # Latest snapshot, not yet folded
+    last_value = Column(Float, nullable=False)
+    last_benchmark_price = Column(Float, nullable=True)
+
+    # Daily returns between consecutive snapshots
+    return_count = Column(Integer, nullable=False, default=0)
+    sum_return = Column(Float, nullable=False, default=0.0)
+    sum_sq_return = Column(Float, nullable=False, default=0.0)
+    sum_log_return = Column(Float, nullable=False, default=0.0)
+
+    # Returns on days with a benchmark price on both ends, for beta
+    paired_count = Column(Integer, nullable=False, default=0)
+    sum_paired_return = Column(Float, nullable=False, default=0.0)
+    sum_benchmark_return = Column(Float, nullable=False, default=0.0)
+    sum_sq_benchmark_return = Column(Float, nullable=False, default=0.0)
+    sum_cross_return = Column(Float, nullable=False, default=0.0)
+
+    peak_value = Column(Float, nullable=False, default=0.0)
+    max_drawdown = Column(Float, nullable=False, default=0.0) # Fraction of the running peak
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    owner = relationship("User")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Numeric, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Numeric, DateTime, Date, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -13,6 +13,7 @@ class PortfolioSnapshot(Base):
         nullable=False,
         index=True
     )
+    snapshot_date = Column(Date, nullable=False) # UTC trading day the snapshot belongs to
     total_value = Column(Numeric(15, 4), nullable=False)
 
     user_id = Column(
@@ -24,5 +25,11 @@ class PortfolioSnapshot(Base):
 
     owner = relationship("User")
 
+    # One snapshot per user per day; reruns of the snapshot job update it in place
+    __table_args__ = (
+        UniqueConstraint('user_id', 'snapshot_date', name='_user_snapshot_date_uc'),
+        Index('ix_portfolio_snapshots_user_id_timestamp', 'user_id', 'timestamp'), # Value history range scans
+    )
+
     def __repr__(self):
         return f"<PortfolioSnapshot(id={self.id}, user_id={self.user_id}, timestamp='{self.timestamp}', value={self.total_value})>"
\ No newline at end of file
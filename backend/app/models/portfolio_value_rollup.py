@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, Numeric, DateTime, Date, ForeignKey, Enum, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+from app.models.enums import ValueHistoryBucket
+
+class PortfolioValueRollup(Base):
+    """
+    Weekly/monthly closing portfolio values, maintained by the daily snapshot job so long
+    value histories can be served without scanning every daily snapshot.
+    """
+    __tablename__ = "portfolio_value_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    bucket = Column(Enum(ValueHistoryBucket), nullable=False) # WEEK or MONTH
+    bucket_start = Column(Date, nullable=False) # Monday of the week / first day of the month
+    close_value = Column(Numeric(15, 4), nullable=False) # Last snapshot value in the bucket
+    close_timestamp = Column(DateTime(timezone=True), nullable=False) # Timestamp of that snapshot
+    snapshot_count = Column(Integer, nullable=False)
+
+    owner = relationship("User")
+
+    __table_args__ = (UniqueConstraint('user_id', 'bucket', 'bucket_start', name='_user_bucket_start_uc'),)
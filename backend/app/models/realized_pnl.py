@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base import Base
+import decimal
+
+class RealizedPnl(Base):
+    """Running realized P&L per user and symbol, updated on every sell fill."""
+    __tablename__ = "realized_pnl"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    symbol = Column(String, nullable=False)
+    realized_pnl = Column(Numeric(18, 4), nullable=False, default=decimal.Decimal("0.0000"))
+    quantity_closed = Column(Integer, nullable=False, default=0) # Total shares sold
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    owner = relationship("User")
+
+    __table_args__ = (UniqueConstraint('user_id', 'symbol', name='_user_symbol_realized_pnl_uc'),)
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+class RiskResult(Base):
+    """
+    Precomputed VaR / expected shortfall per user and standard parameter set, written by the
+    nightly risk batch. A row is only served while the account's position_version still matches.
+    """
+    __tablename__ = "risk_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    method = Column(String(20), nullable=False) # e.g. "historical"
+    confidence_level = Column(Numeric(5, 4), nullable=False)
+    lookback_days = Column(Integer, nullable=False)
+    var_amount = Column(Numeric(15, 4), nullable=False)
+    expected_shortfall = Column(Numeric(15, 4), nullable=False)
+    portfolio_value = Column(Numeric(15, 4), nullable=False) # Value of the holdings the figures cover
+    position_version = Column(Integer, nullable=False) # Account.position_version the result was computed at
+    as_of = Column(DateTime(timezone=True), nullable=False)
+
+    owner = relationship("User")
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'method', 'confidence_level', 'lookback_days', name='_user_risk_params_uc'),
+    )
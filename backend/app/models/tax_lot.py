@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Index, text
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class TaxLot(Base):
+    __tablename__ = "tax_lots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    symbol = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False) # Shares bought into this lot
+    open_quantity = Column(Integer, nullable=False) # Shares not yet sold out of it
+    cost_basis = Column(Numeric(15, 4), nullable=False) # Price per share paid
+    opened_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    owner = relationship("User")
+
+    # Open lots are consumed in id order (FIFO) or reverse id order (LIFO). Partial index, so
+    # closed lots kept for history never slow down the next sell.
+    __table_args__ = (
+        Index(
+            'ix_tax_lots_open', 'user_id', 'symbol', 'id',
+            postgresql_where=text('open_quantity > 0'),
+            sqlite_where=text('open_quantity > 0')
+        ),
+        Index('ix_tax_lots_user_id', 'user_id'),
+    )
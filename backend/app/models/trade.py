@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -19,4 +19,7 @@ class Trade(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
 
-    owner = relationship("User")
\ No newline at end of file
+    owner = relationship("User")
+
+# Trade history is read newest first per user; this index serves keyset pagination
+Index('ix_trades_user_id_timestamp_id', Trade.user_id, Trade.timestamp.desc(), Trade.id.desc())
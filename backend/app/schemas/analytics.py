@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date
+
+class PortfolioAnalytics(BaseModel):
+    as_of: Optional[date] = None # Date of the latest snapshot
+    observations: int # Daily snapshots covered
+    time_weighted_return: Optional[float] = None # Compounded daily returns over the whole history
+    annualized_volatility: Optional[float] = None
+    sharpe_ratio: Optional[float] = None # Annualized, excess over risk_free_rate
+    max_drawdown: Optional[float] = None # Largest fall from a running peak, as a fraction
+    beta: Optional[float] = None # Against benchmark_symbol; None without overlapping benchmark prices
+    benchmark_symbol: str
+    risk_free_rate: float
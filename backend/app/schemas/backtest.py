@@ -0,0 +1,46 @@
+from pydantic import BaseModel, Field, validator
+from datetime import date, datetime
+from typing import List, Dict, Optional
+import decimal
+from .order import OrderCreate
+
+# An order in the replay stream, placed on the first bar on or after `date`
+class BacktestOrder(OrderCreate):
+    date: date
+
+class BacktestRequest(BaseModel):
+    symbols: List[str] = Field(..., min_length=1, max_length=100)
+    lookback_days: int = Field(252 * 5, gt=10, le=252 * 20)
+    initial_cash: decimal.Decimal = Field(decimal.Decimal("100000.0000"), gt=decimal.Decimal("0.0"))
+    orders: List[BacktestOrder] = []
+
+    @validator('symbols', each_item=True)
+    def symbol_uppercase(cls, v):
+        return v.upper()
+
+class BacktestTrade(BaseModel):
+    timestamp: datetime
+    symbol: str
+    trade_type: str # BUY or SELL, as in the trades table
+    quantity: int
+    price: float
+    order_type: str
+
+class BacktestRejectedOrder(BaseModel):
+    timestamp: Optional[datetime] = None
+    symbol: str
+    order_type: str
+    quantity: int
+    reason: str
+
+class BacktestResponse(BaseModel):
+    symbols: List[str]
+    timestamps: List[datetime]
+    cash: List[float]
+    holdings: Dict[str, List[int]] # Quantity held per symbol at each bar
+    equity: List[float]
+    final_value: float
+    total_return: float
+    trades: List[BacktestTrade]
+    rejected_orders: List[BacktestRejectedOrder]
+    open_limit_orders: int
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+
+class CorrelationMatrixResponse(BaseModel):
+    as_of: Optional[date] = None # Latest daily return folded into the estimate
+    decay: float # EWMA lambda
+    symbols: List[str] # Row/column order; held symbols with an estimate
+    volatilities: List[float] # Daily EWMA standard deviation per symbol
+    correlation: List[List[float]]
+    excluded_symbols: List[str] = [] # Held symbols without enough history
@@ -11,6 +11,7 @@ class HoldingResponse(BaseModel):
     current_price: Optional[decimal.Decimal] = None
     current_value: Optional[decimal.Decimal] = None
     unrealized_pnl: Optional[decimal.Decimal] = None
+    realized_pnl: Optional[decimal.Decimal] = None # From the tax-lot ledger, for shares already sold
 
     class Config:
         from_attributes = True # Needed if reading directly from ORM model sometimes
\ No newline at end of file
@@ -0,0 +1,27 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+from datetime import datetime
+from app.models.enums import AnalyticsJobType, JobStatus, VarMethod
+from app.core.monte_carlo import MonteCarloDistribution
+from app.core.config import MONTE_CARLO_DEFAULT_PATHS, MONTE_CARLO_MAX_PATHS
+
+class VarJobParams(BaseModel):
+    confidence_level: float = Field(0.95, gt=0, lt=1)
+    lookback_days: int = Field(126, gt=10)
+    method: VarMethod = VarMethod.HISTORICAL
+    simulations: int = Field(MONTE_CARLO_DEFAULT_PATHS, ge=1000, le=MONTE_CARLO_MAX_PATHS)
+    distribution: MonteCarloDistribution = MonteCarloDistribution.NORMAL
+    contributions: bool = False
+
+class AnalyticsJobCreate(BaseModel):
+    type: AnalyticsJobType
+    params: Dict[str, Any] = {} # risk_var: VarJobParams fields; stress_test: none
+
+class AnalyticsJobResponse(BaseModel):
+    id: int
+    type: str
+    status: JobStatus
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    result: Optional[Any] = None # Set once status is SUCCEEDED
+    error: Optional[str] = None # Set when status is FAILED
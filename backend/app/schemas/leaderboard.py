@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from app.models.enums import LeaderboardMetric
+import decimal
+
+class LeaderboardEntryResponse(BaseModel):
+    rank: int # 1 = best; ties share a rank
+    username: str
+    portfolio_value: decimal.Decimal
+    total_return: float # Fraction of starting cash
+    valued_at: Optional[datetime] = None
+
+class LeaderboardResponse(BaseModel):
+    metric: LeaderboardMetric
+    entries: List[LeaderboardEntryResponse]
+    me: Optional[LeaderboardEntryResponse] = None # The caller, wherever they rank
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from app.models.enums import TaxLotMethod
+import decimal
+
+class SymbolPnl(BaseModel):
+    symbol: str
+    quantity_held: int
+    quantity_closed: int # Shares sold to date
+    realized_pnl: decimal.Decimal
+    unrealized_pnl: Optional[decimal.Decimal] = None # None when no price is available
+
+class PnlSummary(BaseModel):
+    method: TaxLotMethod # Lot relief method realized P&L was booked with
+    total_realized_pnl: decimal.Decimal
+    total_unrealized_pnl: decimal.Decimal
+    total_pnl: decimal.Decimal
+    symbols: List[SymbolPnl]
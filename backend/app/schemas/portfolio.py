@@ -8,4 +8,5 @@ class Portfolio(BaseModel):
     total_portfolio_value: decimal.Decimal # cash + total holdings value
     total_holdings_value: decimal.Decimal
     total_unrealized_pnl: decimal.Decimal
+    total_realized_pnl: decimal.Decimal = decimal.Decimal("0")
     holdings: List[HoldingResponse]
\ No newline at end of file
@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+from app.models.enums import StressScenarioKind
+
+class StressScenarioResult(BaseModel):
+    name: str
+    kind: StressScenarioKind
+    description: str
+    pnl: float # Change in portfolio value under the scenario (negative = loss)
+    pnl_pct: Optional[float] = None # pnl as a fraction of portfolio_value
+    proxied_value: float = 0.0 # Value of positions whose historical return was estimated from their beta to the benchmark
+    uncovered_value: float = 0.0 # Value of positions with no scenario return (no history or beta); excluded from pnl
+
+class StressTestResponse(BaseModel):
+    as_of: date # Day the scenario matrix was built for
+    portfolio_value: float # Priced holdings, excluding cash
+    results: List[StressScenarioResult]
+    excluded_symbols: List[str] = [] # Holdings without a current price
+
+class StressTestBatchResponse(BaseModel):
+    as_of: date
+    scenarios: List[str]
+    user_ids: List[int]
+    portfolio_values: List[float]
+    pnl: List[List[float]] # One row per user, one column per scenario
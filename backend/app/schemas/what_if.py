@@ -0,0 +1,36 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.schemas.order import OrderCreate
+from app.core.config import WHAT_IF_MAX_ORDERS
+
+class WhatIfRequest(BaseModel):
+    orders: List[OrderCreate] = Field(..., min_length=1, max_length=WHAT_IF_MAX_ORDERS) # Applied in order; limit orders fill at their limit price
+    confidence_level: float = Field(0.95, gt=0, lt=1)
+    lookback_days: int = Field(126, gt=10)
+
+class WhatIfPosition(BaseModel):
+    symbol: str
+    quantity_before: int
+    quantity_after: int
+    current_price: Optional[float] = None # None: no price, left out of values and weights
+    value_before: float = 0.0
+    value_after: float = 0.0
+    weight_before: float = 0.0 # Share of total portfolio value (cash included)
+    weight_after: float = 0.0
+
+class WhatIfRisk(BaseModel):
+    var_amount: float # One-day historical VaR, as a positive loss
+    expected_shortfall: float
+
+class WhatIfResponse(BaseModel):
+    cash_before: float
+    cash_after: float
+    holdings_value_before: float
+    holdings_value_after: float
+    total_value_before: float
+    total_value_after: float # Differs from total_value_before only by limit fills away from the current price
+    positions: List[WhatIfPosition] # Every symbol held before or after, largest value after first
+    confidence_level: float
+    lookback_days: int
+    risk_before: Optional[WhatIfRisk] = None # None when there are no holdings or not enough common history
+    risk_after: Optional[WhatIfRisk] = None
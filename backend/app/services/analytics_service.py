@@ -0,0 +1,224 @@
+from sqlalchemy.orm import Session
+from datetime import date, datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+import math
+import numpy as np
+
+from app.models.user import User
+from app.schemas.analytics import PortfolioAnalytics
+from app.crud import crud_portfolio_analytics_state, crud_portfolio_snapshot
+from app.services import market_data_service
+from app.core.config import ANALYTICS_BENCHMARK_SYMBOL, RISK_FREE_RATE
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def _new_state(user_id: int, day: date, value: float, benchmark_price: Optional[float]) -> Dict[str, Any]:
+    return {
+        "user_id": user_id, "point_count": 0, "first_date": day,
+        "prev_value": None, "prev_benchmark_price": None,
+        "last_date": day, "last_value": value, "last_benchmark_price": benchmark_price,
+        "return_count": 0, "sum_return": 0.0, "sum_sq_return": 0.0, "sum_log_return": 0.0,
+        "paired_count": 0, "sum_paired_return": 0.0, "sum_benchmark_return": 0.0,
+        "sum_sq_benchmark_return": 0.0, "sum_cross_return": 0.0,
+        "peak_value": 0.0, "max_drawdown": 0.0,
+    }
+
+
+def _fold_last(state: Dict[str, Any]):
+    """Moves the latest point into the accumulators, so it becomes the previous point. O(1)."""
+    value, prev = state["last_value"], state["prev_value"]
+    benchmark, prev_benchmark = state["last_benchmark_price"], state["prev_benchmark_price"]
+    if prev is not None and prev > 0 and value > 0:
+        r = value / prev - 1.0
+        state["return_count"] += 1
+        state["sum_return"] += r
+        state["sum_sq_return"] += r * r
+        state["sum_log_return"] += math.log1p(r)
+        if benchmark and prev_benchmark: # Both present and non-zero
+            b = benchmark / prev_benchmark - 1.0
+            state["paired_count"] += 1
+            state["sum_paired_return"] += r
+            state["sum_benchmark_return"] += b
+            state["sum_sq_benchmark_return"] += b * b
+            state["sum_cross_return"] += r * b
+    state["peak_value"] = max(state["peak_value"], value)
+    if state["peak_value"] > 0:
+        state["max_drawdown"] = max(state["max_drawdown"], 1.0 - value / state["peak_value"])
+    state["point_count"] += 1
+    state["prev_value"], state["prev_benchmark_price"] = value, benchmark
+
+
+def _apply_point(state: Dict[str, Any], day: date, value: float, benchmark_price: Optional[float]) -> bool:
+    """
+    Adds a snapshot to the state in place. Returns False for a day before the latest one,
+    which can only be handled by rebuilding from the series.
+    """
+    if day == state["last_date"]:
+        state["last_value"], state["last_benchmark_price"] = value, benchmark_price # Same-day rerun
+        return True
+    if day < state["last_date"]:
+        return False
+    _fold_last(state)
+    state["last_date"], state["last_value"], state["last_benchmark_price"] = day, value, benchmark_price
+    return True
+
+
+def _state_from_series(user_id: int, days: List[date], values: np.ndarray, benchmark: np.ndarray) -> Dict[str, Any]:
+    """
+    Vectorized equivalent of applying every point of a series in order. `benchmark` holds the
+    benchmark close per day, NaN where unknown.
+    """
+    last_benchmark = float(benchmark[-1]) if np.isfinite(benchmark[-1]) else None
+    state = _new_state(user_id, days[0], float(values[-1]), last_benchmark)
+    state["last_date"] = days[-1]
+    folded, folded_benchmark = values[:-1], benchmark[:-1]
+    if len(folded) == 0:
+        return state
+
+    prev, cur = folded[:-1], folded[1:]
+    valid = (prev > 0) & (cur > 0)
+    returns = np.divide(cur, prev, out=np.ones_like(cur), where=valid) - 1.0
+    r = returns[valid]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        benchmark_returns = folded_benchmark[1:] / folded_benchmark[:-1] - 1.0
+    paired = valid & np.isfinite(benchmark_returns) & (folded_benchmark[:-1] != 0) & (folded_benchmark[1:] != 0)
+    pr, pb = returns[paired], benchmark_returns[paired]
+
+    peaks = np.maximum.accumulate(np.maximum(folded, 0.0))
+    drawdowns = np.divide(folded, peaks, out=np.ones_like(folded), where=peaks > 0)
+    state.update({
+        "point_count": len(folded),
+        "prev_value": float(folded[-1]),
+        "prev_benchmark_price": float(folded_benchmark[-1]) if np.isfinite(folded_benchmark[-1]) else None,
+        "return_count": int(len(r)),
+        "sum_return": float(r.sum()),
+        "sum_sq_return": float((r * r).sum()),
+        "sum_log_return": float(np.log1p(r).sum()),
+        "paired_count": int(len(pr)),
+        "sum_paired_return": float(pr.sum()),
+        "sum_benchmark_return": float(pb.sum()),
+        "sum_sq_benchmark_return": float((pb * pb).sum()),
+        "sum_cross_return": float((pr * pb).sum()),
+        "peak_value": float(peaks[-1]),
+        "max_drawdown": float(max(0.0, (1.0 - drawdowns).max())),
+    })
+    return state
+
+
+def _benchmark_closes(since: date, today_price: Optional[float] = None) -> Dict[date, float]:
+    """Daily benchmark closes from `since` on, plus today's price when given."""
+    span_days = (datetime.now(timezone.utc).date() - since).days
+    lookback = max(30, int(span_days * TRADING_DAYS_PER_YEAR / 365) + 10)
+    closes: Dict[date, float] = {}
+    history = market_data_service.get_historical_data(ANALYTICS_BENCHMARK_SYMBOL, lookback_days=lookback)
+    if history is None or history.empty:
+        logger.warning(f"No {ANALYTICS_BENCHMARK_SYMBOL} history for analytics since {since}; beta will be limited to new days.")
+    else:
+        for timestamp, close in history["adjusted_close"].items():
+            closes[timestamp.date()] = float(close)
+    if today_price is not None:
+        closes[datetime.now(timezone.utc).date()] = float(today_price)
+    return closes
+
+
+def _rebuild_states(db: Session, user_ids: List[int], today_benchmark_price: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Full-history states for the given users from their snapshot series. One query plus one benchmark fetch."""
+    rows = crud_portfolio_snapshot.get_snapshot_series_for_users(db=db, user_ids=user_ids)
+    if not rows:
+        return []
+    series: Dict[int, Tuple[List[date], List[float]]] = {}
+    for user_id, day, value in rows:
+        days, values = series.setdefault(user_id, ([], []))
+        days.append(day)
+        values.append(float(value))
+
+    closes = _benchmark_closes(min(days[0] for days, _ in series.values()), today_benchmark_price)
+    states = []
+    for user_id, (days, values) in series.items():
+        benchmark = np.array([closes.get(day, np.nan) for day in days], dtype=np.float64)
+        states.append(_state_from_series(user_id, days, np.array(values, dtype=np.float64), benchmark))
+    logger.info(f"Rebuilt analytics state for {len(states)} users from {len(rows)} snapshots.")
+    return states
+
+
+def update_analytics_states(db: Session, snapshot_date: date, values: Dict[int, float]) -> int:
+    """
+    Folds the day's snapshot values into every user's running statistics. Users without a state,
+    or whose state is ahead of snapshot_date, are rebuilt from their series instead.
+    Does NOT commit. Returns the number of states written.
+    """
+    if not values:
+        return 0
+    benchmark_price = market_data_service.get_current_price(ANALYTICS_BENCHMARK_SYMBOL)
+    states = crud_portfolio_analytics_state.get_all_states(db=db)
+
+    updated: List[Dict[str, Any]] = []
+    to_rebuild: List[int] = []
+    for user_id, value in values.items():
+        state = states.get(user_id)
+        if state is not None and _apply_point(state, snapshot_date, value, benchmark_price):
+            updated.append(state)
+        else:
+            to_rebuild.append(user_id)
+    if to_rebuild:
+        updated.extend(_rebuild_states(db=db, user_ids=to_rebuild, today_benchmark_price=benchmark_price))
+
+    written = crud_portfolio_analytics_state.upsert_states(db=db, states=updated)
+    logger.info(f"Updated analytics state for {written} users ({len(to_rebuild)} rebuilt from history).")
+    return written
+
+
+def _metrics(state: Dict[str, Any]) -> PortfolioAnalytics:
+    """Analytics from the running sums, with the latest point folded into a copy. O(1)."""
+    state = dict(state)
+    _fold_last(state)
+    result = PortfolioAnalytics(
+        as_of=state["last_date"],
+        observations=state["point_count"],
+        max_drawdown=state["max_drawdown"],
+        benchmark_symbol=ANALYTICS_BENCHMARK_SYMBOL,
+        risk_free_rate=RISK_FREE_RATE
+    )
+    n = state["return_count"]
+    if n == 0:
+        return result
+    result.time_weighted_return = math.expm1(state["sum_log_return"])
+    if n > 1:
+        mean = state["sum_return"] / n
+        variance = max(0.0, (state["sum_sq_return"] - n * mean * mean) / (n - 1))
+        std = math.sqrt(variance)
+        result.annualized_volatility = std * math.sqrt(TRADING_DAYS_PER_YEAR)
+        if std > 0:
+            daily_risk_free = RISK_FREE_RATE / TRADING_DAYS_PER_YEAR
+            result.sharpe_ratio = (mean - daily_risk_free) / std * math.sqrt(TRADING_DAYS_PER_YEAR)
+
+    m = state["paired_count"]
+    if m > 1:
+        mean_r = state["sum_paired_return"] / m
+        mean_b = state["sum_benchmark_return"] / m
+        covariance = (state["sum_cross_return"] - m * mean_r * mean_b) / (m - 1)
+        benchmark_variance = (state["sum_sq_benchmark_return"] - m * mean_b * mean_b) / (m - 1)
+        if benchmark_variance > 0:
+            result.beta = covariance / benchmark_variance
+    return result
+
+
+def get_analytics(db: Session, user: User) -> PortfolioAnalytics:
+    """
+    Time-weighted return, volatility, Sharpe, max drawdown and beta over the user's snapshot
+    history, served from the running state. A user without state (e.g. history older than the
+    state table) is rebuilt from the series once and the state is saved.
+    """
+    state = crud_portfolio_analytics_state.get_state(db=db, user_id=user.id)
+    if state is None:
+        rebuilt = _rebuild_states(db=db, user_ids=[user.id])
+        if not rebuilt:
+            return PortfolioAnalytics(observations=0, benchmark_symbol=ANALYTICS_BENCHMARK_SYMBOL, risk_free_rate=RISK_FREE_RATE)
+        state = rebuilt[0]
+        crud_portfolio_analytics_state.upsert_states(db=db, states=[state])
+        db.commit()
+    return _metrics(state)
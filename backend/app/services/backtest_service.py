@@ -0,0 +1,269 @@
+import heapq
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.models.enums import OrderType
+from app.services import market_data_service
+from app.services.trading_service import limit_order_triggered
+
+logger = logging.getLogger(__name__)
+
+# strategy(step, bar_time, prices, positions, cash) -> orders to place at this bar.
+# bar_time is a UTC np.datetime64; prices/positions are per-symbol arrays for the bar.
+# Orders are anything with symbol / quantity / order_type / limit_price attributes (e.g. OrderCreate).
+Strategy = Callable[[int, np.datetime64, np.ndarray, np.ndarray, float], Optional[Iterable[Any]]]
+
+
+@dataclass
+class BacktestRun:
+    """Result of a backtest. Paths are indexed by bar; positions is bars x symbols."""
+    timestamps: pd.DatetimeIndex
+    symbols: List[str]
+    cash: np.ndarray
+    positions: np.ndarray
+    equity: np.ndarray
+    trades: List[Dict[str, Any]] = field(default_factory=list)
+    rejected_orders: List[Dict[str, Any]] = field(default_factory=list)
+    open_limit_orders: int = 0
+
+
+@dataclass
+class _LimitOrder:
+    seq: int
+    symbol_idx: int
+    order_type: OrderType
+    quantity: int
+    limit_price: float
+    trigger_steps: np.ndarray # Bars (absolute indexes) where the limit condition holds
+    filled: bool = False
+
+
+def load_price_matrix(symbols: Sequence[str], lookback_days: int) -> Tuple[pd.DatetimeIndex, List[str], np.ndarray]:
+    """
+    Fetches daily bars for each symbol and aligns closes into a bars x symbols matrix.
+    Gaps are forward-filled; bars before a symbol's first close stay NaN.
+    Symbols without data are dropped.
+    """
+    closes: Dict[str, pd.Series] = {}
+    for symbol in dict.fromkeys(s.upper() for s in symbols):
+        hist_df = market_data_service.get_historical_data(symbol, lookback_days=lookback_days)
+        if hist_df is None or hist_df.empty or 'adjusted_close' not in hist_df.columns:
+            logger.warning(f"Backtest: no historical data for {symbol}. Excluding.")
+            continue
+        closes[symbol] = hist_df['adjusted_close']
+
+    if not closes:
+        return pd.DatetimeIndex([]), [], np.empty((0, 0))
+
+    price_df = pd.concat(closes, axis=1, join='outer').sort_index().ffill()
+    return price_df.index, list(price_df.columns), price_df.to_numpy(dtype=np.float64)
+
+
+def run_backtest(
+    timestamps: pd.DatetimeIndex,
+    symbols: List[str],
+    closes: np.ndarray,
+    orders: Iterable[Any] = (),
+    strategy: Optional[Strategy] = None,
+    initial_cash: float = 100000.0,
+) -> BacktestRun:
+    """
+    Replays orders (each with a `date`) and/or a strategy callback over a close-price matrix.
+
+    Fill rules follow trading_service:
+    - Market orders fill at the bar's close, rejected on insufficient funds/shares.
+    - Limit orders are validated on placement like place_order (cash at limit price / shares held),
+      then fill at their limit price on the first bar where limit_order_triggered holds.
+      A triggered order that can't be funded stays pending, as in _check_and_execute_logic.
+
+    Without a strategy only bars with new orders or triggered limits are visited, so long
+    histories cost time proportional to the number of events, not bars.
+    """
+    n_steps, n_symbols = closes.shape
+    symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+    bar_times = timestamps.values # Plain datetime64 avoids boxing a Timestamp per bar
+
+    cash_path = np.empty(n_steps, dtype=np.float64)
+    positions_path = np.empty((n_steps, n_symbols), dtype=np.int64)
+    cash = float(initial_cash)
+    positions = np.zeros(n_symbols, dtype=np.int64)
+
+    trades: List[Dict[str, Any]] = []
+    rejected: List[Dict[str, Any]] = []
+
+    def reject(step: Optional[int], order: Any, reason: str):
+        rejected.append({
+            "timestamp": timestamps[step].to_pydatetime() if step is not None else None,
+            "symbol": order.symbol.upper(),
+            "order_type": OrderType(order.order_type).value,
+            "quantity": int(order.quantity),
+            "reason": reason,
+        })
+
+    # Bucket the order stream by the bar it is placed on
+    orders_by_step: Dict[int, List[Any]] = {}
+    if len(timestamps):
+        bar_dates = bar_times.astype('datetime64[D]')
+        for order in orders:
+            order_date = order.date.date() if isinstance(order.date, datetime) else order.date
+            step = int(np.searchsorted(bar_dates, np.datetime64(order_date, 'D'), side='left'))
+            if step >= n_steps:
+                reject(None, order, "Order date is after the last available bar.")
+                continue
+            orders_by_step.setdefault(step, []).append(order)
+    else:
+        for order in orders:
+            reject(None, order, "No price data available.")
+
+    limit_orders: List[_LimitOrder] = []
+    trigger_heap: List[Tuple[int, int]] = [] # (step, seq) of the next bar each open limit order triggers on
+
+    def schedule_next_trigger(limit_order: _LimitOrder, after_step: int):
+        steps = limit_order.trigger_steps
+        next_idx = int(np.searchsorted(steps, after_step, side='right'))
+        if next_idx < len(steps):
+            heapq.heappush(trigger_heap, (int(steps[next_idx]), limit_order.seq))
+
+    def fill(step: int, symbol_idx: int, order_type: OrderType, quantity: int, price: float) -> Optional[str]:
+        """Applies a fill. Returns a rejection reason instead if funds/shares are insufficient."""
+        nonlocal cash
+        is_buy = order_type in (OrderType.MARKET_BUY, OrderType.LIMIT_BUY)
+        if is_buy:
+            cost = price * quantity
+            if cash < cost:
+                return "Insufficient funds at time of execution."
+            cash -= cost
+            positions[symbol_idx] += quantity
+        else:
+            if positions[symbol_idx] < quantity:
+                return "Insufficient shares at time of execution."
+            cash += price * quantity
+            positions[symbol_idx] -= quantity
+        trades.append({
+            "timestamp": timestamps[step].to_pydatetime(),
+            "symbol": symbols[symbol_idx],
+            "trade_type": "BUY" if is_buy else "SELL",
+            "quantity": quantity,
+            "price": price,
+            "order_type": order_type.value,
+        })
+        return None
+
+    def place(step: int, order: Any):
+        symbol_idx = symbol_index.get(order.symbol.upper())
+        if symbol_idx is None:
+            reject(step, order, f"No price data for {order.symbol.upper()}.")
+            return
+        order_type = OrderType(order.order_type)
+        quantity = int(order.quantity)
+        price = closes[step, symbol_idx]
+
+        if order_type in (OrderType.MARKET_BUY, OrderType.MARKET_SELL):
+            if np.isnan(price):
+                reject(step, order, f"Market price for {symbols[symbol_idx]} unavailable.")
+                return
+            reason = fill(step, symbol_idx, order_type, quantity, float(price))
+            if reason:
+                reject(step, order, reason)
+            return
+
+        limit_price = float(order.limit_price)
+        if order_type == OrderType.LIMIT_BUY and cash < limit_price * quantity:
+            reject(step, order, "Insufficient funds to place limit buy.")
+            return
+        if order_type == OrderType.LIMIT_SELL and positions[symbol_idx] < quantity:
+            reject(step, order, "Insufficient shares to place limit sell.")
+            return
+
+        # NaN closes compare False, so bars without a price never trigger
+        with np.errstate(invalid='ignore'):
+            mask = limit_order_triggered(order_type, closes[step:, symbol_idx], limit_price)
+        limit_order = _LimitOrder(
+            seq=len(limit_orders), symbol_idx=symbol_idx, order_type=order_type,
+            quantity=quantity, limit_price=limit_price, trigger_steps=step + np.flatnonzero(mask)
+        )
+        limit_orders.append(limit_order)
+        schedule_next_trigger(limit_order, step - 1)
+
+    def visit(step: int):
+        # 1. Orders placed on this bar, in submission order
+        for order in orders_by_step.get(step, ()):
+            place(step, order)
+        if strategy is not None:
+            strategy_orders = strategy(step, bar_times[step], closes[step], positions.copy(), cash)
+            for order in strategy_orders or ():
+                place(step, order)
+
+        # 2. Open limit orders whose condition holds on this bar, oldest first
+        if not trigger_heap or trigger_heap[0][0] != step:
+            return
+        due: List[int] = []
+        while trigger_heap and trigger_heap[0][0] == step:
+            due.append(heapq.heappop(trigger_heap)[1])
+        for seq in sorted(due):
+            limit_order = limit_orders[seq]
+            reason = fill(step, limit_order.symbol_idx, limit_order.order_type, limit_order.quantity, limit_order.limit_price)
+            if reason:
+                schedule_next_trigger(limit_order, step) # Stays pending, like a failed live execution
+            else:
+                limit_order.filled = True
+
+    order_steps = sorted(orders_by_step)
+    next_order_idx = 0
+    last_recorded = -1
+    step = 0
+    while step < n_steps:
+        if strategy is None:
+            # Jump to the next bar with a new order or a triggered limit order
+            while next_order_idx < len(order_steps) and order_steps[next_order_idx] < step:
+                next_order_idx += 1
+            next_order_step = order_steps[next_order_idx] if next_order_idx < len(order_steps) else n_steps
+            next_trigger_step = trigger_heap[0][0] if trigger_heap else n_steps
+            step = min(next_order_step, next_trigger_step)
+            if step >= n_steps:
+                break
+
+        if step > last_recorded + 1: # State is unchanged between visited bars
+            cash_path[last_recorded + 1:step] = cash
+            positions_path[last_recorded + 1:step] = positions
+        visit(step)
+        cash_path[step] = cash
+        positions_path[step] = positions
+        last_recorded = step
+        step += 1
+
+    cash_path[last_recorded + 1:] = cash
+    positions_path[last_recorded + 1:] = positions
+
+    valuation_prices = np.nan_to_num(closes, nan=0.0)
+    equity = cash_path + (positions_path * valuation_prices).sum(axis=1)
+    open_limit_orders = sum(1 for lo in limit_orders if not lo.filled)
+
+    logger.info(f"Backtest finished: {n_steps} bars x {n_symbols} symbols, {len(trades)} trades, {len(rejected)} rejected orders.")
+    return BacktestRun(
+        timestamps=timestamps,
+        symbols=symbols,
+        cash=cash_path,
+        positions=positions_path,
+        equity=equity,
+        trades=trades,
+        rejected_orders=rejected,
+        open_limit_orders=open_limit_orders,
+    )
+
+
+def backtest_symbols(
+    symbols: Sequence[str],
+    lookback_days: int,
+    orders: Iterable[Any] = (),
+    strategy: Optional[Strategy] = None,
+    initial_cash: float = 100000.0,
+) -> BacktestRun:
+    """Loads historical closes for the symbols and runs the backtest. No DB access."""
+    timestamps, valid_symbols, closes = load_price_matrix(symbols, lookback_days)
+    return run_backtest(timestamps, valid_symbols, closes, orders=orders, strategy=strategy, initial_cash=initial_cash)
@@ -0,0 +1,228 @@
+"""
+EWMA covariance and correlation of daily returns across the held-symbol universe.
+
+The estimate follows the RiskMetrics recursion S <- decay * S + (1 - decay) * r r', so each new
+daily bar costs O(symbols^2) instead of recomputing over the whole window. It is seeded from the
+shared returns panel, advanced by the panel's new rows once a day and persisted, so restarts pick
+up where the last process stopped. Parametric and Monte Carlo VaR read their covariance from it.
+"""
+from sqlalchemy.orm import Session
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import threading
+import numpy as np
+
+from app.db.session import SessionLocal
+from app.models.user import User
+from app.crud import crud_ewma_covariance_state, crud_holding
+from app.schemas.correlation import CorrelationMatrixResponse
+from app.services import returns_panel_service
+from app.services.returns_panel_service import ReturnsPanel
+from app.core.config import EWMA_DECAY, RETURNS_PANEL_LOOKBACK_DAYS
+
+logger = logging.getLogger(__name__)
+
+MIN_EWMA_OBSERVATIONS = 30 # Joint daily returns a pair needs at seeding; fewer leaves it NaN
+
+
+@dataclass
+class EwmaState:
+    symbols: List[str]
+    covariance: np.ndarray # (symbols, symbols), NaN for pairs without enough joint history
+    last_bar_date: Optional[date]
+    observations: int
+    column: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.column = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _weighted_covariance(returns: np.ndarray, columns: np.ndarray, decay: float) -> np.ndarray:
+    """
+    EWMA covariance of every column of `returns` with every column of `columns` (same days) in one
+    weighted product, O(symbols * columns * days). Pairs use the days both symbols have a return;
+    weights are normalized over those days.
+    """
+    has_return, column_has_return = ~np.isnan(returns), ~np.isnan(columns)
+    filled, column_filled = np.where(has_return, returns, 0.0), np.where(column_has_return, columns, 0.0)
+    weights = (1.0 - decay) * decay ** np.arange(len(returns) - 1, -1, -1, dtype=np.float64) # Newest day weighs most
+    mask, column_mask = has_return.astype(np.float64), column_has_return.astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariance = ((filled * weights[:, None]).T @ column_filled) / ((mask * weights[:, None]).T @ column_mask)
+    covariance[(mask.T @ column_mask) < MIN_EWMA_OBSERVATIONS] = np.nan
+    return covariance
+
+
+def _seed(panel: ReturnsPanel, decay: float) -> EwmaState:
+    """EWMA covariance over the whole panel, O(symbols^2 * days)."""
+    covariance = _weighted_covariance(panel.returns, panel.returns, decay)
+    last_bar_date = panel.dates[-1].item() if len(panel.dates) else None
+    return EwmaState(symbols=list(panel.symbols), covariance=covariance, last_bar_date=last_bar_date, observations=len(panel.returns))
+
+
+def _reseed_symbols(state: EwmaState, panel: ReturnsPanel, symbols: List[str], decay: float) -> EwmaState:
+    """
+    A state where `symbols` (new ones appended) get their rows and columns from the panel, seeded
+    as _seed would, and every other pair keeps its running estimate. O(symbols * len(symbols) * days).
+    The state must already be advanced to the panel's last bar.
+    """
+    all_symbols = state.symbols + [symbol for symbol in symbols if symbol not in state.column]
+    n_old = len(state.symbols)
+    covariance = np.full((len(all_symbols), len(all_symbols)), np.nan)
+    covariance[:n_old, :n_old] = state.covariance
+    returns = np.full((len(panel.dates), len(all_symbols)), np.nan)
+    in_panel = [i for i, symbol in enumerate(all_symbols) if symbol in panel.column]
+    returns[:, in_panel] = panel.returns[:, panel.columns_for([all_symbols[i] for i in in_panel])]
+    reseeded = [all_symbols.index(symbol) for symbol in symbols]
+    block = _weighted_covariance(returns, returns[:, reseeded], decay)
+    covariance[:, reseeded] = block
+    covariance[reseeded, :] = block.T
+    return EwmaState(symbols=all_symbols, covariance=covariance, last_bar_date=state.last_bar_date, observations=state.observations)
+
+
+def _advance(state: EwmaState, returns: np.ndarray, decay: float):
+    """Folds one day's returns (aligned to state.symbols, NaN where missing) into the state in place. O(symbols^2)."""
+    has_return = ~np.isnan(returns)
+    r = np.where(has_return, returns, 0.0)
+    pairs = np.outer(has_return, has_return)
+    state.covariance = np.where(pairs, decay * state.covariance + (1.0 - decay) * np.outer(r, r), state.covariance)
+    state.observations += 1
+
+
+def _advance_from_panel(state: EwmaState, panel: ReturnsPanel, decay: float) -> int:
+    """Folds the panel's rows after state.last_bar_date into the state. Returns the number of days added."""
+    new_rows = np.flatnonzero(panel.dates > np.datetime64(state.last_bar_date, "D"))
+    if len(new_rows) == 0:
+        return 0
+    in_panel = [symbol for symbol in state.symbols if symbol in panel.column]
+    state_columns = [state.column[symbol] for symbol in in_panel]
+    panel_columns = panel.columns_for(in_panel)
+    for row in new_rows:
+        returns = np.full(len(state.symbols), np.nan)
+        returns[state_columns] = panel.returns[row, panel_columns]
+        _advance(state, returns, decay)
+    state.last_bar_date = panel.dates[new_rows[-1]].item()
+    return len(new_rows)
+
+
+def _load(db: Session, decay: float) -> Optional[EwmaState]:
+    row = crud_ewma_covariance_state.get_state(db=db, decay=decay)
+    if row is None:
+        return None
+    symbols = json.loads(row.symbols)
+    covariance = np.frombuffer(row.covariance, dtype=np.float64).reshape(len(symbols), len(symbols)).copy()
+    return EwmaState(symbols=symbols, covariance=covariance, last_bar_date=row.last_bar_date, observations=row.observations)
+
+
+def _save(state: EwmaState, decay: float):
+    """Persists the state in a session of its own, so callers' pending work is never committed with it."""
+    db = SessionLocal()
+    try:
+        crud_ewma_covariance_state.upsert_state(db=db, state={
+            "decay": decay,
+            "symbols": json.dumps(state.symbols),
+            "covariance": np.ascontiguousarray(state.covariance, dtype=np.float64).tobytes(),
+            "last_bar_date": state.last_bar_date,
+            "observations": state.observations,
+        })
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Could not persist the EWMA covariance state: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+_state: Optional[EwmaState] = None
+_checked_for: Optional[date] = None
+_state_lock = threading.Lock() # Guards _state; never held while fetching history
+
+
+def refresh(db: Session, symbols: Iterable[str] = ()) -> EwmaState:
+    """
+    Brings the EWMA state up to date with the shared returns panel: new daily rows are folded in
+    incrementally, and symbols that join the universe (or lacked an estimate and may now have
+    enough history) get their rows and columns seeded from the panel. Saves the state when it
+    changed. The panel is fetched before the lock is taken; the state is updated on a copy and
+    swapped in, so readers never see it half advanced.
+    """
+    global _state, _checked_for
+    symbols = {symbol.upper() for symbol in symbols}
+    panel = returns_panel_service.get_panel(db=db, symbols=symbols, lookback_days=RETURNS_PANEL_LOOKBACK_DAYS)
+    with _state_lock:
+        loaded = _state if _state is not None else _load(db, EWMA_DECAY)
+        if loaded is None or loaded.last_bar_date is None:
+            state = _seed(panel, EWMA_DECAY)
+            logger.info(f"Seeded EWMA covariance for {len(state.symbols)} symbols from {state.observations} days.")
+            changed = True
+        else:
+            state = EwmaState(symbols=list(loaded.symbols), covariance=loaded.covariance.copy(),
+                              last_bar_date=loaded.last_bar_date, observations=loaded.observations)
+            added = _advance_from_panel(state, panel, EWMA_DECAY)
+            if added:
+                logger.info(f"Advanced EWMA covariance for {len(state.symbols)} symbols by {added} days.")
+            to_seed = [symbol for symbol in panel.symbols if symbol not in state.column]
+            if added:
+                to_seed += [symbol for symbol in sorted(symbols) if symbol in state.column
+                            and np.isnan(state.covariance[state.column[symbol], state.column[symbol]])]
+            if to_seed:
+                state = _reseed_symbols(state, panel, to_seed, EWMA_DECAY)
+                logger.info(f"Seeded EWMA covariance rows for {len(to_seed)} symbols: {to_seed[:20]}")
+            changed = bool(added or to_seed)
+        if changed:
+            _save(state, EWMA_DECAY)
+        _state, _checked_for = state, _today()
+    return state
+
+
+def _current(db: Session, symbols: Iterable[str]) -> EwmaState:
+    """The in-process state, refreshed at most once a day unless new symbols are asked for."""
+    symbols = {symbol.upper() for symbol in symbols}
+    state = _state
+    if state is None or _checked_for != _today() or not symbols <= set(state.symbols):
+        state = refresh(db, symbols)
+    return state
+
+
+def get_covariance(db: Session, symbols: List[str]) -> Tuple[Optional[np.ndarray], Optional[date]]:
+    """
+    (EWMA covariance of daily returns in the order of `symbols`, last bar date), or (None, None)
+    when any symbol has no estimate yet.
+    """
+    state = _current(db, symbols)
+    if not all(symbol.upper() in state.column for symbol in symbols):
+        return None, None
+    columns = [state.column[symbol.upper()] for symbol in symbols]
+    covariance = state.covariance[np.ix_(columns, columns)]
+    if np.isnan(covariance).any():
+        return None, None
+    return covariance, state.last_bar_date
+
+
+def get_correlation(db: Session, user: User) -> CorrelationMatrixResponse:
+    """EWMA volatilities and correlations of the user's held symbols."""
+    held = sorted({holding.symbol.upper() for holding in crud_holding.get_all_holdings(db=db, user_id=user.id)})
+    state = _current(db, held)
+    symbols = [s for s in held if s in state.column and np.isfinite(state.covariance[state.column[s], state.column[s]])]
+    columns = [state.column[s] for s in symbols]
+    covariance = state.covariance[np.ix_(columns, columns)]
+    volatilities = np.sqrt(np.clip(np.diag(covariance), 0.0, None))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.clip(covariance / np.outer(volatilities, volatilities), -1.0, 1.0)
+    correlation = np.where(np.isfinite(correlation), correlation, 0.0)
+    np.fill_diagonal(correlation, 1.0)
+    return CorrelationMatrixResponse(
+        as_of=state.last_bar_date,
+        decay=EWMA_DECAY,
+        symbols=symbols,
+        volatilities=volatilities.tolist(),
+        correlation=correlation.tolist(),
+        excluded_symbols=[s for s in held if s not in symbols]
+    )
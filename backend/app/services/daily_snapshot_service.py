@@ -1,12 +1,16 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, distinct
+from sqlalchemy import select
 from datetime import datetime, timezone, time
+from typing import Any, Callable, Dict, List, Tuple
+import decimal
 import logging
+import pandas as pd
 
 from app.db.session import SessionLocal
-from app.crud import crud_user, crud_portfolio_snapshot, crud_holding
-from app.services import portfolio_service
+from app.crud import crud_portfolio_snapshot, crud_user, crud_account
+from app.services import market_data_service, value_history_service, analytics_service, leaderboard_service
 from app.models.holding import Holding
+from app.models.account import Account
 
 logger = logging.getLogger(__name__)
 
@@ -19,55 +23,153 @@ def _get_end_of_day_timestamp() -> datetime:
     return now_utc.replace(hour=eod_time.hour, minute=eod_time.minute, second=eod_time.second, microsecond=eod_time.microsecond)
 
 
-def generate_daily_snapshots_for_relevant_users(db: Session):
+def _value_users_with_holdings(db: Session) -> pd.DataFrame:
     """
-    Generates end-of-day portfolio snapshots for all users who currently have holdings.
+    Values every user with holdings in one pass: one query for all holdings joined with cash,
+    one batched price fetch for the distinct symbols, then a groupby per user.
+    Returns a frame indexed by user_id with 'cash', 'holdings_value' and 'total_value'
+    (NaN cash = no account row).
     """
-    logger.info("Starting daily portfolio snapshot generation...")
-    processed_users = 0
-    failed_users = 0
+    rows = db.execute(
+        select(Holding.user_id, Holding.symbol, Holding.quantity, Account.cash_balance)
+        .outerjoin(Account, Account.user_id == Holding.user_id)
+    ).all()
+    holdings = pd.DataFrame(rows, columns=["user_id", "symbol", "quantity", "cash"])
+    if holdings.empty:
+        return pd.DataFrame(columns=["cash", "holdings_value", "total_value"], index=pd.Index([], name="user_id"))
 
-    # 1. Get all unique user_ids that have any holdings
-    user_ids_with_holdings_stmt = select(distinct(Holding.user_id))
-    user_ids_result = db.execute(user_ids_with_holdings_stmt).fetchall()
-    user_ids = [uid[0] for uid in user_ids_result]
+    symbols = holdings["symbol"].unique().tolist()
+    logger.info(f"Fetching current prices for {len(symbols)} distinct symbols...")
+    prices = market_data_service.get_current_prices(symbols)
+    missing_prices = [symbol for symbol in symbols if prices.get(symbol.upper()) is None]
+    if missing_prices:
+        # Same as the live portfolio view: holdings without a price count for nothing
+        logger.warning(f"No current price for {len(missing_prices)} symbols; excluded from snapshot values: {missing_prices[:20]}")
 
-    if not user_ids:
-        logger.info("No users with holdings found. No snapshots to generate.")
-        return {"processed": 0, "failed": 0, "total_users_with_holdings": 0}
+    holdings["price"] = holdings["symbol"].str.upper().map(prices).astype(float)
+    holdings["value"] = holdings["quantity"].to_numpy(dtype=float) * holdings["price"].fillna(0.0).to_numpy()
+    holdings["cash"] = holdings["cash"].astype(float)
 
-    logger.info(f"Found {len(user_ids)} users with holdings. Generating snapshots...")
-    eod_timestamp = _get_end_of_day_timestamp()
+    per_user = holdings.groupby("user_id", sort=True).agg(cash=("cash", "first"), holdings_value=("value", "sum"))
+    per_user["total_value"] = per_user["cash"] + per_user["holdings_value"]
+    return per_user[["cash", "holdings_value", "total_value"]]
 
+
+def _create_missing_accounts(db: Session, user_ids: List[int]) -> Tuple[Dict[int, float], List[int]]:
+    """
+    Creates the account (default cash) of users who have holdings but no account row, as the live
+    portfolio view does. Returns ({user_id: cash}, user_ids that could not be given an account).
+    """
+    cash: Dict[int, float] = {}
+    failed: List[int] = []
     for user_id in user_ids:
         try:
             user = crud_user.get_user(db=db, user_id=user_id)
             if not user:
                 logger.warning(f"User with ID {user_id} found in holdings but not in users table. Skipping.")
-                failed_users +=1
+                failed.append(user_id)
                 continue
+            cash[user_id] = float(crud_account.get_or_create_account(db=db, user=user).cash_balance) # Commits
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to create account for user {user_id}: {e}", exc_info=True)
+            failed.append(user_id)
+    return cash, failed
+
+
+def _write_snapshots(db: Session, snapshot_rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Upserts and commits today's snapshots in one statement. If the batch fails, retries user by
+    user so one bad row only costs that user's snapshot. Returns the user_ids that failed.
+    """
+    try:
+        crud_portfolio_snapshot.upsert_portfolio_snapshots(db=db, snapshots=snapshot_rows)
+        db.commit()
+        return []
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Batched snapshot upsert failed ({e}); retrying user by user.")
 
-            current_portfolio_details = portfolio_service.get_portfolio(db=db, user=user)
-            total_value = current_portfolio_details.total_portfolio_value
-
-            # Create the snapshot with a specific EOD timestamp
-            crud_portfolio_snapshot.create_portfolio_snapshot(
-                db=db,
-                user_id=user.id,
-                total_value=total_value,
-                snapshot_timestamp=eod_timestamp
-            )
-            # Commit for each user to isolate failures
+    failed: List[int] = []
+    for row in snapshot_rows:
+        try:
+            crud_portfolio_snapshot.upsert_portfolio_snapshots(db=db, snapshots=[row])
             db.commit()
-            logger.info(f"Successfully created EOD snapshot for user {user.id}. Value: {total_value:.2f}")
-            processed_users += 1
         except Exception as e:
             db.rollback()
-            logger.error(f"Failed to create EOD snapshot for user {user_id}: {e}", exc_info=True)
-            failed_users += 1
+            logger.error(f"Failed to create EOD snapshot for user {row['user_id']}: {e}", exc_info=True)
+            failed.append(row["user_id"])
+    return failed
+
+
+def _run_follow_up(db: Session, name: str, update: Callable[[], Any]) -> bool:
+    """Runs one update derived from the committed snapshots in its own transaction."""
+    try:
+        update()
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Snapshot follow-up '{name}' failed; snapshots are unaffected: {e}", exc_info=True)
+        return False
+
+
+def generate_daily_snapshots_for_relevant_users(db: Session):
+    """
+    Generates end-of-day portfolio snapshots for all users who currently have holdings.
+    Set-based: the number of DB and market data round trips depends on the number of
+    distinct symbols, not on the number of users.
+    """
+    logger.info("Starting daily portfolio snapshot generation...")
+
+    per_user = _value_users_with_holdings(db)
+    if per_user.empty:
+        logger.info("No users with holdings found. No snapshots to generate.")
+        _run_follow_up(db, "leaderboard", lambda: leaderboard_service.record_snapshot_values(
+            db=db, values={}, valued_at=_get_end_of_day_timestamp()
+        ))
+        return {"processed": 0, "failed": 0, "total_users_with_holdings": 0, "failed_updates": []}
+
+    total_users = len(per_user)
+    failed_user_ids: List[int] = []
+    missing_accounts = per_user["cash"].isna()
+    if missing_accounts.any():
+        logger.info(f"Creating accounts for {int(missing_accounts.sum())} users with holdings but no account row.")
+        created_cash, failed_accounts = _create_missing_accounts(db, per_user.index[missing_accounts].tolist())
+        failed_user_ids.extend(failed_accounts)
+        per_user.loc[list(created_cash), "cash"] = pd.Series(created_cash, dtype=float)
+        per_user["total_value"] = per_user["cash"] + per_user["holdings_value"]
+    valued = per_user[per_user["cash"].notna()]
+
+    logger.info(f"Found {total_users} users with holdings. Generating snapshots...")
+    eod_timestamp = _get_end_of_day_timestamp()
+    snapshot_date = eod_timestamp.date()
+    snapshot_rows = [
+        {"user_id": int(user_id), "snapshot_date": snapshot_date,
+         "total_value": decimal.Decimal(f"{total_value:.4f}"), "timestamp": eod_timestamp}
+        for user_id, total_value in zip(valued.index.to_numpy(), valued["total_value"].to_numpy())
+    ]
+    # Upsert: a second run on the same day (scheduler + manual trigger) refreshes today's rows.
+    # Snapshots are committed first; each update derived from them runs in its own transaction.
+    failed_snapshots = set(_write_snapshots(db, snapshot_rows))
+    failed_user_ids.extend(failed_snapshots)
+    snapshot_values = {row["user_id"]: float(row["total_value"]) for row in snapshot_rows if row["user_id"] not in failed_snapshots}
+
+    failed_updates = [
+        name for name, update in (
+            ("value_rollups", lambda: value_history_service.refresh_rollups(db=db, as_of=snapshot_date)),
+            ("analytics_states", lambda: analytics_service.update_analytics_states(db=db, snapshot_date=snapshot_date, values=snapshot_values)),
+            ("leaderboard", lambda: leaderboard_service.record_snapshot_values(db=db, values=snapshot_values, valued_at=eod_timestamp)),
+        )
+        if not _run_follow_up(db, name, update)
+    ]
 
-    logger.info(f"Daily snapshot generation complete. Processed: {processed_users}, Failed: {failed_users}, Total users with holdings: {len(user_ids)}")
-    return {"processed": processed_users, "failed": failed_users, "total_users_with_holdings": len(user_ids)}
+    processed_users = len(snapshot_values)
+    failed_users = len(failed_user_ids)
+    logger.info(f"Daily snapshot generation complete. Processed: {processed_users}, Failed: {failed_users}, Total users with holdings: {total_users}")
+    if failed_user_ids:
+        logger.warning(f"Users without a snapshot today: {sorted(failed_user_ids)[:20]}")
+    return {"processed": processed_users, "failed": failed_users, "total_users_with_holdings": total_users, "failed_updates": failed_updates}
 
 
 def daily_snapshot_job():
@@ -0,0 +1,119 @@
+"""
+Streaming CSV/NDJSON exports of trade and value history.
+
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE (yield_per) and
+encoded batch by batch, so memory stays flat however long the history is. The generators
+open their own session: the request's session is closed before a StreamingResponse body is sent.
+"""
+import csv
+import enum
+import io
+import logging
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Sequence
+
+import orjson
+
+from app.db.session import SessionLocal
+from app.models.trade import Trade
+from app.models.portfolio_snapshot import PortfolioSnapshot
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000 # Rows fetched and encoded per chunk
+
+
+class ExportFormat(str, enum.Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.NDJSON: "application/x-ndjson",
+}
+
+TRADE_EXPORT_FIELDS = ("id", "timestamp", "symbol", "trade_type", "quantity", "price")
+VALUE_HISTORY_EXPORT_FIELDS = ("snapshot_date", "timestamp", "total_value")
+
+
+def _export_value(value: Any) -> Any:
+    """Timestamps as ISO 8601, Decimals as exact strings, enums as their value."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value) # Decimal, date
+
+
+def _encode_batch(rows: List[Sequence[Any]], fields: Sequence[str], export_format: ExportFormat) -> bytes:
+    if export_format == ExportFormat.NDJSON:
+        return b"".join(
+            orjson.dumps({field: _export_value(value) for field, value in zip(fields, row)}) + b"\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([[_export_value(value) for value in row] for row in rows])
+    return buffer.getvalue().encode("utf-8")
+
+
+def _stream_query(build_query, fields: Sequence[str], export_format: ExportFormat, label: str) -> Iterator[bytes]:
+    db = SessionLocal()
+    exported = 0
+    try:
+        if export_format == ExportFormat.CSV:
+            yield _encode_batch([fields], fields, ExportFormat.CSV) # Header row
+        batch: List[Sequence[Any]] = []
+        for row in build_query(db).yield_per(EXPORT_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield _encode_batch(batch, fields, export_format)
+                exported += len(batch)
+                batch = []
+        if batch:
+            yield _encode_batch(batch, fields, export_format)
+            exported += len(batch)
+        logger.info(f"Exported {exported} {label} rows as {export_format.value}.")
+    finally:
+        db.close()
+
+
+def stream_trades(
+    user_id: int,
+    export_format: ExportFormat,
+    symbol: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> Iterator[bytes]:
+    """A user's trades, oldest first, as encoded chunks."""
+    def build_query(db):
+        query = db.query(Trade.id, Trade.timestamp, Trade.symbol, Trade.trade_type, Trade.quantity, Trade.price)\
+            .filter(Trade.user_id == user_id)
+        if symbol:
+            query = query.filter(Trade.symbol == symbol.upper())
+        if start_date:
+            query = query.filter(Trade.timestamp >= start_date)
+        if end_date:
+            query = query.filter(Trade.timestamp <= end_date)
+        return query.order_by(Trade.timestamp.asc(), Trade.id.asc())
+    return _stream_query(build_query, TRADE_EXPORT_FIELDS, export_format, f"trade (user {user_id})")
+
+
+def stream_value_history(
+    user_id: int,
+    export_format: ExportFormat,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> Iterator[bytes]:
+    """A user's daily snapshots, oldest first, as encoded chunks."""
+    def build_query(db):
+        query = db.query(PortfolioSnapshot.snapshot_date, PortfolioSnapshot.timestamp, PortfolioSnapshot.total_value)\
+            .filter(PortfolioSnapshot.user_id == user_id)
+        if start_date:
+            query = query.filter(PortfolioSnapshot.timestamp >= start_date)
+        if end_date:
+            query = query.filter(PortfolioSnapshot.timestamp <= end_date)
+        return query.order_by(PortfolioSnapshot.timestamp.asc())
+    return _stream_query(build_query, VALUE_HISTORY_EXPORT_FIELDS, export_format, f"value history (user {user_id})")
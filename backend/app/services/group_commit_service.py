@@ -0,0 +1,144 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+from sqlalchemy.orm import Session
+import logging
+import queue
+import threading
+import time
+
+from app.db.session import SessionLocal
+from app.core.config import GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# A unit of work applied inside the batch session. It must not commit; it runs in its own savepoint.
+Work = Callable[[Session], Any]
+
+
+@dataclass
+class _Request:
+    work: Work
+    future: Future
+
+
+class GroupCommitExecutor:
+    """
+    Collects writes that arrive within a short window and applies them in one transaction.
+    Each unit of work runs in its own SAVEPOINT, so a failing order only rolls back itself.
+    Callers are resolved after the shared COMMIT succeeds, so a returned result is durable.
+    """
+
+    def __init__(
+        self,
+        window_ms: float = GROUP_COMMIT_WINDOW_MS,
+        max_batch_size: int = GROUP_COMMIT_MAX_BATCH_SIZE,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.session_factory = session_factory
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, work: Work) -> Future:
+        """Queues work for the next batch. The future resolves to its return value or exception."""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put(_Request(work=work, future=future))
+        return future
+
+    def execute(self, work: Work, timeout: Optional[float] = 30.0) -> Any:
+        """Submits work and blocks until its batch has committed."""
+        return self.submit(work).result(timeout=timeout)
+
+    def shutdown(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None) # Sentinel: drain what's queued, then stop
+                self._thread.join(timeout=5)
+                self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit-executor", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch: List[_Request] = [first]
+            deadline = time.monotonic() + self.window_seconds
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self._apply_batch(batch)
+            if stopping:
+                return
+
+    def _apply_batch(self, batch: List[_Request]):
+        outcomes: List[tuple] = [] # (request, result, error)
+        db = self.session_factory()
+        try:
+            for request in batch:
+                try:
+                    with db.begin_nested():
+                        result = request.work(db)
+                    outcomes.append((request, result, None))
+                except Exception as e:
+                    outcomes.append((request, None, e))
+            db.commit()
+        except Exception as commit_error:
+            db.rollback()
+            logger.error(f"Group commit of {len(batch)} orders failed: {commit_error}", exc_info=True)
+            # Nothing in the batch was persisted; fail every caller that had succeeded so far
+            outcomes = [(request, None, error or commit_error) for request, _, error in outcomes]
+            outcomes += [(request, None, commit_error) for request in batch[len(outcomes):]]
+        finally:
+            db.close()
+
+        succeeded = sum(1 for _, _, error in outcomes if error is None)
+        logger.info(f"Group commit applied {succeeded}/{len(batch)} orders in one transaction.")
+        for request, result, error in outcomes:
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(result)
+
+
+_executor: Optional[GroupCommitExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> GroupCommitExecutor:
+    """Process-wide executor, created on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = GroupCommitExecutor()
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -0,0 +1,121 @@
+from sqlalchemy.orm import Session
+from typing import Optional, Union
+from datetime import datetime, timezone
+from fastapi import HTTPException, status
+import hashlib
+import logging
+
+from app.db.session import SessionLocal
+from app.core.config import IDEMPOTENCY_KEY_TTL_HOURS, IDEMPOTENCY_LRU_SIZE
+from app.core.lru_cache import LRUCache
+from app.crud import crud_idempotency_key
+from app.models.trade import Trade
+from app.models.pending_order import PendingOrder
+from app.schemas.order import OrderCreate
+from app.schemas.trade import Trade as TradeSchema
+from app.schemas.pending_order import PendingOrder as PendingOrderSchema
+
+logger = logging.getLogger(__name__)
+
+OrderResult = Union[TradeSchema, PendingOrderSchema]
+
+# (user_id, key) -> (request_hash, result schema). Replays served from here never touch the DB.
+_result_cache = LRUCache(max_size=IDEMPOTENCY_LRU_SIZE, ttl_seconds=IDEMPOTENCY_KEY_TTL_HOURS * 3600)
+
+
+def compute_request_hash(order: OrderCreate) -> str:
+    """Fingerprint of the order body. A key replayed with a different body is rejected."""
+    limit_price = f"{order.limit_price.normalize():f}" if order.limit_price is not None else ""
+    raw = f"{order.symbol}|{order.order_type.value}|{order.quantity}|{limit_price}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _check_request_hash(key: str, stored_hash: str, request_hash: str):
+    if stored_hash != request_hash:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Idempotency-Key '{key}' was already used with a different order."
+        )
+
+
+def get_stored_result(db: Session, user_id: int, key: str, request_hash: str) -> Optional[OrderResult]:
+    """
+    Returns the stored result for a previously seen key, or None if the key is new.
+    Checks the in-process LRU first and only falls back to the table on a miss.
+    """
+    cached = _result_cache.get((user_id, key))
+    if cached is not None:
+        stored_hash, result = cached
+        _check_request_hash(key, stored_hash, request_hash)
+        return result
+
+    db_key = crud_idempotency_key.get_idempotency_key(db=db, user_id=user_id, key=key)
+    if db_key is None:
+        return None
+    _check_request_hash(key, db_key.request_hash, request_hash)
+
+    result: Optional[OrderResult] = None
+    if db_key.trade_id is not None:
+        db_trade = db.get(Trade, db_key.trade_id)
+        result = TradeSchema.model_validate(db_trade) if db_trade else None
+    elif db_key.pending_order_id is not None:
+        db_order = db.get(PendingOrder, db_key.pending_order_id)
+        result = PendingOrderSchema.model_validate(db_order) if db_order else None
+
+    if result is None:
+        logger.warning(f"Idempotency key '{key}' for user {user_id} points to a missing trade/order.")
+        return None
+
+    expires_at = db_key.expires_at
+    if expires_at.tzinfo is None: # SQLite returns naive datetimes
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    remaining_seconds = (expires_at - datetime.now(timezone.utc)).total_seconds()
+    _result_cache.set((user_id, key), (db_key.request_hash, result), ttl_seconds=max(remaining_seconds, 0))
+    return result
+
+
+def record_result(
+    db: Session,
+    user_id: int,
+    key: str,
+    request_hash: str,
+    result: Union[Trade, PendingOrder]
+) -> OrderResult:
+    """
+    Stores the key alongside the trade or pending order created by the request.
+    Call inside the order's transaction, before commit. Returns the result as a schema
+    so it can be cached once the transaction commits.
+    """
+    if isinstance(result, Trade):
+        crud_idempotency_key.create_idempotency_key(
+            db=db, user_id=user_id, key=key, request_hash=request_hash,
+            ttl_hours=IDEMPOTENCY_KEY_TTL_HOURS, trade_id=result.id
+        )
+        return TradeSchema.model_validate(result)
+    crud_idempotency_key.create_idempotency_key(
+        db=db, user_id=user_id, key=key, request_hash=request_hash,
+        ttl_hours=IDEMPOTENCY_KEY_TTL_HOURS, pending_order_id=result.id
+    )
+    return PendingOrderSchema.model_validate(result)
+
+
+def remember_result(user_id: int, key: str, request_hash: str, result: OrderResult):
+    """Puts a committed result into the in-process LRU."""
+    _result_cache.set((user_id, key), (request_hash, result))
+
+
+def purge_expired_keys_job():
+    """Job function called by the scheduler. Deletes expired idempotency keys."""
+    db: Session | None = None
+    try:
+        db = SessionLocal()
+        deleted = crud_idempotency_key.delete_expired_idempotency_keys(db=db)
+        db.commit()
+        logger.info(f"Purged {deleted} expired idempotency keys.")
+    except Exception as e:
+        logger.error(f"Error during purge_expired_keys_job: {e}", exc_info=True)
+        if db:
+            db.rollback()
+    finally:
+        if db:
+            db.close()
@@ -0,0 +1,251 @@
+from sqlalchemy.orm import Session
+from fastapi.encoders import jsonable_encoder
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, Any, Optional, List
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from app.db.session import SessionLocal
+from app.core.config import (
+    JOB_VISIBILITY_TIMEOUT_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS, JOB_EXECUTION_MODE,
+    ANALYTICS_JOB_RESULT_TTL_SECONDS, ANALYTICS_JOB_WORKERS
+)
+from app.crud import crud_job, crud_account
+from app.models.job import Job
+from app.models.user import User
+from app.models.enums import AnalyticsJobType, JobStatus
+from app.services import trading_service, daily_snapshot_service, leaderboard_service, risk_service, stress_test_service
+
+logger = logging.getLogger(__name__)
+
+CHECK_PENDING_ORDERS_JOB = "check_pending_orders"
+DAILY_SNAPSHOTS_JOB = "daily_snapshots"
+LEADERBOARD_REFRESH_JOB = "leaderboard_refresh"
+RISK_PRECOMPUTE_JOB = "risk_precompute"
+RISK_VAR_JOB = AnalyticsJobType.RISK_VAR.value
+STRESS_TEST_JOB = AnalyticsJobType.STRESS_TEST.value
+ANALYTICS_JOB_TYPES = [job_type.value for job_type in AnalyticsJobType] # Per-user requests run asynchronously
+
+# job_type -> handler(db, payload) returning a JSON-serializable result
+JobHandler = Callable[[Session, Dict[str, Any]], Optional[Dict[str, Any]]]
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    CHECK_PENDING_ORDERS_JOB: lambda db, payload: trading_service._check_and_execute_logic(db),
+    DAILY_SNAPSHOTS_JOB: lambda db, payload: daily_snapshot_service.generate_daily_snapshots_for_relevant_users(db),
+    LEADERBOARD_REFRESH_JOB: lambda db, payload: leaderboard_service.refresh_leaderboard(db),
+    RISK_PRECOMPUTE_JOB: lambda db, payload: risk_service.precompute_risk_results(db),
+    RISK_VAR_JOB: lambda db, payload: jsonable_encoder(risk_service.var_job(db, payload)),
+    STRESS_TEST_JOB: lambda db, payload: jsonable_encoder(stress_test_service.stress_test_job(db, payload)),
+}
+
+
+def enqueue(
+    db: Session,
+    job_type: str,
+    payload: Optional[Dict[str, Any]] = None,
+    dedupe_key: Optional[str] = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS
+) -> Job:
+    """Enqueues a job and commits. Periodic jobs pass their type as dedupe_key so a backlog never piles up."""
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    db_job = crud_job.enqueue_job(
+        db=db, job_type=job_type, payload=payload or {},
+        dedupe_key=dedupe_key, max_attempts=max_attempts
+    )
+    db.commit()
+    db.refresh(db_job)
+    logger.info(f"Enqueued job {db_job.id} ({job_type}).")
+    return db_job
+
+
+def _enqueue_periodic(job_type: str):
+    db: Session | None = None
+    try:
+        db = SessionLocal()
+        enqueue(db, job_type, dedupe_key=job_type)
+    except Exception as e:
+        logger.error(f"Error enqueuing {job_type} job: {e}", exc_info=True)
+        if db:
+            db.rollback()
+    finally:
+        if db:
+            db.close()
+
+
+def enqueue_pending_order_check_job():
+    """Scheduler job used in queue mode: hands the matching cycle to the worker."""
+    _enqueue_periodic(CHECK_PENDING_ORDERS_JOB)
+
+
+def enqueue_daily_snapshot_job():
+    """Scheduler job used in queue mode: hands snapshot generation to the worker."""
+    _enqueue_periodic(DAILY_SNAPSHOTS_JOB)
+
+
+def enqueue_leaderboard_refresh_job():
+    """Scheduler job used in queue mode: hands the leaderboard refresh to the worker."""
+    _enqueue_periodic(LEADERBOARD_REFRESH_JOB)
+
+
+def enqueue_risk_precompute_job():
+    """Scheduler job used in queue mode: hands the nightly risk batch to the worker."""
+    _enqueue_periodic(RISK_PRECOMPUTE_JOB)
+
+
+_local_pool: Optional[ThreadPoolExecutor] = None
+_local_pool_lock = threading.Lock()
+_LOCAL_WORKER_PREFIX = f"api-{socket.gethostname()}-{os.getpid()}"
+
+
+def _run_local_job(job_types: List[str]) -> bool:
+    """Runs one job on a pool thread under a worker id of its own, so lease checks tell the threads apart."""
+    return run_next_job(f"{_LOCAL_WORKER_PREFIX}-{uuid.uuid4().hex[:8]}", job_types)
+
+
+def _get_local_pool() -> ThreadPoolExecutor:
+    global _local_pool
+    with _local_pool_lock:
+        if _local_pool is None:
+            _local_pool = ThreadPoolExecutor(max_workers=max(1, ANALYTICS_JOB_WORKERS), thread_name_prefix="analytics-job")
+        return _local_pool
+
+
+def shutdown_local_pool():
+    global _local_pool
+    with _local_pool_lock:
+        if _local_pool is not None:
+            _local_pool.shutdown(wait=False, cancel_futures=True)
+            _local_pool = None
+
+
+def submit_analytics_job(db: Session, user: User, job_type: str, params: Optional[Dict[str, Any]] = None) -> Job:
+    """
+    Runs a per-user analytics request asynchronously and returns its job to poll. A request
+    identical to one still queued or running, or to one that succeeded within
+    ANALYTICS_JOB_RESULT_TTL_SECONDS, gets that job back instead of a new one. The key includes
+    the account's position_version, so a trade always starts a fresh computation.
+    In queue mode the worker runs the job; otherwise a small thread pool in this process does.
+    """
+    if job_type not in ANALYTICS_JOB_TYPES:
+        raise ValueError(f"Unknown analytics job type: {job_type}")
+    params = params or {}
+    db_account = crud_account.get_account(db=db, user_id=user.id)
+    position_version = db_account.position_version if db_account is not None else 0
+    request_hash = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+    dedupe_key = f"{job_type}:{user.id}:{position_version}:{request_hash}"
+
+    succeeded_since = datetime.now(timezone.utc) - timedelta(seconds=ANALYTICS_JOB_RESULT_TTL_SECONDS)
+    existing = crud_job.get_reusable_job(db=db, dedupe_key=dedupe_key, succeeded_since=succeeded_since)
+    if existing is not None:
+        logger.info(f"Reusing job {existing.id} ({job_type}, {existing.status.value}) for user {user.id}.")
+        if existing.status != JobStatus.SUCCEEDED and JOB_EXECUTION_MODE != "queue":
+            # It may have been left behind by a process that has since restarted; make sure a thread here picks it up
+            _get_local_pool().submit(_run_local_job, ANALYTICS_JOB_TYPES)
+        return existing
+
+    # One attempt: the client is waiting on it and can resubmit
+    db_job = enqueue(db, job_type, payload={"user_id": user.id, **params}, dedupe_key=dedupe_key, max_attempts=1)
+    if JOB_EXECUTION_MODE != "queue":
+        _get_local_pool().submit(_run_local_job, ANALYTICS_JOB_TYPES)
+    return db_job
+
+
+def get_analytics_job(db: Session, user: User, job_id: int) -> Optional[Job]:
+    """The user's own analytics job, or None."""
+    db_job = crud_job.get_job(db=db, job_id=job_id)
+    if db_job is None or db_job.job_type not in ANALYTICS_JOB_TYPES or (db_job.payload or {}).get("user_id") != user.id:
+        return None
+    return db_job
+
+
+LEASE_RENEWAL_INTERVAL_SECONDS = max(1, JOB_VISIBILITY_TIMEOUT_SECONDS // 3) # Renewed well before the lease runs out
+
+
+def _renew_lease_until(stop: threading.Event, job_id: int, worker_id: str):
+    """Heartbeat thread: keeps a long-running job's claim alive so no other worker reclaims it."""
+    while not stop.wait(LEASE_RENEWAL_INTERVAL_SECONDS):
+        db = SessionLocal()
+        try:
+            owned = crud_job.extend_lease(
+                db=db, job_id=job_id, worker_id=worker_id, visibility_timeout_seconds=JOB_VISIBILITY_TIMEOUT_SECONDS
+            )
+            db.commit()
+            if not owned:
+                logger.warning(f"Worker {worker_id} lost the lease on job {job_id}; stopping renewal.")
+                return
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Could not renew the lease on job {job_id}: {e}", exc_info=True)
+        finally:
+            db.close()
+
+
+def run_next_job(worker_id: str, job_types: Optional[List[str]] = None) -> bool:
+    """
+    Claims and runs one job. Returns False if nothing was runnable.
+    While the handler runs, a heartbeat renews the claim every LEASE_RENEWAL_INTERVAL_SECONDS,
+    so only a worker that died loses its job to another after the visibility timeout.
+    The claim and the final status update use their own session so a handler
+    rolling back its work can't undo the job bookkeeping.
+    """
+    queue_db = SessionLocal()
+    try:
+        db_job = crud_job.claim_next_job(
+            db=queue_db, worker_id=worker_id,
+            visibility_timeout_seconds=JOB_VISIBILITY_TIMEOUT_SECONDS, job_types=job_types
+        )
+        queue_db.commit()
+        if db_job is None:
+            return False
+
+        job_id, job_type, attempt, payload = db_job.id, db_job.job_type, db_job.attempts, db_job.payload or {}
+        logger.info(f"Worker {worker_id} running job {job_id} ({job_type}), attempt {attempt}/{db_job.max_attempts}.")
+
+        result: Optional[Dict[str, Any]] = None
+        error: Optional[str] = None
+        stop_renewal = threading.Event()
+        threading.Thread(
+            target=_renew_lease_until, args=(stop_renewal, job_id, worker_id),
+            name=f"job-{job_id}-lease", daemon=True
+        ).start()
+        work_db = SessionLocal()
+        try:
+            handler = JOB_HANDLERS.get(job_type)
+            if handler is None:
+                raise ValueError(f"No handler registered for job type '{job_type}'")
+            result = handler(work_db, payload)
+        except Exception as e:
+            work_db.rollback()
+            error = f"{type(e).__name__}: {e}"
+            logger.error(f"Job {job_id} ({job_type}) failed on attempt {attempt}: {error}", exc_info=True)
+        finally:
+            stop_renewal.set()
+            work_db.close()
+
+        # Only record the outcome if this worker still owns the job (it may have timed out and been reclaimed)
+        db_job = queue_db.query(Job).filter(Job.id == job_id).with_for_update().first()
+        if db_job is None or db_job.locked_by != worker_id:
+            logger.warning(f"Job {job_id} was reclaimed by another worker; discarding this worker's outcome.")
+            queue_db.rollback()
+            return True
+        if error is None:
+            crud_job.complete_job(db=queue_db, db_job=db_job, result=result)
+        else:
+            retry_delay = JOB_RETRY_BASE_SECONDS * (2 ** (attempt - 1))
+            crud_job.fail_job(db=queue_db, db_job=db_job, error=error, retry_delay_seconds=retry_delay)
+        queue_db.commit()
+        logger.info(f"Job {job_id} ({job_type}) finished with status {db_job.status.value}.")
+        return True
+    except Exception as e:
+        queue_db.rollback()
+        logger.error(f"Worker {worker_id} queue error: {e}", exc_info=True)
+        return False
+    finally:
+        queue_db.close()
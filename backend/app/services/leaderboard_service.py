@@ -0,0 +1,156 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, exists
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+import decimal
+import logging
+import pandas as pd
+
+from app.db.session import SessionLocal
+from app.crud import crud_leaderboard
+from app.models.user import User
+from app.models.account import Account, STARTING_CASH_BALANCE
+from app.models.holding import Holding
+from app.models.enums import LeaderboardMetric
+from app.schemas.leaderboard import LeaderboardResponse, LeaderboardEntryResponse
+from app.services import market_data_service
+
+logger = logging.getLogger(__name__)
+
+
+def _entry_rows(values: Dict[int, float], valued_at: datetime) -> List[Dict[str, Any]]:
+    starting_cash = float(STARTING_CASH_BALANCE)
+    return [
+        {"user_id": int(user_id), "portfolio_value": decimal.Decimal(f"{value:.4f}"),
+         "total_return": value / starting_cash - 1.0, "valued_at": valued_at}
+        for user_id, value in values.items()
+    ]
+
+
+def record_values(db: Session, values: Dict[int, float], valued_at: datetime) -> int:
+    """
+    Stores fresh valuations. Only these users' rows are written; ranks are counted on read.
+    Does NOT commit. Returns the number of entries written.
+    """
+    written = crud_leaderboard.upsert_values(db=db, entries=_entry_rows(values, valued_at))
+    logger.info(f"Leaderboard: recorded {written} valuations.")
+    return written
+
+
+def record_snapshot_values(db: Session, values: Dict[int, float], valued_at: datetime) -> int:
+    """
+    The snapshot job's valuations (users with holdings) plus every account holder without
+    holdings, worth their cash, so all-cash users never keep a stale value. Does NOT commit.
+    """
+    cash_only = db.execute(
+        select(Account.user_id, Account.cash_balance)
+        .where(~exists().where(Holding.user_id == Account.user_id))
+    ).all()
+    return record_values(db=db, values={**{user_id: float(cash) for user_id, cash in cash_only}, **values}, valued_at=valued_at)
+
+
+def mark_dirty(db: Session, user_id: int):
+    """Called on every fill; the user is revalued by the next refresh. Does NOT commit."""
+    crud_leaderboard.mark_dirty(db=db, user_id=user_id)
+
+
+def _value_users(db: Session, user_ids: List[int]) -> Dict[int, float]:
+    """Cash plus holdings at current prices for the given users: one query, one batched price fetch."""
+    rows = []
+    for start in range(0, len(user_ids), 500): # Keep IN lists well under bind-parameter limits
+        rows.extend(db.execute(
+            select(Account.user_id, Account.cash_balance, Holding.symbol, Holding.quantity)
+            .outerjoin(Holding, Holding.user_id == Account.user_id)
+            .where(Account.user_id.in_(user_ids[start:start + 500]))
+        ).all())
+    frame = pd.DataFrame(rows, columns=["user_id", "cash", "symbol", "quantity"])
+    if frame.empty:
+        return {}
+
+    symbols = frame["symbol"].dropna().unique().tolist()
+    prices = market_data_service.get_current_prices(symbols) if symbols else {}
+    frame["price"] = frame["symbol"].str.upper().map(prices).astype(float).fillna(0.0) # Unpriced holdings count for nothing
+    frame["value"] = frame["quantity"].fillna(0).to_numpy(dtype=float) * frame["price"].to_numpy()
+    frame["cash"] = frame["cash"].astype(float)
+    per_user = frame.groupby("user_id").agg(cash=("cash", "first"), holdings_value=("value", "sum"))
+    return (per_user["cash"] + per_user["holdings_value"]).to_dict()
+
+
+def refresh_leaderboard(db: Session) -> Dict[str, int]:
+    """
+    Revalues users who traded since their last valuation. Only their rows are written; nobody
+    else's entry changes because ranks are counted on read.
+
+    The dirty flags are claimed and committed before valuing, so fills landing meanwhile mark
+    their users dirty again instead of being wiped, and trades never wait on the price fetch.
+    """
+    dirty_user_ids = crud_leaderboard.claim_dirty_user_ids(db=db)
+    db.commit()
+    if not dirty_user_ids:
+        return {"revalued": 0}
+    try:
+        values = _value_users(db=db, user_ids=dirty_user_ids)
+        crud_leaderboard.upsert_values(db=db, entries=_entry_rows(values, datetime.now(timezone.utc)))
+        db.commit()
+    except Exception:
+        # Hand the claimed users back so the next refresh retries them
+        db.rollback()
+        for user_id in dirty_user_ids:
+            crud_leaderboard.mark_dirty(db=db, user_id=user_id)
+        db.commit()
+        raise
+    logger.info(f"Leaderboard refresh: revalued {len(values)} users.")
+    return {"revalued": len(values)}
+
+
+def leaderboard_refresh_job():
+    """Job function to be called by the scheduler."""
+    db: Session | None = None
+    try:
+        db = SessionLocal()
+        refresh_leaderboard(db)
+    except Exception as e:
+        logger.error(f"Critical error in leaderboard_refresh_job: {e}", exc_info=True)
+        if db: db.rollback()
+    finally:
+        if db:
+            db.close()
+
+
+def _metric_value(entry, metric: LeaderboardMetric):
+    return entry.total_return if metric == LeaderboardMetric.RETURN else entry.portfolio_value
+
+
+def _entry_response(entry, username: str, rank: int) -> LeaderboardEntryResponse:
+    return LeaderboardEntryResponse(
+        rank=rank,
+        username=username,
+        portfolio_value=entry.portfolio_value,
+        total_return=entry.total_return,
+        valued_at=entry.valued_at
+    )
+
+
+def get_leaderboard(db: Session, user: User, metric: LeaderboardMetric = LeaderboardMetric.VALUE, limit: int = 10, offset: int = 0) -> LeaderboardResponse:
+    """
+    Top entries by the chosen metric plus the caller's own entry. Ties share a rank. Within a page
+    ranks follow from row positions; only the page's first row (past page one) and the caller need
+    an indexed count of the entries ahead.
+    """
+    top: List[LeaderboardEntryResponse] = []
+    previous_value, rank = None, None
+    for i, (entry, username) in enumerate(crud_leaderboard.get_top_entries(db=db, metric=metric, limit=limit, offset=offset)):
+        value = _metric_value(entry, metric)
+        if i == 0:
+            rank = crud_leaderboard.count_ahead(db=db, metric=metric, value=value) + 1 if offset else 1
+        elif value != previous_value:
+            rank = offset + i + 1
+        top.append(_entry_response(entry, username, rank))
+        previous_value = value
+
+    own_entry = crud_leaderboard.get_entry(db=db, user_id=user.id)
+    me: Optional[LeaderboardEntryResponse] = None
+    if own_entry is not None and own_entry.portfolio_value is not None:
+        own_rank = crud_leaderboard.count_ahead(db=db, metric=metric, value=_metric_value(own_entry, metric)) + 1
+        me = _entry_response(own_entry, user.username, own_rank)
+    return LeaderboardResponse(metric=metric, entries=top, me=me)
@@ -1,7 +1,9 @@
 import pandas as pd
 import logging
+import threading
 import time
-from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 
 # Alpaca SDK imports
@@ -10,7 +12,7 @@ from alpaca.data.requests import StockLatestTradeRequest, StockBarsRequest
 from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
 from alpaca.data.enums import DataFeed
 
-from app.core.config import ALPACA_API_KEY_ID, ALPACA_API_SECRET_KEY, ALPACA_PAPER_TRADING
+from app.core.config import ALPACA_API_KEY_ID, ALPACA_API_SECRET_KEY, ALPACA_PAPER_TRADING, MARKET_DATA_FETCH_WORKERS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -33,17 +35,24 @@ CACHE_ERROR_DURATION_SECONDS = 60 * 2     # Cache errors for 2 minutes
 ERROR_MARKER = "API_ERROR"                # Marker for general API errors
 
 ALPACA_CALL_DELAY_SECONDS = 0.3
-_last_alpaca_call_time = 0
+_next_alpaca_call_time = 0.0
+_throttle_lock = threading.Lock()
 
 def _throttle_alpaca_call():
-    global _last_alpaca_call_time
-    now = time.monotonic()
-    time_since_last_call = now - _last_alpaca_call_time
-    if time_since_last_call < ALPACA_CALL_DELAY_SECONDS:
-        sleep_time = ALPACA_CALL_DELAY_SECONDS - time_since_last_call
+    """
+    Spaces Alpaca calls at least ALPACA_CALL_DELAY_SECONDS apart across all threads. Each caller
+    reserves the next free slot under the lock and sleeps outside it, so concurrent fetches share
+    one rate budget while their requests overlap in flight.
+    """
+    global _next_alpaca_call_time
+    with _throttle_lock:
+        now = time.monotonic()
+        slot = max(now, _next_alpaca_call_time)
+        _next_alpaca_call_time = slot + ALPACA_CALL_DELAY_SECONDS
+    sleep_time = slot - now
+    if sleep_time > 0:
         logger.debug(f"Throttling Alpaca call. Sleeping for {sleep_time:.2f} seconds.")
         time.sleep(sleep_time)
-    _last_alpaca_call_time = time.monotonic()
 
 def _get_from_cache(key: str) -> Optional[Any]:
     if key in _cache:
@@ -120,6 +129,50 @@ def get_current_price(symbol: str) -> Optional[float]:
         _set_cache(cache_key, ERROR_MARKER) # Cache general errors
         return None
 
+LATEST_TRADE_BATCH_SIZE = 200 # Symbols per multi-symbol latest-trade request
+
+def get_current_prices(symbols: List[str]) -> Dict[str, Optional[float]]:
+    """
+    Latest trade prices for many symbols. Cached symbols are served from the cache; the rest
+    are fetched with one Alpaca request per LATEST_TRADE_BATCH_SIZE symbols instead of one each.
+    Keys are upper-cased symbols; None means no price is available.
+    """
+    upper_symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    prices: Dict[str, Optional[float]] = {}
+    missing: List[str] = []
+    for upper_symbol in upper_symbols:
+        cached_value = _get_from_cache(f"alpaca_current_price_{upper_symbol}")
+        if cached_value is None:
+            missing.append(upper_symbol)
+        else:
+            prices[upper_symbol] = None if cached_value == ERROR_MARKER else float(cached_value)
+
+    if not missing:
+        return prices
+    if not stock_client:
+        prices.update({upper_symbol: None for upper_symbol in missing})
+        return prices
+
+    for start in range(0, len(missing), LATEST_TRADE_BATCH_SIZE):
+        batch = missing[start:start + LATEST_TRADE_BATCH_SIZE]
+        _throttle_alpaca_call()
+        try:
+            latest_trades = stock_client.get_stock_latest_trade(StockLatestTradeRequest(symbol_or_symbols=batch))
+        except Exception as e:
+            logger.error(f"Alpaca API error fetching current prices for {len(batch)} symbols: {e}", exc_info=False)
+            latest_trades = {}
+        for upper_symbol in batch:
+            trade = latest_trades.get(upper_symbol) if latest_trades else None
+            if trade:
+                prices[upper_symbol] = float(trade.price)
+                _set_cache(f"alpaca_current_price_{upper_symbol}", prices[upper_symbol])
+            else:
+                logger.warning(f"No latest trade data found for {upper_symbol} from Alpaca.")
+                prices[upper_symbol] = None
+                _set_cache(f"alpaca_current_price_{upper_symbol}", ERROR_MARKER)
+        logger.info(f"Fetched current prices for {len(batch)} symbols in one request.")
+    return prices
+
 def get_historical_data(
     symbol: str,
     lookback_days: int = 252,
@@ -238,4 +291,33 @@ def get_historical_data(
     except Exception as e:
         logger.error(f"Alpaca API error or processing error fetching historical data for {upper_symbol}: {e}", exc_info=True)
         _set_cache(cache_key, ERROR_MARKER)
-        return None
\ No newline at end of file
+        return None
+
+_fetch_pool: Optional[ThreadPoolExecutor] = None
+_fetch_pool_lock = threading.Lock()
+
+def _get_fetch_pool() -> ThreadPoolExecutor:
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=max(1, MARKET_DATA_FETCH_WORKERS), thread_name_prefix="market-data")
+        return _fetch_pool
+
+def get_historical_data_many(symbols: List[str], lookback_days: int = 252) -> Dict[str, Optional[pd.DataFrame]]:
+    """
+    get_historical_data for many symbols, fetched concurrently on a bounded shared thread pool.
+    Requests still respect the global throttle, but their network latency overlaps instead of
+    adding up. Keys are upper-cased symbols; None means no data is available.
+    """
+    upper_symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    if len(upper_symbols) <= 1 or MARKET_DATA_FETCH_WORKERS <= 1:
+        return {upper_symbol: get_historical_data(upper_symbol, lookback_days=lookback_days) for upper_symbol in upper_symbols}
+    frames = _get_fetch_pool().map(lambda upper_symbol: get_historical_data(upper_symbol, lookback_days=lookback_days), upper_symbols)
+    return dict(zip(upper_symbols, frames))
+
+def shutdown_fetch_pool():
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is not None:
+            _fetch_pool.shutdown(wait=False, cancel_futures=True)
+            _fetch_pool = None
@@ -2,51 +2,72 @@ from sqlalchemy.orm import Session
 from app.models.user import User
 from app.schemas.portfolio import Portfolio
 from app.schemas.holding import HoldingResponse
-from app.crud import crud_account, crud_holding
+from app.schemas.pnl import PnlSummary, SymbolPnl
+from app.models.enums import TaxLotMethod
+from app.crud import crud_account, crud_holding, crud_tax_lot
 from app.services import market_data_service
+from app.core.config import PORTFOLIO_CACHE_SIZE, TAX_LOT_METHOD
+from app.core.lru_cache import LRUCache
+from dataclasses import dataclass
 import decimal
 import logging
 from typing import List, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
-def get_portfolio(db: Session, user: User) -> Portfolio:
-    """ Calculates and returns the user's portfolio details. """
-    db_account = crud_account.get_or_create_account(db=db, user=user)
-    cash = db_account.cash_balance
-    db_holdings = crud_holding.get_all_holdings(db=db, user_id=user.id)
 
+@dataclass(frozen=True)
+class _RealizedRow:
+    symbol: str
+    realized_pnl: decimal.Decimal
+    quantity_closed: int
+
+
+@dataclass
+class _CachedPortfolio:
+    position_version: int
+    cash: decimal.Decimal
+    realized_pnl: decimal.Decimal
+    positions: List[HoldingResponse] # Holdings with realized P&L but without valuation fields
+    realized_rows: List[_RealizedRow] # Per-symbol realized P&L rows from the tax-lot ledger, including closed symbols
+    prices: Dict[str, Optional[decimal.Decimal]]
+    portfolio: Portfolio
+
+# user_id -> _CachedPortfolio. The version lives on the account row, so fills made by
+# other processes (the worker, other API replicas) invalidate entries here too.
+_portfolio_cache = LRUCache(max_size=PORTFOLIO_CACHE_SIZE)
+
+
+def _value_portfolio(
+    user_id: int,
+    cash: decimal.Decimal,
+    realized_pnl: decimal.Decimal,
+    positions: List[HoldingResponse],
+    current_prices: Dict[str, Optional[decimal.Decimal]]
+) -> Portfolio:
     portfolio_holdings: List[HoldingResponse] = []
     total_holdings_value = decimal.Decimal("0.0")
     total_pnl = decimal.Decimal("0.0")
 
-    # --- Fetch unique current prices ONCE ---
-    unique_symbols = list(set([h.symbol for h in db_holdings]))
-    current_prices: Dict[str, Optional[decimal.Decimal]] = {}
-    if unique_symbols:
-        logger.info(f"Portfolio service fetching current prices for {len(unique_symbols)} symbols...")
-        for symbol in unique_symbols:
-            price = market_data_service.get_current_price(symbol)
-            current_prices[symbol] = decimal.Decimal(str(price)) if price is not None else None
-    # --- End price fetching ---
-
-    for holding in db_holdings:
-        current_price_decimal = current_prices.get(holding.symbol)
-        holding_resp = HoldingResponse.from_orm(holding)
+    for position in positions:
+        current_price_decimal = current_prices.get(position.symbol)
 
         if current_price_decimal is not None:
-            current_value = current_price_decimal * decimal.Decimal(holding.quantity)
-            cost_basis_value = holding.average_cost_basis * decimal.Decimal(holding.quantity)
+            current_value = current_price_decimal * decimal.Decimal(position.quantity)
+            cost_basis_value = position.average_cost_basis * decimal.Decimal(position.quantity)
             pnl = current_value - cost_basis_value
 
-            holding_resp.current_price = current_price_decimal
-            holding_resp.current_value = current_value
-            holding_resp.unrealized_pnl = pnl
+            holding_resp = position.model_copy(update={
+                "current_price": current_price_decimal,
+                "current_value": current_value,
+                "unrealized_pnl": pnl
+            })
 
             total_holdings_value += current_value
             total_pnl += pnl
         else:
-            logger.warning(f"Could not use current price for holding {holding.symbol} (user {user.id}) in portfolio calculation.")
+            holding_resp = position.model_copy()
+            logger.warning(f"Could not use current price for holding {position.symbol} (user {user_id}) in portfolio calculation.")
 
         portfolio_holdings.append(holding_resp)
 
@@ -57,5 +78,101 @@ def get_portfolio(db: Session, user: User) -> Portfolio:
         total_holdings_value=total_holdings_value,
         total_portfolio_value=total_portfolio_value,
         total_unrealized_pnl=total_pnl,
+        total_realized_pnl=realized_pnl,
         holdings=portfolio_holdings
-    )
\ No newline at end of file
+    )
+
+
+def _get_cached_portfolio(db: Session, user: User) -> _CachedPortfolio:
+    """
+    The user's valued portfolio and the ledger rows it was built from.
+    Holdings are re-read only when the account's position_version moved, and the valuation is
+    rebuilt only when that or one of the held symbols' prices changed.
+    """
+    db_account = crud_account.get_or_create_account(db=db, user=user)
+    cached: Optional[_CachedPortfolio] = _portfolio_cache.get(user.id)
+
+    if cached is not None and cached.position_version == db_account.position_version:
+        cash = cached.cash
+        realized_pnl = cached.realized_pnl
+        positions = cached.positions
+        realized_rows = cached.realized_rows
+    else:
+        cached = None
+        cash = db_account.cash_balance
+        realized_pnl = db_account.realized_pnl
+        realized_rows = [ # Copied out of the ORM rows, which outlive this session in the cache
+            _RealizedRow(symbol=r.symbol, realized_pnl=r.realized_pnl, quantity_closed=r.quantity_closed)
+            for r in crud_tax_lot.get_realized_pnl_for_user(db=db, user_id=user.id)
+        ]
+        realized_by_symbol = {r.symbol: r.realized_pnl for r in realized_rows}
+        positions = [
+            HoldingResponse.model_validate(h).model_copy(update={"realized_pnl": realized_by_symbol.get(h.symbol, decimal.Decimal("0"))})
+            for h in crud_holding.get_all_holdings(db=db, user_id=user.id)
+        ]
+
+    # --- Fetch unique current prices ONCE, in one batched request for uncached symbols ---
+    unique_symbols = list(set([p.symbol for p in positions]))
+    current_prices: Dict[str, Optional[decimal.Decimal]] = {}
+    if unique_symbols:
+        logger.info(f"Portfolio service fetching current prices for {len(unique_symbols)} symbols...")
+        fetched = market_data_service.get_current_prices(unique_symbols)
+        for symbol in unique_symbols:
+            price = fetched.get(symbol.upper())
+            current_prices[symbol] = decimal.Decimal(str(price)) if price is not None else None
+    # --- End price fetching ---
+
+    if cached is not None and cached.prices == current_prices:
+        return cached
+
+    cached = _CachedPortfolio(
+        position_version=db_account.position_version,
+        cash=cash,
+        realized_pnl=realized_pnl,
+        positions=positions,
+        realized_rows=realized_rows,
+        prices=current_prices,
+        portfolio=_value_portfolio(user.id, cash, realized_pnl, positions, current_prices)
+    )
+    _portfolio_cache.set(user.id, cached)
+    return cached
+
+
+def get_portfolio(db: Session, user: User) -> Portfolio:
+    """
+    Calculates and returns the user's portfolio details.
+    Served from the per-user cache while positions and prices are unchanged, so callers must
+    treat the returned Portfolio as read-only.
+    """
+    return _get_cached_portfolio(db=db, user=user).portfolio
+
+
+def get_pnl_summary(db: Session, user: User) -> PnlSummary:
+    """
+    Realized P&L from the tax-lot ledger's running totals plus unrealized P&L of open holdings.
+    Includes symbols that were fully sold. Never replays trade history.
+    """
+    cached = _get_cached_portfolio(db=db, user=user)
+    portfolio = cached.portfolio
+    realized_rows = {r.symbol: r for r in cached.realized_rows}
+    held = {h.symbol: h for h in portfolio.holdings}
+
+    symbols: List[SymbolPnl] = []
+    for symbol in sorted(set(realized_rows) | set(held)):
+        row = realized_rows.get(symbol)
+        holding = held.get(symbol)
+        symbols.append(SymbolPnl(
+            symbol=symbol,
+            quantity_held=holding.quantity if holding else 0,
+            quantity_closed=row.quantity_closed if row else 0,
+            realized_pnl=row.realized_pnl if row else decimal.Decimal("0"),
+            unrealized_pnl=holding.unrealized_pnl if holding else decimal.Decimal("0")
+        ))
+
+    return PnlSummary(
+        method=TaxLotMethod(TAX_LOT_METHOD),
+        total_realized_pnl=portfolio.total_realized_pnl,
+        total_unrealized_pnl=portfolio.total_unrealized_pnl,
+        total_pnl=portfolio.total_realized_pnl + portfolio.total_unrealized_pnl,
+        symbols=symbols
+    )
@@ -0,0 +1,196 @@
+"""
+Shared, date-aligned daily returns for every symbol held in the system.
+
+The panel is one (dates x symbols) NumPy matrix built once per trading day and reused by every
+VaR request, so a single user's VaR is a column selection plus one matrix-vector product and
+VaR for all users is one matrix-matrix product.
+"""
+from sqlalchemy.orm import Session
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+import logging
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from app.models.holding import Holding
+from app.services import market_data_service
+from app.core.config import RETURNS_PANEL_LOOKBACK_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ReturnsPanel:
+    dates: np.ndarray # datetime64[D], ascending; union of all symbols' trading days
+    symbols: Tuple[str, ...]
+    returns: np.ndarray # (len(dates), len(symbols)) daily simple returns, NaN where a symbol has no bar
+    lookback_days: int
+    built_for: date # UTC day the panel is valid for
+    unavailable: FrozenSet[str] = frozenset() # No usable history when built; retried on the next rebuild
+    column: Dict[str, int] = field(default_factory=dict)
+
+    def columns_for(self, symbols: Iterable[str]) -> List[int]:
+        return [self.column[symbol] for symbol in symbols]
+
+    def window(self, lookback_days: int) -> np.ndarray:
+        """The most recent lookback_days rows (all symbols). Read-only view."""
+        return self.returns[-lookback_days:]
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _daily_returns(histories: Dict[str, Optional[pd.DataFrame]]) -> Tuple[Dict[str, pd.Series], List[str]]:
+    """Daily returns per symbol from each symbol's own consecutive closes."""
+    returns: Dict[str, pd.Series] = {}
+    unavailable: List[str] = []
+    for symbol, hist_df in histories.items():
+        if hist_df is None or hist_df.empty or "adjusted_close" not in hist_df.columns:
+            unavailable.append(symbol)
+            continue
+        closes = hist_df["adjusted_close"].sort_index()
+        index = pd.DatetimeIndex(closes.index)
+        if index.tz is not None:
+            index = index.tz_convert("UTC").tz_localize(None)
+        closes.index = index.normalize() # One row per trading day
+        series = closes[~closes.index.duplicated(keep="last")].pct_change().dropna()
+        if series.empty:
+            unavailable.append(symbol)
+            continue
+        returns[symbol] = series
+    return returns, unavailable
+
+
+def build_panel(symbols: Iterable[str], lookback_days: int = RETURNS_PANEL_LOOKBACK_DAYS, timings: Optional[Dict[str, float]] = None) -> ReturnsPanel:
+    """
+    Fetches history for the symbols (concurrently) and aligns their returns on one date axis (outer
+    join). Adds the time spent to timings["fetch_ms"] and timings["align_ms"] when given.
+    """
+    symbols = sorted({symbol.upper() for symbol in symbols})
+    started = time.perf_counter()
+    histories = market_data_service.get_historical_data_many(symbols, lookback_days=lookback_days)
+    fetched = time.perf_counter()
+    returns, unavailable = _daily_returns(histories)
+    if unavailable:
+        logger.warning(f"Returns panel: no usable history for {len(unavailable)} symbols: {unavailable[:20]}")
+    if returns:
+        frame = pd.concat(returns, axis=1, join="outer").sort_index().tail(lookback_days)
+        dates = frame.index.values.astype("datetime64[D]")
+        matrix = np.ascontiguousarray(frame.to_numpy(dtype=np.float64))
+        panel_symbols = tuple(frame.columns)
+    else:
+        dates, matrix, panel_symbols = np.array([], dtype="datetime64[D]"), np.empty((0, 0)), ()
+    if timings is not None:
+        timings["fetch_ms"] = timings.get("fetch_ms", 0.0) + (fetched - started) * 1000
+        timings["align_ms"] = timings.get("align_ms", 0.0) + (time.perf_counter() - fetched) * 1000
+    logger.info(f"Built returns panel: {len(dates)} days x {len(panel_symbols)} symbols (lookback {lookback_days}).")
+    return ReturnsPanel(
+        dates=dates, symbols=panel_symbols, returns=matrix, lookback_days=lookback_days, built_for=_today(),
+        unavailable=frozenset(unavailable), column={symbol: i for i, symbol in enumerate(panel_symbols)}
+    )
+
+
+_panel: Optional[ReturnsPanel] = None
+_panel_lock = threading.Lock() # Guards _panel and _build; never held while fetching
+
+
+@dataclass
+class _PanelBuild:
+    """A rebuild in progress. Requests it covers wait on its future instead of fetching again."""
+    built_for: date
+    symbols: FrozenSet[str]
+    future: Future
+
+
+_build: Optional[_PanelBuild] = None
+
+
+def _held_symbols(db: Session) -> List[str]:
+    return [row[0] for row in db.query(Holding.symbol).distinct().all()]
+
+
+def _covers(panel: Optional[ReturnsPanel], symbols: Set[str]) -> bool:
+    return panel is not None and panel.built_for == _today() and symbols <= set(panel.symbols) | panel.unavailable
+
+
+def refresh_panel(db: Session) -> ReturnsPanel:
+    """Rebuilds the shared panel for every symbol currently held by any user."""
+    global _panel
+    panel = build_panel(_held_symbols(db))
+    with _panel_lock:
+        _panel = panel
+    return panel
+
+
+def current_panel() -> Optional[ReturnsPanel]:
+    """The shared panel if it is valid for today, without building one."""
+    panel = _panel
+    return panel if panel is not None and panel.built_for == _today() else None
+
+
+def _shared_panel(db: Session, symbols: Set[str], timings: Optional[Dict[str, float]]) -> ReturnsPanel:
+    """
+    The shared panel, rebuilt when it is stale or misses a symbol. Only one thread builds at a
+    time and the history fetch runs outside _panel_lock: requests the build will cover wait for
+    it, every other request keeps reading the current panel.
+    """
+    global _panel, _build
+    while True:
+        panel = _panel
+        if _covers(panel, symbols):
+            return panel
+        if panel is None or panel.built_for != _today():
+            wanted = set(_held_symbols(db)) | symbols
+        else:
+            wanted = set(panel.symbols) | panel.unavailable | symbols # Cached histories make this cheap
+
+        with _panel_lock:
+            if _covers(_panel, symbols):
+                return _panel
+            build = _build
+            building = build is None or build.built_for != _today() or not symbols <= build.symbols
+            if building:
+                if build is not None and build.built_for == _today():
+                    wanted |= build.symbols # Supersede the running build rather than racing it
+                build = _PanelBuild(built_for=_today(), symbols=frozenset(wanted), future=Future())
+                _build = build
+
+        if not building:
+            build.future.result() # Raises the builder's error too
+            continue
+
+        try:
+            new_panel = build_panel(build.symbols, timings=timings)
+        except Exception as e:
+            with _panel_lock:
+                if _build is build:
+                    _build = None
+            build.future.set_exception(e)
+            raise
+        with _panel_lock:
+            current = _panel
+            if current is None or current.built_for != new_panel.built_for \
+                    or set(current.symbols) | current.unavailable <= build.symbols:
+                _panel = new_panel
+            if _build is build:
+                _build = None
+        build.future.set_result(new_panel)
+        return new_panel
+
+
+def get_panel(db: Session, symbols: Iterable[str], lookback_days: int, timings: Optional[Dict[str, float]] = None) -> ReturnsPanel:
+    """
+    A panel covering `symbols` with at least `lookback_days` of history. Served from the shared
+    panel when possible; it is rebuilt on the first request of a new day and extended when a symbol
+    appears that was bought after it was built. Longer lookbacks than the shared panel holds get
+    a one-off panel for just these symbols. `timings` receives any fetch/align time spent building.
+    """
+    symbols = {symbol.upper() for symbol in symbols}
+    if lookback_days > RETURNS_PANEL_LOOKBACK_DAYS:
+        return build_panel(symbols, lookback_days, timings=timings)
+    return _shared_panel(db, symbols, timings)
@@ -0,0 +1,333 @@
+"""
+Historical and hypothetical stress tests.
+
+Every scenario reduces to one return per symbol, so the scenarios form a (scenarios x symbols)
+matrix built once per trading day for every held symbol. A portfolio's stressed P&L is that
+matrix times its position values, and the whole book is one matrix-matrix product.
+
+Historical scenarios use each symbol's actual return between two dates; symbols without history
+that far back fall back to their beta to the benchmark times the benchmark's return. Hypothetical
+scenarios shock proxy symbols (the market, a sector ETF, long Treasuries) and move every symbol
+by its beta to each shocked proxy.
+"""
+from sqlalchemy.orm import Session
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+from app.models.user import User
+from app.models.holding import Holding
+from app.models.enums import StressScenarioKind
+from app.crud import crud_holding
+from app.schemas.stress_test import StressScenarioResult, StressTestResponse, StressTestBatchResponse
+from app.services import market_data_service, returns_panel_service, risk_service
+from app.core.config import ANALYTICS_BENCHMARK_SYMBOL, STRESS_BETA_LOOKBACK_DAYS
+
+logger = logging.getLogger(__name__)
+
+MIN_BETA_OBSERVATIONS = 60 # Overlapping daily returns needed before a beta is trusted
+
+
+@dataclass(frozen=True)
+class StressScenario:
+    name: str
+    kind: StressScenarioKind
+    description: str
+    start: Optional[date] = None # Historical: closes on or before start and end
+    end: Optional[date] = None
+    factor_shocks: Dict[str, float] = field(default_factory=dict) # Hypothetical: proxy symbol -> return
+
+
+STRESS_SCENARIOS: Tuple[StressScenario, ...] = (
+    StressScenario("gfc_2008", StressScenarioKind.HISTORICAL, "Global financial crisis: Lehman failure to the March 2009 low",
+                   start=date(2008, 9, 12), end=date(2009, 3, 9)),
+    StressScenario("q4_2018", StressScenarioKind.HISTORICAL, "Q4 2018 selloff on rate hikes and trade tensions",
+                   start=date(2018, 9, 20), end=date(2018, 12, 24)),
+    StressScenario("covid_2020_03", StressScenarioKind.HISTORICAL, "COVID-19 crash, February 2020 peak to the March 2020 low",
+                   start=date(2020, 2, 19), end=date(2020, 3, 23)),
+    StressScenario("rates_2022", StressScenarioKind.HISTORICAL, "2022 inflation and rate-hike bear market",
+                   start=date(2022, 1, 3), end=date(2022, 10, 12)),
+    StressScenario("market_down_20", StressScenarioKind.HYPOTHETICAL, "Broad equity market falls 20%",
+                   factor_shocks={"SPY": -0.20}),
+    StressScenario("tech_down_20", StressScenarioKind.HYPOTHETICAL, "Technology sector falls 20%",
+                   factor_shocks={"XLK": -0.20}),
+    StressScenario("financials_down_20", StressScenarioKind.HYPOTHETICAL, "Financial sector falls 20%",
+                   factor_shocks={"XLF": -0.20}),
+    StressScenario("energy_down_20", StressScenarioKind.HYPOTHETICAL, "Energy sector falls 20%",
+                   factor_shocks={"XLE": -0.20}),
+    StressScenario("rates_up_100bp", StressScenarioKind.HYPOTHETICAL, "Long-term rates up 100bp (long Treasuries fall ~17% at their duration)",
+                   factor_shocks={"TLT": -0.17}),
+)
+
+
+@dataclass(frozen=True)
+class StressMatrix:
+    scenarios: Tuple[StressScenario, ...]
+    symbols: Tuple[str, ...]
+    shocks: np.ndarray # (scenarios, symbols) scenario return per symbol, NaN where unknown
+    proxied: np.ndarray # (scenarios, symbols) True where a historical return came from the benchmark beta
+    built_for: date
+    column: Dict[str, int] = field(default_factory=dict)
+
+    def columns_for(self, symbols: Iterable[str]) -> List[int]:
+        return [self.column[symbol] for symbol in symbols]
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _betas(returns: np.ndarray, factor_returns: np.ndarray) -> np.ndarray:
+    """
+    OLS beta of every column of `returns` on each factor column separately, over the dates both
+    have a return: (factors x symbols), NaN with too little overlap. Vectorized across symbols.
+    """
+    has_return = ~np.isnan(returns)
+    y = np.where(has_return, returns, 0.0)
+    betas = np.full((factor_returns.shape[1], returns.shape[1]), np.nan)
+    for k in range(factor_returns.shape[1]):
+        factor = factor_returns[:, k]
+        valid = has_return & ~np.isnan(factor)[:, None]
+        x = np.where(valid, np.nan_to_num(factor)[:, None], 0.0)
+        y_valid = np.where(valid, y, 0.0)
+        n = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sum_x, sum_y = x.sum(axis=0), y_valid.sum(axis=0)
+            covariance = (x * y_valid).sum(axis=0) - sum_x * sum_y / n
+            variance = (x * x).sum(axis=0) - sum_x * sum_x / n
+            betas[k] = np.where((n >= MIN_BETA_OBSERVATIONS) & (variance > 0), covariance / variance, np.nan)
+    return betas
+
+
+def _window_returns(symbols: List[str], scenarios: List[StressScenario]) -> np.ndarray:
+    """(historical scenarios x symbols) return from the close on/before start to the close on/before end."""
+    window_returns = np.full((len(scenarios), len(symbols)), np.nan)
+    if not scenarios or not symbols:
+        return window_returns
+    earliest = min(scenario.start for scenario in scenarios)
+    lookback_days = int((_today() - earliest).days * 252 / 365) + 10
+    histories = market_data_service.get_historical_data_many(symbols, lookback_days=lookback_days)
+    closes: Dict[str, pd.Series] = {}
+    for symbol, hist_df in histories.items():
+        if hist_df is None or hist_df.empty or "adjusted_close" not in hist_df.columns:
+            continue
+        series = hist_df["adjusted_close"].sort_index()
+        index = pd.DatetimeIndex(series.index)
+        if index.tz is not None:
+            index = index.tz_convert("UTC").tz_localize(None)
+        series.index = index.normalize()
+        closes[symbol] = series[~series.index.duplicated(keep="last")]
+    if not closes:
+        return window_returns
+
+    frame = pd.concat(closes, axis=1).sort_index()
+    first_dates = frame.apply(lambda column: column.first_valid_index()).to_numpy(dtype="datetime64[ns]")
+    prices = frame.ffill().to_numpy(dtype=np.float64) # Forward-filled: a row holds each symbol's last close so far
+    dates = frame.index.values
+    position = {symbol: i for i, symbol in enumerate(symbols)}
+    columns = [position[symbol] for symbol in frame.columns]
+    for s, scenario in enumerate(scenarios):
+        start, end = np.datetime64(scenario.start, "ns"), np.datetime64(scenario.end, "ns")
+        start_row = np.searchsorted(dates, start, side="right") - 1
+        end_row = np.searchsorted(dates, end, side="right") - 1
+        if start_row < 0:
+            continue
+        with np.errstate(invalid="ignore", divide="ignore"):
+            returns = prices[end_row] / prices[start_row] - 1.0
+        returns[first_dates > start] = np.nan # Listed after the window began
+        window_returns[s, columns] = returns
+    return window_returns
+
+
+def build_matrix(db: Session, symbols: Iterable[str]) -> StressMatrix:
+    """Scenario returns for the symbols: one history fetch for the windows, one returns panel for the betas."""
+    symbols = sorted({symbol.upper() for symbol in symbols})
+    scenarios = STRESS_SCENARIOS
+    historical = [scenario for scenario in scenarios if scenario.kind == StressScenarioKind.HISTORICAL]
+    factors = sorted({ANALYTICS_BENCHMARK_SYMBOL} | {f for scenario in scenarios for f in scenario.factor_shocks})
+
+    panel = returns_panel_service.get_panel(db=db, symbols=set(symbols) | set(factors), lookback_days=STRESS_BETA_LOOKBACK_DAYS)
+    window = panel.window(STRESS_BETA_LOOKBACK_DAYS)
+    symbol_returns = np.column_stack([window[:, panel.column[s]] if s in panel.column else np.full(len(window), np.nan) for s in symbols]) \
+        if symbols else np.empty((len(window), 0))
+    factor_returns = np.column_stack([window[:, panel.column[f]] if f in panel.column else np.full(len(window), np.nan) for f in factors])
+    betas = _betas(symbol_returns, factor_returns)
+    column = {symbol: i for i, symbol in enumerate(symbols)}
+    for k, factor in enumerate(factors): # A proxy moves one-for-one with itself
+        if factor in column:
+            betas[k, column[factor]] = 1.0
+    factor_row = {factor: k for k, factor in enumerate(factors)}
+
+    fetched = symbols if ANALYTICS_BENCHMARK_SYMBOL in column else symbols + [ANALYTICS_BENCHMARK_SYMBOL] # Held benchmark: fetch it once
+    fetched_returns = _window_returns(fetched, historical)
+    benchmark_returns = fetched_returns[:, fetched.index(ANALYTICS_BENCHMARK_SYMBOL)]
+    window_returns = fetched_returns[:, :len(symbols)]
+    benchmark_betas = betas[factor_row[ANALYTICS_BENCHMARK_SYMBOL]]
+
+    shocks = np.full((len(scenarios), len(symbols)), np.nan)
+    proxied = np.zeros((len(scenarios), len(symbols)), dtype=bool)
+    h = 0
+    for s, scenario in enumerate(scenarios):
+        if scenario.kind == StressScenarioKind.HISTORICAL:
+            missing = np.isnan(window_returns[h])
+            shocks[s] = np.where(missing, benchmark_betas * benchmark_returns[h], window_returns[h])
+            proxied[s] = missing & ~np.isnan(shocks[s])
+            h += 1
+        else:
+            shocks[s] = sum(betas[factor_row[f]] * shock for f, shock in scenario.factor_shocks.items())
+
+    logger.info(f"Built stress matrix: {len(scenarios)} scenarios x {len(symbols)} symbols, {int(np.isnan(shocks).sum())} unknown, {int(proxied.sum())} proxied.")
+    return StressMatrix(
+        scenarios=scenarios, symbols=tuple(symbols), shocks=shocks, proxied=proxied, built_for=_today(),
+        column=column
+    )
+
+
+_matrix: Optional[StressMatrix] = None
+_matrix_lock = threading.Lock() # Guards _matrix and _build; never held while building
+
+
+@dataclass
+class _MatrixBuild:
+    """A rebuild in progress. Requests it covers wait on its future instead of building again."""
+    built_for: date
+    symbols: FrozenSet[str]
+    future: Future
+
+
+_build: Optional[_MatrixBuild] = None
+
+
+def _covers(matrix: Optional[StressMatrix], symbols: Set[str]) -> bool:
+    return matrix is not None and matrix.built_for == _today() and symbols <= set(matrix.symbols)
+
+
+def get_matrix(db: Session, symbols: Iterable[str]) -> StressMatrix:
+    """
+    The shared stress matrix, rebuilt on the first request of a new day or when a new symbol appears.
+    As with the returns panel, one thread builds outside _matrix_lock while requests the build will
+    cover wait for it and every other request keeps reading the current matrix.
+    """
+    global _matrix, _build
+    symbols = {symbol.upper() for symbol in symbols}
+    while True:
+        matrix = _matrix
+        if _covers(matrix, symbols):
+            return matrix
+        held = {row[0].upper() for row in db.query(Holding.symbol).distinct().all()}
+        wanted = held | symbols | (set(matrix.symbols) if matrix is not None else set())
+
+        with _matrix_lock:
+            if _covers(_matrix, symbols):
+                return _matrix
+            build = _build
+            building = build is None or build.built_for != _today() or not symbols <= build.symbols
+            if building:
+                if build is not None and build.built_for == _today():
+                    wanted |= build.symbols # Supersede the running build rather than racing it
+                build = _MatrixBuild(built_for=_today(), symbols=frozenset(wanted), future=Future())
+                _build = build
+
+        if not building:
+            build.future.result() # Raises the builder's error too
+            continue
+
+        try:
+            new_matrix = build_matrix(db, build.symbols)
+        except Exception as e:
+            with _matrix_lock:
+                if _build is build:
+                    _build = None
+            build.future.set_exception(e)
+            raise
+        with _matrix_lock:
+            current = _matrix
+            if current is None or current.built_for != new_matrix.built_for or set(current.symbols) <= build.symbols:
+                _matrix = new_matrix
+            if _build is build:
+                _build = None
+        build.future.set_result(new_matrix)
+        return new_matrix
+
+
+def _stress(matrix: StressMatrix, symbols: List[str], values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (pnl, proxied_value, uncovered_value), each (scenarios x portfolios), for position values
+    laid out (symbols x portfolios). Three matrix products, however many portfolios.
+    """
+    shocks = matrix.shocks[:, matrix.columns_for(symbols)]
+    known = ~np.isnan(shocks)
+    pnl = np.where(known, shocks, 0.0) @ values
+    uncovered = (~known).astype(np.float64) @ values
+    proxied = matrix.proxied[:, matrix.columns_for(symbols)].astype(np.float64) @ values
+    return pnl, proxied, uncovered
+
+
+def run_stress_test(db: Session, user: User) -> StressTestResponse:
+    """Every scenario's P&L for the user's current holdings."""
+    quantities: Dict[str, float] = {}
+    for holding in crud_holding.get_all_holdings(db=db, user_id=user.id):
+        quantities[holding.symbol.upper()] = quantities.get(holding.symbol.upper(), 0.0) + float(holding.quantity)
+    prices = market_data_service.get_current_prices(list(quantities))
+    excluded = sorted(symbol for symbol in quantities if prices.get(symbol) is None)
+    symbols = sorted(symbol for symbol in quantities if prices.get(symbol) is not None)
+    values = np.array([prices[symbol] * quantities[symbol] for symbol in symbols], dtype=np.float64)
+    portfolio_value = float(values.sum())
+
+    matrix = get_matrix(db, symbols)
+    pnl, proxied, uncovered = _stress(matrix, symbols, values.reshape(-1, 1))
+    results = [
+        StressScenarioResult(
+            name=scenario.name, kind=scenario.kind, description=scenario.description,
+            pnl=float(pnl[s, 0]),
+            pnl_pct=float(pnl[s, 0] / portfolio_value) if portfolio_value > 0 else None,
+            proxied_value=float(proxied[s, 0]),
+            uncovered_value=float(uncovered[s, 0])
+        )
+        for s, scenario in enumerate(matrix.scenarios)
+    ]
+    return StressTestResponse(as_of=matrix.built_for, portfolio_value=portfolio_value, results=results, excluded_symbols=excluded)
+
+
+def run_stress_tests_for_users(db: Session, positions: Dict[int, Dict[str, float]]) -> StressTestBatchResponse:
+    """
+    Scenario P&L for many users at once. `positions` maps user_id -> {symbol: current value};
+    every user's results come from one (scenarios x symbols) @ (symbols x users) product.
+    """
+    user_ids = list(positions)
+    symbols = sorted({symbol.upper() for user_positions in positions.values() for symbol in user_positions})
+    matrix = get_matrix(db, symbols)
+    row_of = {symbol: i for i, symbol in enumerate(symbols)}
+    values = np.zeros((len(symbols), len(user_ids)))
+    for j, user_id in enumerate(user_ids):
+        for symbol, value in positions[user_id].items():
+            values[row_of[symbol.upper()], j] += value
+
+    pnl, _, _ = _stress(matrix, symbols, values)
+    logger.info(f"Stress tested {len(user_ids)} users across {len(matrix.scenarios)} scenarios.")
+    return StressTestBatchResponse(
+        as_of=matrix.built_for,
+        scenarios=[scenario.name for scenario in matrix.scenarios],
+        user_ids=user_ids,
+        portfolio_values=values.sum(axis=0).tolist(),
+        pnl=pnl.T.tolist()
+    )
+
+
+def run_stress_tests_for_all_users(db: Session) -> StressTestBatchResponse:
+    """Scenario P&L for every user with holdings: one holdings query, one price fetch, one product."""
+    positions, _ = risk_service.book_positions(db)
+    return run_stress_tests_for_users(db=db, positions=positions)
+
+
+def stress_test_job(db: Session, payload: Dict[str, Any]) -> StressTestResponse:
+    """Job handler for asynchronous stress tests. payload: user_id."""
+    user = db.get(User, payload["user_id"])
+    if user is None:
+        raise ValueError(f"User {payload['user_id']} not found.")
+    return run_stress_test(db=db, user=user)
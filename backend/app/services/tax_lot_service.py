@@ -0,0 +1,74 @@
+from sqlalchemy.orm import Session
+from app.models.account import Account
+from app.models.holding import Holding
+from app.models.enums import TaxLotMethod
+from app.crud import crud_tax_lot
+from app.core.config import TAX_LOT_METHOD
+import decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Open lots fetched per round trip while closing a sell; most sells close one or two lots
+LOT_FETCH_BATCH_SIZE = 50
+
+
+def open_lot(db: Session, user_id: int, symbol: str, quantity: int, price: decimal.Decimal):
+    """ Records a buy fill as a new tax lot. Does NOT commit. """
+    crud_tax_lot.create_tax_lot(db=db, user_id=user_id, symbol=symbol, quantity=quantity, cost_basis=price)
+
+
+def close_lots(
+    db: Session,
+    db_account: Account,
+    db_holding: Holding,
+    quantity: int,
+    price: decimal.Decimal,
+    method: str = TAX_LOT_METHOD
+) -> decimal.Decimal:
+    """
+    Closes `quantity` shares out of the holding's open lots and books the realized P&L on the
+    account and the per-symbol total. Must run before the holding's quantity is reduced.
+    Each lot is closed at most once, so the work is amortized O(1) per fill. Does NOT commit.
+    Returns the realized P&L of this sell.
+    """
+    method = TaxLotMethod(method)
+    user_id, symbol = db_holding.user_id, db_holding.symbol
+
+    remaining = quantity
+    lots_cost = decimal.Decimal("0")
+    while remaining > 0:
+        lots = crud_tax_lot.get_open_lots(
+            db=db, user_id=user_id, symbol=symbol,
+            newest_first=(method == TaxLotMethod.LIFO), limit=LOT_FETCH_BATCH_SIZE
+        )
+        if not lots:
+            break
+        for lot in lots:
+            take = min(lot.open_quantity, remaining)
+            lot.open_quantity -= take
+            lots_cost += lot.cost_basis * take
+            remaining -= take
+            if remaining == 0:
+                break
+        db.flush() # The next batch must not see the lots just closed
+
+    if remaining > 0:
+        # Holding predates the ledger (or lots were edited by hand); fall back to its average cost
+        logger.warning(f"Tax lots for user {user_id} {symbol} short by {remaining} shares; using average cost.")
+        lots_cost += db_holding.average_cost_basis * remaining
+
+    if method == TaxLotMethod.AVG:
+        closed_cost = db_holding.average_cost_basis * quantity
+    else:
+        closed_cost = lots_cost
+        # Keep the holding's average cost equal to the cost of the lots still open
+        remaining_quantity = db_holding.quantity - quantity
+        if remaining_quantity > 0:
+            remaining_cost = db_holding.average_cost_basis * db_holding.quantity - closed_cost
+            db_holding.average_cost_basis = remaining_cost / remaining_quantity
+
+    realized = price * quantity - closed_cost
+    crud_tax_lot.add_realized_pnl(db=db, user_id=user_id, symbol=symbol, amount=realized, quantity_closed=quantity)
+    db_account.realized_pnl = (db_account.realized_pnl or decimal.Decimal("0")) + realized
+    return realized
@@ -1,5 +1,6 @@
 from app.db.session import SessionLocal
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from typing import Union, List, Dict, Optional
 from app.models.user import User
 from app.models.trade import Trade, TradeType as ModelTradeType
@@ -9,13 +10,26 @@ from app.schemas.order import OrderCreate
 from app.schemas.trade import Trade as TradeSchema
 from app.schemas.pending_order import PendingOrder as PendingOrderSchema
 from app.crud import crud_account, crud_holding, crud_trade, crud_pending_order, crud_user, crud_portfolio_snapshot
-from app.services import market_data_service, portfolio_service
+from app.services import market_data_service, portfolio_service, idempotency_service, group_commit_service, tax_lot_service, leaderboard_service
+from app.core.config import GROUP_COMMIT_ENABLED
 from fastapi import HTTPException, status
 import decimal
+import functools
 import logging
 
 logger = logging.getLogger(__name__)
 
+def limit_order_triggered(order_type: OrderType, current_price, limit_price):
+    """
+    Execution condition for limit orders: buys fill at or below the limit, sells at or above.
+    Shared with the backtester, so it also works element-wise on NumPy price arrays.
+    """
+    if order_type == OrderType.LIMIT_BUY:
+        return current_price <= limit_price
+    if order_type == OrderType.LIMIT_SELL:
+        return current_price >= limit_price
+    return False
+
 # Helper function for the actual database updates for an executed trade
 def _execute_trade_updates(
     db: Session,
@@ -40,6 +54,7 @@ def _execute_trade_updates(
         else:
             db_holding = crud_holding.create_holding(db, user.id, symbol, quantity, execution_price)
             db.add(db_holding) # Add new holding to session
+        tax_lot_service.open_lot(db, user.id, symbol, quantity, execution_price)
 
     elif execution_type == ModelTradeType.SELL:
          # Check shares again just before execution
@@ -47,10 +62,14 @@ def _execute_trade_updates(
              raise ValueError("Insufficient shares at time of execution.")
         proceeds = execution_price * quantity
         db_account.cash_balance += proceeds
+        tax_lot_service.close_lots(db, db_account, db_holding, quantity, execution_price)
         crud_holding.update_holding_on_sell(db_holding, quantity)
         if db_holding.quantity == 0:
             crud_holding.delete_holding(db, db_holding) # Delete if quantity is zero
 
+    crud_account.bump_position_version(db_account)
+    leaderboard_service.mark_dirty(db, user.id)
+
     # Record the actual trade
     db_trade = crud_trade.create_trade(
         db=db, user_id=user.id, symbol=symbol, quantity=quantity,
@@ -62,12 +81,52 @@ def _execute_trade_updates(
     return db_trade
 
 
-def place_order(db: Session, user: User, order: OrderCreate) -> Union[Trade, PendingOrder]:
-    """Handles placement of Market or Limit orders."""
+def _apply_market_order(
+    db: Session,
+    user_id: int,
+    symbol: str,
+    quantity: int,
+    execution_price: decimal.Decimal,
+    execution_type: ModelTradeType,
+    idempotency_key: Optional[str] = None,
+    request_hash: Optional[str] = None
+) -> TradeSchema:
+    """
+    Unit of work for the group-commit executor. Runs inside the batch's savepoint for this order
+    and returns a detached schema, since the batch session is closed before callers read it.
+    """
+    user = db.get(User, user_id) # Identity map: one lookup per user per batch
+    if user is None:
+        raise ValueError(f"User with ID {user_id} not found.")
+    db_trade = _execute_trade_updates(db, user, symbol, quantity, execution_price, execution_type)
+    if idempotency_key:
+        return idempotency_service.record_result(db, user_id, idempotency_key, request_hash, db_trade)
+    return TradeSchema.model_validate(db_trade)
+
+
+def place_order(
+    db: Session,
+    user: User,
+    order: OrderCreate,
+    idempotency_key: Optional[str] = None
+) -> Union[Trade, PendingOrder, TradeSchema, PendingOrderSchema]:
+    """
+    Handles placement of Market or Limit orders.
+    If an idempotency_key is given and was seen before, the stored result is returned
+    without executing the order again.
+    """
     symbol = order.symbol
     quantity = order.quantity
     order_type = order.order_type
 
+    request_hash: Optional[str] = None
+    if idempotency_key:
+        request_hash = idempotency_service.compute_request_hash(order)
+        stored_result = idempotency_service.get_stored_result(db, user.id, idempotency_key, request_hash)
+        if stored_result is not None:
+            logger.info(f"User {user.id} replayed Idempotency-Key '{idempotency_key}'. Returning stored result.")
+            return stored_result
+
     try:
         # --- Market Order Logic ---
         if order_type in [OrderType.MARKET_BUY, OrderType.MARKET_SELL]:
@@ -83,10 +142,33 @@ def place_order(db: Session, user: User, order: OrderCreate) -> Union[Trade, Pen
             # Map Market OrderType to TradeType for execution record
             execution_type = ModelTradeType.BUY if order_type == OrderType.MARKET_BUY else ModelTradeType.SELL
 
+            if GROUP_COMMIT_ENABLED:
+                user_id = user.id
+                # Creating a missing account commits, so it must happen before the order joins a batch
+                crud_account.get_or_create_account(db=db, user=user)
+                # Hand this request's connection back while waiting; a burst of waiting requests
+                # must not exhaust the pool the batch itself needs
+                db.commit()
+                trade_result = group_commit_service.get_executor().execute(functools.partial(
+                    _apply_market_order, user_id=user_id, symbol=symbol, quantity=quantity,
+                    execution_price=execution_price, execution_type=execution_type,
+                    idempotency_key=idempotency_key, request_hash=request_hash
+                ))
+                logger.info(f"User {user_id} Market {execution_type.value} {quantity} {symbol} @ {execution_price:.2f} (group commit)")
+                if idempotency_key:
+                    idempotency_service.remember_result(user_id, idempotency_key, request_hash, trade_result)
+                return trade_result
+
             # Perform the actual execution and DB updates
             db_trade = _execute_trade_updates(db, user, symbol, quantity, execution_price, execution_type)
+            if idempotency_key:
+                # Stored in the same transaction, so the key exists if and only if the trade does
+                trade_result = idempotency_service.record_result(db, user.id, idempotency_key, request_hash, db_trade)
             db.commit() # Commit the transaction for market order
             logger.info(f"User {user.id} Market {execution_type.value} {quantity} {symbol} @ {execution_price:.2f}")
+            if idempotency_key:
+                idempotency_service.remember_result(user.id, idempotency_key, request_hash, trade_result)
+                return trade_result
             return db_trade
 
         # --- Limit Order Logic ---
@@ -110,9 +192,13 @@ def place_order(db: Session, user: User, order: OrderCreate) -> Union[Trade, Pen
 
             # Create Pending Order record
             pending_order = crud_pending_order.create_pending_order(db=db, user_id=user.id, order_data=order)
+            if idempotency_key:
+                order_result = idempotency_service.record_result(db, user.id, idempotency_key, request_hash, pending_order)
             db.commit() # Commit the creation of the pending order
             db.refresh(pending_order) # Ensure all fields are loaded
             logger.info(f"User {user.id} Limit {order_type.value} {quantity} {symbol} @ {limit_price:.2f} PLACED (Pending ID: {pending_order.id})")
+            if idempotency_key:
+                idempotency_service.remember_result(user.id, idempotency_key, request_hash, order_result)
             return pending_order # Return the newly created pending order
 
         else: # Should not happen if OrderType enum is used correctly
@@ -122,6 +208,19 @@ def place_order(db: Session, user: User, order: OrderCreate) -> Union[Trade, Pen
         db.rollback()
         logger.warning(f"Order placement failed for user {user.id}: {http_exc.detail}")
         raise http_exc
+    except IntegrityError as integrity_error:
+        db.rollback()
+        if idempotency_key:
+            # A concurrent request with the same key committed first; serve its result instead
+            stored_result = idempotency_service.get_stored_result(db, user.id, idempotency_key, request_hash)
+            if stored_result is not None:
+                logger.info(f"User {user.id} lost Idempotency-Key race for '{idempotency_key}'. Returning stored result.")
+                return stored_result
+        logger.error(f"Integrity error during place_order for user {user.id}: {integrity_error}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred while processing the order."
+        )
     except Exception as e:
         db.rollback()
         logger.error(f"Unexpected error during place_order for user {user.id}: {e}", exc_info=True)
@@ -190,14 +289,10 @@ def _check_and_execute_logic(db: Session) -> Dict[str, int]:
             logger.warning(f"Skipping order {order.id} for {order.symbol} - could not fetch current price during check.")
             continue
 
-        should_execute = False
         execution_price = order.limit_price
 
         # Check execution conditions
-        if order.order_type == OrderType.LIMIT_BUY and current_price_decimal <= order.limit_price:
-            should_execute = True
-        elif order.order_type == OrderType.LIMIT_SELL and current_price_decimal >= order.limit_price:
-            should_execute = True
+        should_execute = limit_order_triggered(order.order_type, current_price_decimal, order.limit_price)
 
         if not should_execute:
             continue # Condition not met, move to next order
@@ -205,6 +300,12 @@ def _check_and_execute_logic(db: Session) -> Dict[str, int]:
         # --- Attempt Execution (If should_execute is True) ---
         logger.info(f"Condition met for order {order.id}. Attempting execution...")
         try:
+            # Claim the order first; another checker run may have executed it since we loaded it
+            if not crud_pending_order.claim_pending_order(db=db, order_id=order.id):
+                db.rollback()
+                logger.info(f"Order {order.id} was already handled elsewhere. Skipping.")
+                continue
+
             # --- Step 1: Fetch the User object ---
             user = crud_user.get_user(db, user_id=order.user_id)
             if not user:
@@ -241,9 +342,6 @@ def _check_and_execute_logic(db: Session) -> Dict[str, int]:
                 execution_type=execution_type
             )
 
-            # Update the pending order status to EXECUTED
-            crud_pending_order.update_pending_order_status(db=db, db_order=order, status=OrderStatus.EXECUTED)
-
             db.commit() # Commit transaction for THIS successful order execution
             executed_count += 1
             logger.info(f"Successfully executed pending order {order.id}. Trade ID: {executed_trade.id}")
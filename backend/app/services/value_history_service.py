@@ -0,0 +1,135 @@
+from sqlalchemy.orm import Session
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+import numpy as np
+import pandas as pd
+
+from app.crud import crud_portfolio_snapshot, crud_portfolio_value_rollup
+from app.models.enums import ValueHistoryBucket
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_BUCKETS = (ValueHistoryBucket.WEEK, ValueHistoryBucket.MONTH)
+
+
+def bucket_start(day: date, bucket: ValueHistoryBucket) -> date:
+    """Monday of the day's ISO week, or the first of its month. Days are their own bucket."""
+    if bucket == ValueHistoryBucket.WEEK:
+        return day - timedelta(days=day.weekday())
+    if bucket == ValueHistoryBucket.MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def _rollup_rows(snapshots: pd.DataFrame, bucket: ValueHistoryBucket, only_bucket_start: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Closing value per (user, bucket) from a frame of user_id/snapshot_date/timestamp/total_value rows."""
+    frame = snapshots.assign(bucket_start=[bucket_start(d, bucket) for d in snapshots["snapshot_date"]])
+    if only_bucket_start is not None:
+        frame = frame[frame["bucket_start"] == only_bucket_start]
+    if frame.empty:
+        return []
+    frame = frame.sort_values(["user_id", "bucket_start", "snapshot_date"])
+    grouped = frame.groupby(["user_id", "bucket_start"], sort=False)
+    closes = grouped.tail(1).set_index(["user_id", "bucket_start"])
+    counts = grouped.size()
+    return [
+        {
+            "user_id": int(user_id), "bucket": bucket, "bucket_start": start,
+            "close_value": closes.at[(user_id, start), "total_value"],
+            "close_timestamp": closes.at[(user_id, start), "timestamp"],
+            "snapshot_count": int(count),
+        }
+        for (user_id, start), count in counts.items()
+    ]
+
+
+def refresh_rollups(db: Session, as_of: date) -> int:
+    """
+    Recomputes the week and month rollups containing `as_of` for every user from that period's
+    daily snapshots (at most ~5 weeks of rows per user), so same-day reruns stay exact.
+    Does NOT commit. Returns the number of rollup rows written.
+    """
+    since = min(bucket_start(as_of, bucket) for bucket in ROLLUP_BUCKETS)
+    rows = crud_portfolio_snapshot.get_snapshot_values_since(db=db, since_date=since)
+    if not rows:
+        return 0
+    snapshots = pd.DataFrame(rows, columns=["user_id", "snapshot_date", "timestamp", "total_value"])
+    rollups: List[Dict[str, Any]] = []
+    for bucket in ROLLUP_BUCKETS:
+        rollups.extend(_rollup_rows(snapshots, bucket, only_bucket_start=bucket_start(as_of, bucket)))
+    written = crud_portfolio_value_rollup.upsert_rollups(db=db, rollups=rollups)
+    logger.info(f"Refreshed {written} weekly/monthly value rollups for {as_of}.")
+    return written
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Recomputes every rollup from all daily snapshots (after bulk loads or restores). Does NOT commit."""
+    rows = crud_portfolio_snapshot.get_snapshot_values_since(db=db)
+    if not rows:
+        return 0
+    snapshots = pd.DataFrame(rows, columns=["user_id", "snapshot_date", "timestamp", "total_value"])
+    rollups: List[Dict[str, Any]] = []
+    for bucket in ROLLUP_BUCKETS:
+        rollups.extend(_rollup_rows(snapshots, bucket))
+    return crud_portfolio_value_rollup.upsert_rollups(db=db, rollups=rollups)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points that preserve the series' visual shape.
+    Always keeps the first and last point. x must be increasing.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64) # n_out - 2 buckets between the endpoints
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def get_value_history_rows(
+    db: Session,
+    user_id: int,
+    bucket: Optional[ValueHistoryBucket] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: Optional[int] = 1000,
+    max_points: Optional[int] = None,
+    after: Optional[datetime] = None
+) -> Tuple[List[Any], Optional[datetime]]:
+    """
+    Value history as (timestamp, total_value) rows. Daily points come from the snapshots
+    (one per day), weekly/monthly points from the precomputed rollups. `limit` caps the rows
+    read; `max_points` then downsamples the result with LTTB.
+    Also returns the timestamp to pass as `after` for the next page, or None on the last page.
+    """
+    if bucket in (ValueHistoryBucket.WEEK, ValueHistoryBucket.MONTH):
+        rows = crud_portfolio_value_rollup.get_rollup_values_for_user(
+            db=db, user_id=user_id, bucket=bucket, start_date=start_date, end_date=end_date, limit=limit, after=after
+        )
+    else:
+        rows = crud_portfolio_snapshot.get_snapshot_values_for_user(
+            db=db, user_id=user_id, start_date=start_date, end_date=end_date, limit=limit, after=after
+        )
+    next_after = rows[-1][0] if limit and len(rows) == limit else None
+
+    if max_points and len(rows) > max_points:
+        x = np.array([row[0].timestamp() for row in rows], dtype=np.float64)
+        y = np.array([row[1] for row in rows], dtype=np.float64)
+        rows = [rows[i] for i in lttb_indices(x, y, max_points)]
+    return rows, next_after
@@ -0,0 +1,116 @@
+"""
+What-if simulation: a basket of hypothetical orders applied to an in-memory copy of the user's
+holdings, with valuation, allocation and historical VaR before and after.
+
+Nothing is written: holdings and prices come from the cached portfolio, returns from the shared
+returns panel, and both portfolios' risk from one (dates x symbols) @ (symbols x 2) product.
+"""
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+import decimal
+import logging
+import numpy as np
+
+from app.models.user import User
+from app.models.enums import OrderType
+from app.schemas.what_if import WhatIfRequest, WhatIfPosition, WhatIfRisk, WhatIfResponse
+from app.services import market_data_service, portfolio_service, risk_service
+
+logger = logging.getLogger(__name__)
+
+BUY_ORDER_TYPES = (OrderType.MARKET_BUY, OrderType.LIMIT_BUY)
+
+
+def _risk(tail) -> Optional[WhatIfRisk]:
+    return WhatIfRisk(var_amount=tail[0], expected_shortfall=tail[1]) if tail is not None else None
+
+
+def simulate(db: Session, user: User, request: WhatIfRequest) -> WhatIfResponse:
+    """
+    Applies `request.orders` in sequence to the current holdings and cash. Market orders fill at
+    the current price, limit orders at their limit price. Raises ValueError when an order has no
+    price or would overdraw cash or sell more shares than held at that point, as placing it would.
+    """
+    portfolio = portfolio_service.get_portfolio(db=db, user=user)
+    cash = portfolio.cash_balance
+    held: Dict[str, int] = {}
+    prices: Dict[str, Optional[float]] = {}
+    for holding in portfolio.holdings:
+        held[holding.symbol] = held.get(holding.symbol, 0) + holding.quantity
+        prices[holding.symbol] = float(holding.current_price) if holding.current_price is not None else None
+    new_symbols = sorted({order.symbol for order in request.orders} - set(prices))
+    if new_symbols:
+        prices.update(market_data_service.get_current_prices(new_symbols))
+
+    # Fills in sequence, so a sell can fund a later buy
+    cash_after = cash
+    quantities_after = dict(held)
+    for i, order in enumerate(request.orders):
+        if order.limit_price is not None:
+            fill_price = order.limit_price
+        elif prices.get(order.symbol) is not None:
+            fill_price = decimal.Decimal(str(prices[order.symbol]))
+        else:
+            raise ValueError(f"Order {i + 1}: market price for {order.symbol} unavailable.")
+        held_qty = quantities_after.get(order.symbol, 0)
+        if order.order_type in BUY_ORDER_TYPES:
+            cash_after -= fill_price * order.quantity
+            if cash_after < 0:
+                raise ValueError(f"Order {i + 1}: insufficient funds to buy {order.quantity} {order.symbol}. Short by {-cash_after:.2f}")
+            quantities_after[order.symbol] = held_qty + order.quantity
+        else:
+            if order.quantity > held_qty:
+                raise ValueError(f"Order {i + 1}: insufficient shares to sell {order.symbol}. Held: {held_qty}, Trying to sell: {order.quantity}")
+            cash_after += fill_price * order.quantity
+            quantities_after[order.symbol] = held_qty - order.quantity
+
+    symbols = sorted(quantities_after)
+    price = np.array([prices.get(symbol) if prices.get(symbol) is not None else np.nan for symbol in symbols], dtype=np.float64)
+    before = np.array([held.get(symbol, 0) for symbol in symbols], dtype=np.float64)
+    after = np.array([quantities_after[symbol] for symbol in symbols], dtype=np.float64)
+    values = np.nan_to_num(np.column_stack([before, after]) * price[:, None]) # Unpriced symbols count as 0, as in the portfolio
+    holdings_values = values.sum(axis=0)
+    total_values = np.array([float(cash), float(cash_after)]) + holdings_values
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = np.nan_to_num(values / total_values)
+
+    priced = ~np.isnan(price)
+    risk = risk_service.calculate_historical_risk_for_positions(
+        db=db,
+        positions={
+            column: {symbol: values[i, column] for i, symbol in enumerate(symbols) if priced[i] and values[i, column] > 0}
+            for column in (0, 1)
+        },
+        confidence_level=request.confidence_level,
+        lookback_days=request.lookback_days
+    )
+
+    positions: List[WhatIfPosition] = [
+        WhatIfPosition(
+            symbol=symbol,
+            quantity_before=int(before[i]),
+            quantity_after=int(after[i]),
+            current_price=float(price[i]) if priced[i] else None,
+            value_before=float(values[i, 0]),
+            value_after=float(values[i, 1]),
+            weight_before=float(weights[i, 0]),
+            weight_after=float(weights[i, 1])
+        )
+        for i, symbol in enumerate(symbols)
+        if before[i] or after[i]
+    ]
+    positions.sort(key=lambda position: position.value_after, reverse=True)
+    logger.info(f"What-if for user {user.id}: {len(request.orders)} orders across {len(symbols)} symbols.")
+    return WhatIfResponse(
+        cash_before=float(cash),
+        cash_after=float(cash_after),
+        holdings_value_before=float(holdings_values[0]),
+        holdings_value_after=float(holdings_values[1]),
+        total_value_before=float(total_values[0]),
+        total_value_after=float(total_values[1]),
+        positions=positions,
+        confidence_level=request.confidence_level,
+        lookback_days=request.lookback_days,
+        risk_before=_risk(risk.get(0)),
+        risk_after=_risk(risk.get(1))
+    )
@@ -0,0 +1,61 @@
+"""
+Standalone job worker: python -m app.worker
+
+Runs the order matching engine, snapshot and analytics (VaR, stress test) jobs
+outside the API process.
+Work comes from the `jobs` table, enqueued by the API and its scheduler when
+JOB_EXECUTION_MODE=queue. Run as many workers as needed; each claim is
+exclusive and a crashed worker's job is retried after its visibility timeout.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import time
+
+from app.core.config import WORKER_POLL_INTERVAL_SECONDS
+from app.services import job_queue_service
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_stop_requested = False
+
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    logger.info(f"Worker received signal {signum}. Finishing current job and shutting down...")
+    _stop_requested = True
+
+
+def run_worker(worker_id: str, poll_interval: float, job_types=None, once: bool = False):
+    """Polls the queue until stopped. With once=True, drains runnable jobs and exits."""
+    logger.info(f"Worker {worker_id} started. Job types: {job_types or 'all'}.")
+    while not _stop_requested:
+        ran_job = job_queue_service.run_next_job(worker_id=worker_id, job_types=job_types)
+        if ran_job:
+            continue # Keep draining while there is work
+        if once:
+            break
+        time.sleep(poll_interval)
+    logger.info(f"Worker {worker_id} stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TradeCraft background job worker")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--poll-interval", type=float, default=WORKER_POLL_INTERVAL_SECONDS)
+    parser.add_argument("--job-types", default=None, help="Comma-separated job types to handle (default: all)")
+    parser.add_argument("--once", action="store_true", help="Run all currently runnable jobs, then exit")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    job_types = [t.strip() for t in args.job_types.split(",")] if args.job_types else None
+    run_worker(args.worker_id, args.poll_interval, job_types=job_types, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
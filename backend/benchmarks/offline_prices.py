@@ -0,0 +1,62 @@
+"""
+Deterministic offline price source for benchmarks.
+
+Replaces the Alpaca-backed functions in market_data_service so the trading,
+portfolio and risk paths can be exercised without network access or API keys.
+Prices are derived from a CRC of the symbol, so every run sees the same data.
+"""
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.services import market_data_service
+
+
+def _seed(symbol: str) -> int:
+    return zlib.crc32(symbol.upper().encode("utf-8"))
+
+
+def base_price(symbol: str) -> float:
+    """Stable per-symbol price between 10 and 500."""
+    return round(10.0 + (_seed(symbol) % 49000) / 100.0, 2)
+
+
+def get_current_price(symbol: str) -> Optional[float]:
+    return base_price(symbol)
+
+
+def get_current_prices(symbols: List[str]) -> Dict[str, Optional[float]]:
+    return {symbol.upper(): base_price(symbol) for symbol in symbols}
+
+
+def get_historical_data(symbol: str, lookback_days: int = 252) -> Optional[pd.DataFrame]:
+    """Geometric random walk of business-day closes ending today at the current price."""
+    n_bars = int(lookback_days * 1.2) + 10
+    rng = np.random.default_rng(_seed(symbol))
+    log_returns = rng.normal(0.0003, 0.015, n_bars)
+    closes = base_price(symbol) * np.exp(np.cumsum(log_returns) - log_returns.sum())
+    end = datetime.now(timezone.utc).replace(hour=4, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    index = pd.bdate_range(end=end, periods=n_bars, tz="UTC", name="timestamp")
+    return pd.DataFrame({
+        "open": closes,
+        "high": closes * 1.01,
+        "low": closes * 0.99,
+        "adjusted_close": closes,
+        "volume": 1_000_000,
+    }, index=index)
+
+
+_REPLACEMENTS = {
+    "get_current_price": get_current_price,
+    "get_current_prices": get_current_prices,
+    "get_historical_data": get_historical_data,
+}
+
+
+def install():
+    """Patches market_data_service in place. Services call it through the module, so this covers all callers."""
+    for name, replacement in _REPLACEMENTS.items():
+        setattr(market_data_service, name, replacement)
@@ -2,6 +2,12 @@
 # Exit immediately if a command exits with a non-zero status.
 set -e
 
+# `worker` runs the background job worker instead of the API (migrations are left to the API container)
+if [ "$1" = "worker" ]; then
+    echo "Starting background job worker..."
+    exec python -m app.worker
+fi
+
 # Run database migrations
 echo "Running database migrations..."
 alembic upgrade head
@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "tradecraft_test.db"))
+os.environ.setdefault("SECRET_KEY", "test")
+
+import importlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.crud import crud_idempotency_key
+from app.models.idempotency_key import IdempotencyKey
+from app.models.user import User
+
+for module in os.listdir(os.path.join(os.path.dirname(__file__), "..", "app", "models")):
+    if module.endswith(".py"):
+        importlib.import_module(f"app.models.{module[:-3]}")
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def test_expired_key_can_be_reused_before_purge(db):
+    user = User(username="alice", email="alice@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    db.add(IdempotencyKey(
+        user_id=user.id, key="order-1", request_hash="old",
+        expires_at=datetime.now(timezone.utc) - timedelta(minutes=1)
+    ))
+    db.commit()
+    assert crud_idempotency_key.get_idempotency_key(db=db, user_id=user.id, key="order-1") is None
+
+    crud_idempotency_key.create_idempotency_key(db=db, user_id=user.id, key="order-1", request_hash="new", ttl_hours=24)
+    db.commit()
+
+    stored = crud_idempotency_key.get_idempotency_key(db=db, user_id=user.id, key="order-1")
+    assert stored is not None and stored.request_hash == "new"
+    assert db.query(IdempotencyKey).filter(IdempotencyKey.user_id == user.id).count() == 1